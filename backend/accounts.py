@@ -0,0 +1,157 @@
+"""
+投稿先のSNSアカウントの一覧。
+ACCOUNTS_FILE（JSON）にSNSごとに複数のアカウントを記述すると、1つのプロセスで
+すべてのアカウントに投稿できる。指定しない場合は従来どおり環境変数
+（BLUESKY_USERNAMEなど）から、SNSごとに1つのアカウント（"default"）を読み込む。
+値を${環境変数名}と書くと環境変数の値に置き換える（認証情報をファイルに書かない場合）。
+
+ファイルの形式（accounts.example.jsonを参照）:
+    {
+      "mastodon": [
+        {"name": "brand-a", "instance_url": "https://...", "access_token": "${BRAND_A_TOKEN}"},
+        {"name": "brand-b", "instance_url": "https://...", "access_token": "..."}
+      ]
+    }
+"""
+
+import json
+import os
+import re
+
+from platforms import PLATFORMS
+
+DEFAULT_ACCOUNT = "default"
+
+# SNSごとのアカウント設定の項目と、ACCOUNTS_FILEがない場合に読む環境変数
+ACCOUNT_FIELDS = {name: platform.fields for name, platform in PLATFORMS.items()}
+
+# アカウント名に使える文字（"SNS名:アカウント名"で投稿先を指定するため":"は使えない）
+NAME_PATTERN = re.compile(r"[A-Za-z0-9_.@-]+")
+ENV_PATTERN = re.compile(r"\$\{(\w+)\}")
+
+
+def split_target(key):
+    """
+    投稿先のキー（"mastodon"または"mastodon:brand-a"）をSNS名とアカウント名に分ける。
+
+    Returns:
+        (SNS名, アカウント名またはNone)
+    """
+    platform, _, account = key.partition(":")
+    return platform, account or None
+
+
+def _expand(value):
+    if not isinstance(value, str):
+        return value
+    return ENV_PATTERN.sub(lambda m: os.getenv(m.group(1), ""), value)
+
+
+class AccountRegistry:
+    def __init__(self, accounts=None):
+        """
+        AccountRegistryの初期化。
+
+        Args:
+            accounts: SNS名をキー、{アカウント名: 設定のdict}を値とする辞書
+        """
+        self._accounts = {
+            platform: dict(entries) for platform, entries in (accounts or {}).items()
+        }
+
+    @classmethod
+    def from_env(cls):
+        """
+        環境変数から、設定が揃っているSNSごとに1つのアカウントを読み込む。
+        """
+        accounts = {}
+        for platform, fields in ACCOUNT_FIELDS.items():
+            config = {field: os.getenv(env) for field, env in fields.items()}
+            if all(config.values()):
+                accounts[platform] = {DEFAULT_ACCOUNT: config}
+        return cls(accounts)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        アカウント設定ファイル（JSON）を読み込む。
+
+        Args:
+            path: ファイルのパス
+        Raises:
+            ValueError: 設定が正しくない場合
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: SNS名をキーとするオブジェクトで記述してください")
+        accounts = {}
+        for platform, entries in data.items():
+            if platform not in ACCOUNT_FIELDS:
+                raise ValueError(f"{path}: 不明なSNSです: {platform}")
+            if isinstance(entries, dict):
+                entries = [entries]
+            if not isinstance(entries, list):
+                raise ValueError(f"{path}: {platform}はオブジェクトまたはその配列で記述してください")
+            accounts[platform] = {}
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    raise ValueError(f"{path}: {platform}のアカウントはオブジェクトで記述してください")
+                config = {key: _expand(value) for key, value in entry.items()}
+                name = str(config.pop("name", None) or DEFAULT_ACCOUNT)
+                if not NAME_PATTERN.fullmatch(name):
+                    raise ValueError(f"{path}: {platform}のアカウント名が正しくありません: {name}")
+                if name in accounts[platform]:
+                    raise ValueError(f"{path}: {platform}のアカウント名が重複しています: {name}")
+                missing = [field for field in ACCOUNT_FIELDS[platform] if not config.get(field)]
+                if missing:
+                    raise ValueError(
+                        f"{path}: {platform}({name})の設定が足りません: {', '.join(missing)}"
+                    )
+                accounts[platform][name] = config
+        return cls(accounts)
+
+    def platforms(self):
+        """
+        アカウントが設定されているSNS名のリストを返す。
+        """
+        return [platform for platform, entries in self._accounts.items() if entries]
+
+    def names(self, platform):
+        """
+        SNSのアカウント名のリストを返す（設定ファイルの記述順）。
+        """
+        return list(self._accounts.get(platform, {}))
+
+    def get(self, platform, name):
+        """
+        アカウントの設定を返す。
+
+        Returns:
+            設定のdict、存在しない場合はNone
+        """
+        return self._accounts.get(platform, {}).get(name)
+
+    def __iter__(self):
+        for platform, entries in self._accounts.items():
+            for name, config in entries.items():
+                yield platform, name, config
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._accounts.values())
+
+
+def load_accounts(path=None):
+    """
+    アカウントの一覧を読み込む。
+    ACCOUNTS_FILE（またはpath）が指定されていればファイルから、なければ環境変数から読み込む。
+
+    Args:
+        path: アカウント設定ファイルのパス（任意）
+    Returns:
+        AccountRegistry
+    """
+    path = path or os.getenv("ACCOUNTS_FILE")
+    if path:
+        return AccountRegistry.from_file(path)
+    return AccountRegistry.from_env()
@@ -1,13 +1,37 @@
 import logging
 
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (
+    Flask,
+    Request,
+    Response,
+    request,
+    jsonify,
+    send_from_directory,
+    stream_with_context,
+)
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+import functools
+import hmac
 import os
 import json
+import re
+import tempfile
+import time
+import uuid
 from sns_client import sns_client, get_character_limits
+from job_queue import JobQueue
+from upload_store import UploadStore
+from scheduler import Scheduler, parse_scheduled_at
+from bulk_post import BulkPoster, detect_format, iter_rows
+from http_pool import http_pool
+from rate_limiter import rate_limiter
+from platforms import PLATFORMS
+from profiler import profiler
+from constants import UPLOAD_LIMITS
+import metrics
 from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,15 +40,141 @@ logging.basicConfig(
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+
+class UploadRequest(Request):
+    """
+    アップロードの受信方法を設定したRequest。
+    リクエストサイズの上限（MAX_CONTENT_LENGTH）を超える本文は読み込まずに413を返し、
+    受信中の画像は一定サイズを超えたらディスクに書き出してメモリに溜めない。
+    """
+
+    @property
+    def max_content_length(self):
+        # /api/bulkは本文を1行ずつ読むため、全体のサイズは制限しない
+        if self.endpoint == "bulk_post":
+            return None
+        return super().max_content_length
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return tempfile.SpooledTemporaryFile(
+            max_size=UPLOAD_LIMITS["spool_threshold"], mode="rb+"
+        )
+
+
 app = Flask(__name__, static_folder="../frontend", static_url_path="")
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = (
+    int(os.getenv("MAX_CONTENT_LENGTH", "0")) or UPLOAD_LIMITS["max_request_bytes"]
+)
 CORS(app)  # CORS設定を有効に
 
 # Flaskの秘密鍵を設定
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "default_secret_key")
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "uploads")
+UPLOAD_FOLDER = os.getenv(
+    "UPLOAD_FOLDER", os.path.join(os.path.dirname(__file__), "uploads")
+)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+upload_store = UploadStore(
+    UPLOAD_FOLDER,
+    max_bytes=int(os.getenv("UPLOAD_STORE_MAX_BYTES", "0")) or None,
+)
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), "data")
+job_queue = JobQueue(
+    sns_client,
+    os.getenv("JOB_DB_PATH", os.path.join(DATA_FOLDER, "jobs.sqlite3")),
+    max_workers=int(os.getenv("JOB_MAX_WORKERS", "0")) or None,
+)
+scheduler = Scheduler(
+    sns_client,
+    upload_store,
+    os.getenv("SCHEDULE_DB_PATH", os.path.join(DATA_FOLDER, "schedules.sqlite3")),
+    max_workers=int(os.getenv("SCHEDULER_MAX_WORKERS", "0")) or None,
+)
+scheduler.start()
+bulk_poster = BulkPoster(
+    sns_client,
+    upload_store,
+    max_concurrency=int(os.getenv("BULK_MAX_CONCURRENCY", "0")) or None,
+)
+
+# /api/platformsのうち起動後に変わらない部分（文字数制限）は1度だけ組み立てておく
+PLATFORM_INFO = {name: {"limit": platform.limit} for name, platform in PLATFORMS.items()}
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """
+    リクエストサイズの上限を超えた場合にJSONでエラーを返す。
+    """
+    limit = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+    return jsonify(
+        {"success": False, "error": f"リクエストのサイズが上限({limit}MB)を超えています"}
+    ), 413
+
+
+# X-Request-IDとして受け付ける値（プロファイルのIDに使う）
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def is_admin():
+    """
+    リクエストが管理用のトークン（Authorization: Bearer <ADMIN_TOKEN>）を持つか判定する。
+    ADMIN_TOKENが設定されていない場合は常にFalse。
+    """
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return False
+    return hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()
+    )
+
+
+def admin_required(view):
+    """
+    管理用のトークンがないリクエストを403で拒否するデコレータ。
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({"success": False, "error": "管理用のトークンが必要です"}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def profiled(view):
+    """
+    X-Profile: 1ヘッダー（管理用のトークンが必要）、またはPROFILE_SAMPLE_RATEの割合で
+    リクエストのプロファイルを取るデコレータ。
+    プロファイルはレスポンスを返し終える（ストリーミングの場合は最後の行を送る）まで記録し、
+    X-Request-ID（省略時は自動生成）をIDとしてX-Profile-IDヘッダーで返す。
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        requested = request.headers.get("X-Profile") == "1" and is_admin()
+        if not (requested or profiler.sampled()):
+            return view(*args, **kwargs)
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        profile = profiler.start(request_id, request.path)
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            profiler.stop(profile)
+            raise
+        response.headers["X-Profile-ID"] = profile.id
+        response.call_on_close(lambda: profiler.stop(profile))
+        return response
+
+    return wrapper
 
 
 @app.route("/")
@@ -40,93 +190,408 @@ def index():
 def get_platforms():
     """
     利用可能なプラットフォームの一覧と文字数制限を返す。
-    各SNSの有効/無効状態と文字数制限をJSONで返却。
-    """
-    platforms = {
-        "bluesky": {
-            "enabled": "bluesky" in sns_client.clients,
-            "limit": get_character_limits()["bluesky"],
-        },
-        "x": {
-            "enabled": "x" in sns_client.clients,
-            "limit": get_character_limits()["x"],
-        },
-        "threads": {
-            "enabled": "threads" in sns_client.clients,
-            "limit": get_character_limits()["threads"],
-        },
-        "misskey": {
-            "enabled": "misskey" in sns_client.clients,
-            "limit": get_character_limits()["misskey"],
-        },
-        "mastodon": {
-            "enabled": "mastodon" in sns_client.clients,
-            "limit": get_character_limits()["mastodon"],
-        },
-    }
+    各SNSの有効/無効状態、クライアントの初期化状態（pending/ready/failed、
+    未設定の場合はnull）、アカウントごとの状態とサーキットブレーカーの状態
+    （closed/open/half_open、ブレーカーはインスタンスまたはアカウントごと）と
+    文字数制限をJSONで返却。
+    """
+    platforms = {}
+    for platform, info in PLATFORM_INFO.items():
+        state = sns_client.get_state(platform)
+        platforms[platform] = {
+            "enabled": state == "ready",
+            "state": state,
+            "accounts": sns_client.account_states(platform),
+            **info,
+        }
     return jsonify(platforms)
 
 
 @app.route("/api/post", methods=["POST"])
+@profiled
 def post_to_sns():
     """
     選択されたSNSに投稿する（画像対応・複数画像）。
     multipart/form-dataまたはapplication/jsonで受信し、SNSごとに投稿処理を実行。
+    画像は1回のリクエストで1度だけ受け取り、選択された全SNSで共有する。
+    SNSに複数のアカウントがある場合は、すべてのアカウント（accountsで指定した場合は
+    そのアカウント）に投稿し、結果はSNSごとにまとめて返す。
+    Acceptヘッダーにapplication/x-ndjsonが含まれる場合は、
+    完了したSNSから順に結果を1行ずつストリーミングで返す。
+    クエリ文字列にmode=jobを指定した場合はジョブとして登録し、
+    ジョブIDを即座に返す（進捗は/api/jobs/<job_id>で取得）。
+    Returns:
+        投稿結果のJSON（またはNDJSONストリーム）
+    """
+    data, image_files, selected, error = parse_post_request()
+    if error:
+        return error
+
+    # 画像は内容のハッシュで保存し、投稿が終わるまで参照を保持する。
+    # 読み込んだ内容はMediaとして全SNSで共有し、ファイルを読み直さない
+    media, error = save_images(image_files)
+    if error:
+        return error
+    posts = {
+        platform: {
+            "content": data[platform]["content"],
+            "media": media if media else None,
+            "accounts": data[platform].get("accounts"),
+        }
+        for platform in selected
+    }
+
+    if request.args.get("mode") == "job":
+        job_id = job_queue.submit(
+            posts, on_complete=lambda: upload_store.release(media)
+        )
+        return jsonify(
+            {
+                "success": True,
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}",
+            }
+        ), 202
+
+    if "application/x-ndjson" in request.headers.get("Accept", ""):
+        return stream_post_results(posts, media)
+
+    # 各プラットフォームに投稿
+    try:
+        results = sns_client.post_to_platforms(posts)
+    finally:
+        upload_store.release(media)
+
+    # 全体の成功・失敗を判定
+    all_success = all(result.get("success", False) for result in results.values())
+
+    # 1SNSのみの場合はトップレベルに展開
+    if len(results) == 1:
+        platform, result = next(iter(results.items()))
+        response = {"platform": platform, **result}
+        return jsonify(response)
+
+    return jsonify({"success": all_success, "results": results})
+
+
+def parse_post_request():
+    """
+    投稿リクエスト（multipart/form-dataまたはapplication/json）を解釈する。
     Returns:
-        投稿結果のJSON
+        (投稿データ, 画像ファイルのリスト, 選択されたSNSのリスト, エラー時のレスポンス)
     """
     if request.content_type and request.content_type.startswith("multipart/form-data"):
         # multipartの場合
         post_data_json = request.form.get("postData")
         if not post_data_json:
-            return jsonify({"success": False, "error": "postDataがありません"}), 400
+            error = jsonify({"success": False, "error": "postDataがありません"}), 400
+            return None, None, None, error
         data = json.loads(post_data_json)
         # 複数画像対応
         image_files = []
-        image_paths = []
         for key in sorted(request.files):
             if key.startswith("image"):
                 file = request.files.get(key)
                 if file and file.filename:
-                    filename = secure_filename(file.filename)
-                    image_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                    file.save(image_path)
                     image_files.append(file)
-                    image_paths.append(image_path)
     else:
         # application/jsonの場合
         data = request.json
-        image_paths = []
+        image_files = []
 
     if not data:
-        return jsonify({"success": False, "error": "データが送信されていません"}), 400
-
-    posts = {}
-    for platform in ["bluesky", "x", "threads", "misskey", "mastodon"]:
-        if platform in data and data[platform]["selected"]:
-            posts[platform] = {
-                "content": data[platform]["content"],
-                "image_paths": image_paths if image_paths else None,
-            }
+        error = jsonify({"success": False, "error": "データが送信されていません"}), 400
+        return None, None, None, error
+
+    selected = [
+        platform
+        for platform in PLATFORMS
+        if platform in data and data[platform]["selected"]
+    ]
+    if not selected:
+        error = jsonify({"success": False, "error": "投稿先のSNSが選択されていません"}), 400
+        return None, None, None, error
+    return data, image_files, selected, None
+
+
+def save_images(image_files):
+    """
+    アップロードされた画像を保存する（参照はupload_store.releaseで解放すること）。
+    枚数が上限を超える場合や、画素数が上限を超える画像（ヘッダーだけを読んで判定し、
+    展開はしない）がある場合は1枚も保存せずにエラーを返す。
+    Returns:
+        (Mediaのリスト, None) or (None, エラー時のレスポンス)
+    """
+    max_images = UPLOAD_LIMITS["max_images"]
+    if len(image_files) > max_images:
+        return None, (
+            jsonify({"success": False, "error": f"画像は{max_images}枚までです"}),
+            413,
+        )
+    if not image_files:
+        return [], None
+
+    # Pillowは画像を受け取った場合だけ読み込む
+    from image_compressor import check_image
 
-    if not posts:
+    for file in image_files:
+        message = check_image(file.stream)
+        if message:
+            error = {"success": False, "error": f"{message}: {file.filename}"}
+            return None, (jsonify(error), 413)
+
+    media = []
+    try:
+        for file in image_files:
+            media.append(upload_store.save(file))
+    except Exception:
+        upload_store.release(media)
+        raise
+    return media, None
+
+
+def stream_post_results(posts, media):
+    """
+    投稿結果を完了順にNDJSONで返すレスポンスを生成する。
+    各行は{"platform": ..., "success": ..., ...}、最終行は{"done": true, "success": ...}。
+    Args:
+        posts: プラットフォーム名をキーとする投稿内容の辞書
+        media: 投稿後に参照を解放する画像（Media）のリスト
+    Returns:
+        NDJSONのストリーミングレスポンス
+    """
+
+    def generate():
+        all_success = True
+        try:
+            for platform, result in sns_client.iter_post_to_platforms(posts):
+                all_success = all_success and result.get("success", False)
+                yield json.dumps({"platform": platform, **result}, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "success": all_success}) + "\n"
+        finally:
+            upload_store.release(media)
+
+    response = Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+    # リバースプロキシでのバッファリングを無効化し、結果を即座に届ける
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/media", methods=["POST"])
+def upload_media():
+    """
+    一括投稿で使う画像を事前にアップロードする（multipart/form-data、image*のファイル）。
+    返されたdigestを/api/bulkの行のmediaに指定する。
+    どの投稿からも参照されていない画像は、保存容量の上限を超えるか
+    一定時間（UPLOAD_STORE_SETTINGSのorphan_ttl）が経つと削除される。
+    Returns:
+        保存した画像のdigest・ファイル名・サイズのJSON
+    """
+    image_files = [
+        request.files[key]
+        for key in sorted(request.files)
+        if key.startswith("image") and request.files[key].filename
+    ]
+    if not image_files:
+        return jsonify({"success": False, "error": "画像が送信されていません"}), 400
+    media, error = save_images(image_files)
+    if error:
+        return error
+    upload_store.release(media)
+    return jsonify(
+        {
+            "success": True,
+            "media": [
+                {"digest": item.digest, "filename": file.filename, "size": item.size}
+                for item, file in zip(media, image_files)
+            ],
+        }
+    )
+
+
+@app.route("/api/bulk", methods=["POST"])
+def bulk_post():
+    """
+    JSONLまたはCSV（Content-Type: text/csv、またはクエリ文字列のformat=csv）の
+    本文を1行ずつ読み込み、行ごとに投稿する。行の形式はbulk_post.pyを参照。
+    同時に投稿する行数はクエリ文字列のconcurrencyで指定できる（上限あり）。
+    Returns:
+        行ごとの投稿結果のNDJSONストリーム（最終行は{"done": true, ...}）
+    """
+    format = request.args.get("format") or detect_format(request.content_type)
+    rows = iter_rows(request.stream, format)
+    results = bulk_poster.run(rows, concurrency=request.args.get("concurrency", type=int))
+
+    def generate():
+        for line in results:
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    response = Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    投稿ジョブの状態を返す。
+    プラットフォームごとの進捗と、完了していれば最終的な投稿結果を返却。
+    Returns:
+        ジョブ情報のJSON
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "ジョブが見つかりません"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/schedules", methods=["POST"])
+def create_schedule():
+    """
+    投稿を予約する。/api/postと同じ形式の投稿データに、予約時刻（scheduled_at）を指定する。
+    予約時刻はUNIX時刻またはISO 8601の文字列（例: 2024-01-01T09:00:00+09:00）。
+    画像は予約時にアップロードし、投稿が終わるまで保存しておく。
+    Returns:
+        予約情報のJSON
+    """
+    data, image_files, selected, error = parse_post_request()
+    if error:
+        return error
+    scheduled_at = parse_scheduled_at(data.get("scheduled_at"))
+    if scheduled_at is None:
         return jsonify(
-            {"success": False, "error": "投稿先のSNSが選択されていません"}
+            {"success": False, "error": "予約時刻（scheduled_at）が正しくありません"}
         ), 400
+    if scheduled_at <= time.time():
+        return jsonify({"success": False, "error": "予約時刻が過去です"}), 400
 
-    # 各プラットフォームに投稿
-    results = sns_client.post_to_platforms(posts)
+    media, error = save_images(image_files)
+    if error:
+        return error
+    try:
+        schedule = scheduler.schedule(
+            {
+                platform: (
+                    {"content": data[platform]["content"], "accounts": data[platform]["accounts"]}
+                    if data[platform].get("accounts")
+                    else data[platform]["content"]
+                )
+                for platform in selected
+            },
+            media,
+            scheduled_at,
+        )
+    finally:
+        # 予約中の画像の参照はschedulerが保持する
+        upload_store.release(media)
+    return jsonify({"success": True, **schedule}), 201
 
-    # 全体の成功・失敗を判定
-    all_success = all(result.get("success", False) for result in results.values())
 
-    # 1SNSのみの場合はトップレベルに展開
-    if len(results) == 1:
-        platform, result = next(iter(results.items()))
-        response = {"platform": platform, **result}
-        return jsonify(response)
+@app.route("/api/schedules", methods=["GET"])
+def list_schedules():
+    """
+    予約を予約時刻順に返す。クエリ文字列のstatusで状態を絞り込める（例: scheduled）。
+    Returns:
+        予約情報のリストのJSON
+    """
+    status = request.args.get("status")
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify({"schedules": scheduler.list(status=status, limit=limit)})
 
-    return jsonify({"success": all_success, "results": results})
+
+@app.route("/api/schedules/<schedule_id>", methods=["GET"])
+def get_schedule(schedule_id):
+    """
+    予約の状態を返す。実行済みであれば投稿結果を含む。
+    Returns:
+        予約情報のJSON
+    """
+    schedule = scheduler.get(schedule_id)
+    if schedule is None:
+        return jsonify({"success": False, "error": "予約が見つかりません"}), 404
+    return jsonify(schedule)
+
+
+@app.route("/api/schedules/<schedule_id>", methods=["DELETE"])
+def cancel_schedule(schedule_id):
+    """
+    予約を取り消す。実行前の予約のみ取り消せる。
+    Returns:
+        取り消し結果のJSON
+    """
+    if scheduler.get(schedule_id) is None:
+        return jsonify({"success": False, "error": "予約が見つかりません"}), 404
+    if not scheduler.cancel(schedule_id):
+        return jsonify(
+            {"success": False, "error": "実行済みまたは実行中の予約は取り消せません"}
+        ), 409
+    return jsonify({"success": True, **scheduler.get(schedule_id)})
+
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    """
+    HTTP接続プールの再利用状況、アップロード画像の保存状況、
+    レート制限の状態、待機中の予約数を返す。
+    Returns:
+        統計情報のJSON
+    """
+    return jsonify(
+        {
+            "http_pool": http_pool.stats(),
+            "upload_store": upload_store.stats(),
+            "rate_limits": rate_limiter.snapshot(),
+            "schedules": scheduler.stats(),
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    投稿処理の計測値をPrometheusのテキスト形式で返す。
+    SNSごと・処理段階ごとの所要時間、成功・失敗件数、処理中の件数を含む。
+    Returns:
+        Prometheus形式のテキスト
+    """
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/api/admin/profiles", methods=["GET"])
+@admin_required
+def list_profiles():
+    """
+    保持しているプロファイル（/api/postのX-Profileヘッダーまたはサンプリングで記録）を
+    新しい順に返す。管理用のトークン（ADMIN_TOKEN）が必要。
+    Returns:
+        プロファイルの概要（ID・パス・開始時刻・所要時間・採取回数）のリストのJSON
+    """
+    return jsonify({"profiles": profiler.list()})
+
+
+@app.route("/api/admin/profiles/<profile_id>", methods=["GET"])
+@admin_required
+def download_profile(profile_id):
+    """
+    プロファイルを折りたたみ形式（flamegraph.pl・speedscopeで読み込める）でダウンロードする。
+    管理用のトークン（ADMIN_TOKEN）が必要。
+    Returns:
+        1行に"スタック 回数"を並べたテキスト
+    """
+    collapsed = profiler.collapsed(profile_id)
+    if collapsed is None:
+        return jsonify({"success": False, "error": "プロファイルが見つかりません"}), 404
+    return Response(
+        collapsed,
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={profile_id}.folded"},
+    )
 
 
 @app.route("/api/character_limits", methods=["GET"])
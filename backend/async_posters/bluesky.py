@@ -0,0 +1,242 @@
+"""
+Blueskyへの投稿処理を担当するクラス（非同期版）。
+atprotoの非同期クライアント（httpx）で画像アップロード・投稿を行う。
+画像の圧縮はCPU処理のためスレッドで実行する。
+
+Attributes:
+    client: Bluesky APIの非同期クライアントインスタンス
+"""
+
+import asyncio
+import logging
+
+from atproto import AsyncClient as AtprotoAsyncClient
+from atproto_client.request import AsyncRequest as AtprotoAsyncRequest
+
+from constants import IMAGE_LIMITS
+from http_pool import api_base_url
+from rate_limiter import rate_limiter
+from sns_posters.bluesky import bluesky_sessions
+from async_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import is_transient, with_retry_async
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ERRORS = ("InvalidToken", "ExpiredToken")
+
+
+def _is_invalid_token_error(e):
+    """
+    アクセストークンの無効・期限切れによるエラーかどうかを判定する。
+    """
+    if e.args:
+        if isinstance(e.args[0], str) and any(t in e.args[0] for t in TOKEN_ERRORS):
+            return True
+        if getattr(getattr(e.args[0], "content", None), "error", None) in TOKEN_ERRORS:
+            return True
+    return getattr(e, "error", None) in TOKEN_ERRORS
+
+
+class AsyncBlueskyPoster:
+    def __init__(self, client, username=None, password=None, media_cache=None):
+        """
+        AsyncBlueskyPosterの初期化。
+
+        Args:
+            client: Bluesky APIの非同期クライアント（atproto.AsyncClient）
+            username: Blueskyユーザー名（リフレッシュ用）
+            password: Blueskyパスワード（リフレッシュ用）
+            media_cache: アップロード済みblobのキャッシュ（任意）
+        """
+        self.client = client
+        self.username = username
+        self.password = password
+        self.media_cache = media_cache
+
+    async def upload_images(self, compress_image_for_platform, media, variants=None):
+        """
+        画像を圧縮してBlueskyに並列でアップロードする。
+        同じ画像のblobがキャッシュにあれば、圧縮とアップロードを省略する。
+        加工済み画像のFutureが渡された場合は、各画像の加工が終わり次第アップロードする。
+
+        Args:
+            compress_image_for_platform: 圧縮関数（同期関数、加工済み画像がない場合に使う）
+            media: 画像（Media）のリスト
+            variants: 画像ごとの加工結果のFuture（concurrent.futures）のリスト（任意）
+        Returns:
+            (アップロード済み画像リスト, エラー文字列)
+        """
+
+        async def upload_one(pair):
+            item, variant = pair
+            blob = self.media_cache and self.media_cache.get("bluesky", item.digest)
+            if blob:
+                if variant:
+                    variant.cancel()
+                return blob, None, False
+            if variant:
+                buf, err = await asyncio.wrap_future(variant)
+            else:
+                buf, err = await asyncio.to_thread(
+                    compress_image_for_platform,
+                    item,
+                    platform="bluesky",
+                    max_size=IMAGE_LIMITS["bluesky"]["max_size"],
+                    min_size=IMAGE_LIMITS["bluesky"]["min_size"],
+                    max_attempts=IMAGE_LIMITS["bluesky"]["max_attempts"],
+                )
+            if buf is None:
+                return None, err, False
+            # blobは内容で識別されるため、再送しても重複しない
+            blob = (
+                await with_retry_async("bluesky", lambda: self.client.upload_blob(buf))
+            ).blob
+            if self.media_cache:
+                self.media_cache.put("bluesky", item.digest, blob)
+            return blob, None, True
+
+        blobs, err = await upload_in_parallel(
+            upload_one,
+            list(zip(media, variants or [None] * len(media))),
+            IMAGE_LIMITS["bluesky"]["upload_concurrency"],
+        )
+        if err:
+            return None, err
+        return [{"alt": "image", "image": blob} for blob in blobs], None
+
+    async def refresh_session(self):
+        """
+        セッションを更新する（同期版と同じく、他のプロセスとファイルロックで排他し、
+        保存済みの新しいセッションがあればそれを使う）。
+        まずリフレッシュトークンで更新し、失敗した場合のみパスワードで再ログインする。
+
+        Returns:
+            エラー文字列（成功時はNone）
+        """
+        async with bluesky_sessions.lock_async():
+            stored = bluesky_sessions.load(self.username)
+            if stored and stored != self.client.export_session_string():
+                try:
+                    await self.client.login(session_string=stored)
+                    return None
+                except Exception as e:
+                    logger.warning(f"保存済みのBlueskyセッションを利用できません: {e}")
+            try:
+                await self.client._refresh_and_set_session()
+                return None
+            except Exception as e:
+                logger.warning(f"Blueskyリフレッシュトークンでの更新に失敗: {str(e)}")
+            if self.username and self.password:
+                await self.client.login(self.username, self.password)
+                return None
+        return "Bluesky認証情報が不足しています（ユーザー名・パスワード）"
+
+    async def post(self, content, media, compress_image_for_platform, variants=None):
+        """
+        Blueskyへ投稿を行う。
+
+        Args:
+            content: 投稿本文
+            media: 画像（Media）のリスト
+            compress_image_for_platform: 画像圧縮関数
+            variants: 画像ごとの加工結果のFutureのリスト（任意）
+        Returns:
+            dict: 投稿結果（success, response/error）
+        """
+        # アップロード済みのblobはトークン更新後の再試行でも使い回す
+        uploaded = {}
+
+        async def try_post():
+            if media and "images" not in uploaded:
+                with time_phase("bluesky", "upload"):
+                    images, err = await self.upload_images(
+                        compress_image_for_platform, media, variants
+                    )
+                if err:
+                    return {"success": False, "error": err}
+                uploaded["images"] = images
+            images = uploaded.get("images")
+            with time_phase("bluesky", "publish"):
+                embed = None
+                if images:
+                    embed = {"$type": "app.bsky.embed.images", "images": images}
+                # 投稿の作成は冪等ではないため、接続できなかった場合だけ再試行する
+                await with_retry_async(
+                    "bluesky",
+                    lambda: self.client.send_post(content, embed=embed, langs=["ja"]),
+                    idempotent=False,
+                )
+            if images and self.media_cache:
+                self.media_cache.mark_posted(
+                    "bluesky", [item.digest for item in media]
+                )
+            return {"success": True, "response": "投稿成功"}
+
+        try:
+            return await try_post()
+        except Exception as e:
+            logger.error(f"Bluesky投稿エラー: {str(e)}", exc_info=True)
+            if not _is_invalid_token_error(e):
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "transient": is_transient(e),
+                }
+            try:
+                err = await self.refresh_session()
+                if err:
+                    return {"success": False, "error": err}
+                return await try_post()
+            except Exception as e2:
+                logger.error(f"Blueskyリフレッシュ失敗: {str(e2)}", exc_info=True)
+                return {
+                    "success": False,
+                    "error": f"リフレッシュ失敗: {str(e2)}",
+                    "error_type": type(e2).__name__,
+                }
+
+
+def create_poster(account, config, media_cache, engine):
+    """
+    アカウントの設定からBlueskyにログインし、Posterを生成する（同期版とセッションの保存先を共有する）。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（username, password）
+        media_cache: アップロード済みblobのキャッシュ
+        engine: AsyncSnsClient（ログインをイベントループで実行するために使う）
+    Returns:
+        AsyncBlueskyPoster
+    """
+    username = config["username"]
+    password = config["password"]
+    client = AtprotoAsyncClient(
+        base_url=api_base_url("bluesky"),
+        request=AtprotoAsyncRequest(
+            event_hooks={
+                "response": [
+                    rate_limiter.async_response_hook(
+                        "bluesky", account, paths=["com.atproto.repo.createRecord"]
+                    )
+                ]
+            }
+        ),
+    )
+    client.on_session_change(
+        lambda event, session: bluesky_sessions.save(username, session.encode())
+    )
+    session_string = bluesky_sessions.load(username)
+    logged_in = False
+    if session_string:
+        try:
+            engine.run(client.login(session_string=session_string))
+            logged_in = True
+        except Exception as e:
+            logger.warning(f"保存済みのBlueskyセッションを利用できません: {e}")
+    if not logged_in:
+        engine.run(client.login(username, password))
+    return AsyncBlueskyPoster(
+        client, username=username, password=password, media_cache=media_cache
+    )
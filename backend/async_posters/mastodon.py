@@ -0,0 +1,171 @@
+"""
+Mastodonへの投稿処理を担当するクラス（非同期版）。
+REST API（/api/v2/media、/api/v1/statuses）をhttpxで直接呼び出す。
+
+Attributes:
+    client: インスタンスへのhttpx.AsyncClient
+"""
+
+import logging
+import uuid
+
+from constants import IMAGE_LIMITS
+from async_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import check_transient, is_transient, is_unsent, with_retry_async
+
+logger = logging.getLogger(__name__)
+
+
+def _error_message(response):
+    """
+    MastodonのエラーレスポンスからHTTPステータス付きのメッセージを取り出す。
+    """
+    try:
+        error = response.json().get("error")
+    except ValueError:
+        error = None
+    return f"HTTP {response.status_code}: {error or response.text[:200]}"
+
+
+class AsyncMastodonPoster:
+    def __init__(self, client, instance_url, access_token, media_cache=None):
+        """
+        AsyncMastodonPosterの初期化。
+
+        Args:
+            client: インスタンスへのhttpx.AsyncClient
+            instance_url: インスタンスのURL
+            access_token: アクセストークン
+            media_cache: アップロード済みmedia_idのキャッシュ（任意）
+        """
+        self.client = client
+        self.base_url = instance_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.media_cache = media_cache
+
+    async def upload_images(self, media, held):
+        """
+        画像をMastodonに並列でアップロードする。
+        まだ投稿に添付されていない同じ画像のmedia_idがキャッシュにあれば再利用する。
+        使うmedia_idはキャッシュから取り出してheldに記録する（同期版と同じ）。
+
+        Args:
+            media: 画像（Media）のリスト
+            held: 使うmedia_idを記録するリスト（(digest, media_id, 有効期限)を追加する）
+        Returns:
+            (media_idリスト, エラー文字列)
+        """
+
+        async def upload_one(item):
+            entry = self.media_cache and self.media_cache.take("mastodon", item.digest)
+            if entry:
+                held.append((item.digest, *entry))
+                return entry[0], None, False
+
+            async def send():
+                return check_transient(
+                    await self.client.post(
+                        f"{self.base_url}/api/v2/media",
+                        files={"file": (item.filename, item.open(), item.mime_type)},
+                        headers=self.headers,
+                    )
+                )
+
+            response = await with_retry_async("mastodon", send)
+            if not response.is_success:
+                return None, f"Mastodonメディアアップロードエラー: {_error_message(response)}", False
+            media_id = response.json()["id"]
+            held.append((item.digest, media_id, None))
+            return media_id, None, True
+
+        return await upload_in_parallel(
+            upload_one, media, IMAGE_LIMITS["mastodon"]["upload_concurrency"]
+        )
+
+    def restore_media(self, held):
+        """
+        投稿に添付されなかったmedia_idをキャッシュに戻し、次回の投稿で再利用できるようにする。
+        """
+        if self.media_cache:
+            for digest, media_id, expires_at in held:
+                self.media_cache.put("mastodon", digest, media_id, expires_at)
+
+    async def post(self, content, media=None):
+        """
+        Mastodonへ投稿を行う。
+        投稿ごとにIdempotency-Keyを付けるため、一時的な障害で再送しても二重投稿にならない。
+
+        Args:
+            content: 投稿本文
+            media: 画像（Media）のリスト
+        Returns:
+            dict: 投稿結果（success, response/error）
+        """
+        held = []
+        publishing = False
+        try:
+            media_ids = []
+            if media:
+                max_images = IMAGE_LIMITS["mastodon"]["max_images"]
+                if len(media) > max_images:
+                    return {"success": False, "error": f"画像は{max_images}枚までです"}
+                with time_phase("mastodon", "upload"):
+                    media_ids, err = await self.upload_images(media, held)
+                if err:
+                    self.restore_media(held)
+                    return {"success": False, "error": err}
+            body = {"status": content}
+            if media_ids:
+                body["media_ids"] = media_ids
+            headers = {**self.headers, "Idempotency-Key": uuid.uuid4().hex}
+
+            async def send():
+                return check_transient(
+                    await self.client.post(
+                        f"{self.base_url}/api/v1/statuses", json=body, headers=headers
+                    )
+                )
+
+            publishing = True
+            with time_phase("mastodon", "publish"):
+                response = await with_retry_async("mastodon", send)
+            if not response.is_success:
+                self.restore_media(held)
+                return {
+                    "success": False,
+                    "error": f"Mastodon投稿APIエラー: {_error_message(response)}",
+                }
+            return {"success": True, "response": "投稿成功"}
+        except Exception as e:
+            logger.error(f"Mastodon投稿エラー: {str(e)}", exc_info=True)
+            # 投稿が作成された（メディアが添付された）可能性がある場合はキャッシュに戻さない
+            if not publishing or is_unsent(e) or not is_transient(e):
+                self.restore_media(held)
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache, engine):
+    """
+    アカウントの設定からMastodonのPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（access_token, instance_url）
+        media_cache: アップロード済みmedia_idのキャッシュ
+        engine: AsyncSnsClient（HTTPクライアントの取得に使う）
+    Returns:
+        AsyncMastodonPoster
+    """
+    instance_url = config["instance_url"]
+    client = engine.http_client(
+        instance_url, "mastodon", account, paths=["/api/v1/statuses"]
+    )
+    return AsyncMastodonPoster(
+        client, instance_url, config["access_token"], media_cache=media_cache
+    )
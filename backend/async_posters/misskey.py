@@ -0,0 +1,181 @@
+"""
+Misskeyへの投稿処理を担当するクラス（非同期版）。
+Misskey API（/api/drive/files/*、/api/notes/create）をhttpxで直接呼び出す。
+
+Attributes:
+    client: インスタンスへのhttpx.AsyncClient
+"""
+
+import logging
+
+from constants import IMAGE_LIMITS
+from async_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import check_transient, is_transient, with_retry_async
+
+logger = logging.getLogger(__name__)
+
+
+def _error_message(response):
+    """
+    MisskeyのエラーレスポンスからHTTPステータス付きのメッセージを取り出す。
+    """
+    try:
+        error = response.json().get("error", {}).get("message")
+    except (ValueError, AttributeError):
+        error = None
+    return f"HTTP {response.status_code}: {error or response.text[:200]}"
+
+
+class AsyncMisskeyPoster:
+    def __init__(self, client, instance_url, api_token, media_cache=None):
+        """
+        AsyncMisskeyPosterの初期化。
+
+        Args:
+            client: インスタンスへのhttpx.AsyncClient
+            instance_url: インスタンスのURL
+            api_token: APIトークン
+            media_cache: アップロード済みfile_idのキャッシュ（任意）
+        """
+        self.client = client
+        self.base_url = instance_url.rstrip("/")
+        self.api_token = api_token
+        self.media_cache = media_cache
+
+    async def _call(self, endpoint, idempotent=True, **params):
+        """
+        JSONボディでAPIを呼び出し、(レスポンスのJSON, エラー文字列)を返す。
+        一時的な障害は再試行する（idempotent=Falseの場合は接続できなかった場合だけ）。
+        """
+
+        async def send():
+            response = await self.client.post(
+                f"{self.base_url}/api/{endpoint}", json={"i": self.api_token, **params}
+            )
+            return check_transient(response) if idempotent else response
+
+        response = await with_retry_async("misskey", send, idempotent=idempotent)
+        if not response.is_success:
+            return None, f"Misskey APIエラー({endpoint}): {_error_message(response)}"
+        return (response.json() if response.content else None), None
+
+    async def find_drive_file(self, media):
+        """
+        同じ内容のファイルがドライブにあればそのfile_idを返す。
+        Args:
+            media: 画像（Media）
+        Returns:
+            file_id or None
+        """
+        files, err = await self._call("drive/files/find-by-hash", md5=media.md5)
+        return files[0]["id"] if not err and files else None
+
+    async def upload_images(self, media):
+        """
+        画像ファイルをMisskeyに並列でアップロードし、file_idリストを返す。
+        キャッシュまたはドライブに同じ画像があればアップロードを省略する。
+        どれかが失敗した場合は、今回新たに作成したドライブのファイルを削除する。
+
+        Args:
+            media: 画像（Media）のリスト
+        Returns:
+            (file_ids, None) or (None, error_message)
+        """
+        digests = {}
+
+        async def upload_one(item):
+            file_id = self.media_cache and self.media_cache.get("misskey", item.digest)
+            if not file_id:
+                file_id = await self.find_drive_file(item)
+            created = False
+            if not file_id:
+                async def send():
+                    return check_transient(
+                        await self.client.post(
+                            f"{self.base_url}/api/drive/files/create",
+                            data={"i": self.api_token},
+                            files={"file": (item.filename, item.open(), item.mime_type)},
+                        )
+                    )
+
+                response = await with_retry_async("misskey", send)
+                if not response.is_success:
+                    return None, f"Misskeyファイルアップロードエラー: {_error_message(response)}", False
+                file_id = response.json()["id"]
+                created = True
+            if self.media_cache:
+                self.media_cache.put("misskey", item.digest, file_id)
+                digests[file_id] = item.digest
+            return file_id, None, created
+
+        async def cleanup(file_id):
+            await self._call("drive/files/delete", fileId=file_id)
+            if file_id in digests:
+                self.media_cache.invalidate("misskey", digests[file_id])
+
+        return await upload_in_parallel(
+            upload_one,
+            media,
+            IMAGE_LIMITS["misskey"]["upload_concurrency"],
+            cleanup=cleanup,
+        )
+
+    async def post(self, content, media=None):
+        """
+        Misskeyにノートを投稿する。
+
+        Args:
+            content: 投稿テキスト
+            media: 画像（Media）のリスト（省略可）
+        Returns:
+            投稿結果のdict
+        """
+        try:
+            file_ids = []
+            if media:
+                max_images = IMAGE_LIMITS["misskey"]["max_images"]
+                if len(media) > max_images:
+                    return {"success": False, "error": f"画像は{max_images}枚までです"}
+                with time_phase("misskey", "upload"):
+                    file_ids, err = await self.upload_images(media)
+                if err:
+                    return {"success": False, "error": err}
+            params = {"text": content, "visibility": "home"}
+            if file_ids:
+                params["fileIds"] = file_ids
+            with time_phase("misskey", "publish"):
+                # ノートの作成は冪等ではないため、接続できなかった場合だけ再試行する
+                _, err = await self._call("notes/create", idempotent=False, **params)
+            if err:
+                return {"success": False, "error": err}
+            return {"success": True, "response": "投稿成功"}
+        except Exception as e:
+            logger.error(f"Misskey投稿エラー: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache, engine):
+    """
+    アカウントの設定からMisskeyのPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（api_token, instance_url）
+        media_cache: アップロード済みfile_idのキャッシュ
+        engine: AsyncSnsClient（HTTPクライアントの取得に使う）
+    Returns:
+        AsyncMisskeyPoster
+    """
+    instance_url = config["instance_url"]
+    client = engine.http_client(
+        instance_url, "misskey", account, paths=["/api/notes/create"]
+    )
+    return AsyncMisskeyPoster(
+        client, instance_url, config["api_token"], media_cache=media_cache
+    )
@@ -0,0 +1,204 @@
+"""
+Threadsへの投稿処理を担当するクラス（非同期版）。
+コンテナの準備待ちもイベントループ上で行い、待機中にスレッドを占有しない。
+画像投稿は未対応。
+
+Attributes:
+    client: Threads Graph APIへのhttpx.AsyncClient
+"""
+
+import asyncio
+import logging
+import time
+
+from constants import THREADS_SETTINGS
+from metrics import time_phase
+from retry import check_transient, is_transient, with_retry_async
+from sns_posters.threads import (
+    API_BASE_URL,
+    _error_message,
+    _is_auth_error,
+    _user_ids,
+    _user_ids_lock,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncThreadsPoster:
+    def __init__(self, client, access_token):
+        """
+        AsyncThreadsPosterの初期化。
+
+        Args:
+            client: Threads Graph APIへのhttpx.AsyncClient
+            access_token: Threads API用アクセストークン
+        """
+        self.client = client
+        self.access_token = access_token
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+
+    async def _request(self, method, url, idempotent=True, **kwargs):
+        """
+        Graph APIを呼び出す。一時的な障害（接続エラー・5xx）は再試行する
+        （同期版と同じく、公開はidempotent=Falseで接続できなかった場合だけ再試行する）。
+        """
+
+        async def send():
+            return check_transient(
+                await self.client.request(method, url, headers=self.headers, **kwargs)
+            )
+
+        return await with_retry_async("threads", send, idempotent=idempotent)
+
+    async def get_user_id(self):
+        """
+        アクセストークンに対応するユーザーIDを返す（同期版とキャッシュを共有する）。
+
+        Returns:
+            (user_id, エラー文字列)
+        """
+        with _user_ids_lock:
+            user_id = _user_ids.get(self.access_token)
+        if user_id:
+            return user_id, None
+        response = await self._request("GET", f"{API_BASE_URL}/me")
+        if not response.is_success:
+            return None, f"Threadsユーザー取得エラー: {_error_message(response)}"
+        user_id = response.json().get("id")
+        with _user_ids_lock:
+            _user_ids[self.access_token] = user_id
+        return user_id, None
+
+    def invalidate_user_id(self):
+        """
+        キャッシュしたユーザーIDを破棄する（認証エラー時）。
+        """
+        with _user_ids_lock:
+            _user_ids.pop(self.access_token, None)
+
+    async def wait_for_container(self, creation_id):
+        """
+        コンテナの準備が完了するまで、間隔を伸ばしながら状態を確認する。
+
+        Args:
+            creation_id: コンテナID
+        Returns:
+            エラー文字列（準備完了ならNone）
+        """
+        interval = THREADS_SETTINGS["poll_interval"]
+        deadline = time.monotonic() + THREADS_SETTINGS["poll_timeout"]
+        while True:
+            response = await self._request(
+                "GET",
+                f"{API_BASE_URL}/{creation_id}",
+                params={"fields": "status,error_message"},
+            )
+            if not response.is_success:
+                return f"Threadsコンテナ状態の取得エラー: {_error_message(response)}"
+            body = response.json()
+            status = body.get("status")
+            if status in ("FINISHED", None):
+                return None
+            if status in ("ERROR", "EXPIRED"):
+                return f"Threadsコンテナエラー({status}): {body.get('error_message', '')}"
+            if time.monotonic() + interval > deadline:
+                return "Threadsコンテナの準備がタイムアウトしました"
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, THREADS_SETTINGS["poll_max_interval"])
+
+    async def is_published(self, creation_id):
+        """
+        コンテナが公開済みかどうかを確認する（公開APIの結果がわからない場合に使う）。
+        確認できなかった場合はFalseを返す。
+        """
+        try:
+            response = await self._request(
+                "GET", f"{API_BASE_URL}/{creation_id}", params={"fields": "status"}
+            )
+        except Exception as e:
+            logger.warning(f"Threadsコンテナ状態の確認に失敗: {str(e)}")
+            return False
+        return response.is_success and response.json().get("status") == "PUBLISHED"
+
+    async def post(self, content, media=None):
+        """
+        Threadsへ投稿を行う。
+        コンテナを作成し、準備完了を確認してから公開する。
+
+        Args:
+            content: 投稿本文
+            media: 画像（Media）のリスト（未使用）
+        Returns:
+            dict: 投稿結果（success, response/error）
+        """
+        if media:
+            return {"success": False, "error": "Threadsは画像投稿に未対応です"}
+        try:
+            user_id, err = await self.get_user_id()
+            if err:
+                return {"success": False, "error": err}
+            with time_phase("threads", "publish"):
+                response = await self._request(
+                    "POST",
+                    f"{API_BASE_URL}/{user_id}/threads",
+                    json={"text": content, "media_type": "TEXT"},
+                )
+                if not response.is_success:
+                    if _is_auth_error(response):
+                        self.invalidate_user_id()
+                    return {
+                        "success": False,
+                        "error": f"Threads投稿APIエラー: {_error_message(response)}",
+                    }
+                creation_id = response.json().get("id")
+
+                err = await self.wait_for_container(creation_id)
+                if err:
+                    return {"success": False, "error": err}
+
+                try:
+                    response = await self._request(
+                        "POST",
+                        f"{API_BASE_URL}/{user_id}/threads_publish",
+                        json={"creation_id": creation_id},
+                        idempotent=False,
+                    )
+                except Exception:
+                    # 公開されたかわからない失敗のため、コンテナの状態で確認する
+                    if await self.is_published(creation_id):
+                        return {"success": True, "response": "投稿成功"}
+                    raise
+                if not response.is_success or not response.json().get("id"):
+                    if _is_auth_error(response):
+                        self.invalidate_user_id()
+                    return {
+                        "success": False,
+                        "error": f"Threads公開APIエラー: {_error_message(response)}",
+                    }
+                return {"success": True, "response": "投稿成功"}
+        except Exception as e:
+            logger.error(f"Threads投稿エラー: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache, engine):
+    """
+    アカウントの設定からThreadsのPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（access_token）
+        media_cache: 未使用（画像投稿に未対応のため）
+        engine: AsyncSnsClient（HTTPクライアントの取得に使う）
+    Returns:
+        AsyncThreadsPoster
+    """
+    return AsyncThreadsPoster(
+        engine.http_client(API_BASE_URL, "threads", account), config["access_token"]
+    )
@@ -0,0 +1,63 @@
+"""
+非同期Poster用の補助関数。
+1つのSNSへの複数画像アップロードをコルーチンで並列に行う。
+結果の順序は入力（ユーザーが選んだ順）を保ち、どれか1つでも失敗した場合は
+残りのアップロードを取り消し、新たにアップロードしたメディアを後始末する。
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _UploadError(Exception):
+    """
+    upload_oneがエラー文字列を返したことを表す内部例外。
+    """
+
+
+async def upload_in_parallel(upload_one, items, max_concurrency, cleanup=None):
+    """
+    itemsを最大max_concurrency並列でアップロードする。
+
+    Args:
+        upload_one: item -> (参照, エラー文字列, 新規作成かどうか) を返すコルーチン関数
+        items: アップロード対象（画像など）のリスト
+        max_concurrency: 同時アップロード数の上限
+        cleanup: 失敗時に新規作成済みの参照を受け取って後始末するコルーチン関数（任意）
+    Returns:
+        (参照リスト, None) or (None, エラー文字列)
+    Raises:
+        upload_oneが送出した例外（後始末を行った後に再送出する）
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    created = []
+
+    async def run(item):
+        async with semaphore:
+            ref, err, is_new = await upload_one(item)
+        if is_new:
+            created.append(ref)
+        if err:
+            raise _UploadError(err)
+        return ref
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        refs = await asyncio.gather(*tasks)
+    except BaseException as e:
+        # 残りのアップロードを取り消し、終わるのを待ってから後始末する
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if cleanup:
+            for ref in created:
+                try:
+                    await cleanup(ref)
+                except Exception as e2:
+                    logger.warning(f"アップロード済みメディアの後始末に失敗: {e2}")
+        if isinstance(e, _UploadError):
+            return None, str(e)
+        raise
+    return refs, None
@@ -0,0 +1,159 @@
+"""
+X（旧Twitter）への投稿処理を担当するクラス（非同期版）。
+メディアアップロード（v1.1）とポスト作成（v2）をhttpxで直接呼び出す。
+リクエストにはOAuth 1.0aの署名（Authorizationヘッダー）を付与する。
+
+Attributes:
+    client: X APIへのhttpx.AsyncClient
+"""
+
+import logging
+
+from oauthlib.oauth1 import Client as OAuth1Client
+
+from constants import IMAGE_LIMITS
+from http_pool import api_base_url
+from async_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import TRANSIENT_STATUS, check_transient, is_transient, with_retry_async
+
+API_BASE_URL = api_base_url("x")
+UPLOAD_URL = f"{api_base_url('x_upload')}/1.1/media/upload.json"
+TWEET_URL = f"{API_BASE_URL}/2/tweets"
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncXPoster:
+    def __init__(self, client, upload_client, credentials, media_cache=None):
+        """
+        AsyncXPosterの初期化。
+
+        Args:
+            client: api.twitter.comへのhttpx.AsyncClient
+            upload_client: upload.twitter.comへのhttpx.AsyncClient
+            credentials: (API Key, API Secret, Access Token, Access Token Secret)
+            media_cache: アップロード済みmedia_idのキャッシュ（任意）
+        """
+        self.client = client
+        self.upload_client = upload_client
+        self.oauth = OAuth1Client(*credentials)
+        self.media_cache = media_cache
+
+    def _auth_headers(self, url):
+        """
+        OAuth 1.0aの署名ヘッダーを返す。
+        multipart/JSONのボディは署名対象に含まれないため、URLとメソッドのみで署名する。
+        """
+        _, headers, _ = self.oauth.sign(url, http_method="POST")
+        return headers
+
+    async def upload_images(self, media):
+        """
+        画像をXに並列でアップロードする。
+        失効前の同じ画像のmedia_idがキャッシュにあれば再利用する。
+
+        Args:
+            media: 画像（Media）のリスト
+        Returns:
+            (media_idリスト, エラー文字列)
+        """
+
+        async def upload_one(item):
+            media_id = self.media_cache and self.media_cache.get("x", item.digest)
+            if media_id:
+                return media_id, None, False
+
+            async def send():
+                return check_transient(
+                    await self.upload_client.post(
+                        UPLOAD_URL,
+                        files={"media": (item.filename, item.open(), item.mime_type)},
+                        headers=self._auth_headers(UPLOAD_URL),
+                    )
+                )
+
+            response = await with_retry_async("x", send)
+            if response.status_code != 200:
+                return None, f"media/upload失敗: {response.text}", False
+            media_id = response.json().get("media_id_string")
+            if self.media_cache:
+                self.media_cache.put("x", item.digest, media_id)
+            return media_id, None, True
+
+        return await upload_in_parallel(
+            upload_one, media, IMAGE_LIMITS["x"]["upload_concurrency"]
+        )
+
+    async def post(self, content, media):
+        """
+        Xへ投稿を行う。
+
+        Args:
+            content: 投稿本文
+            media: 画像（Media）のリスト
+        Returns:
+            dict: 投稿結果（success, response/error）
+        """
+        try:
+            media_ids = []
+            if media:
+                max_images = IMAGE_LIMITS["x"]["max_images"]
+                if len(media) > max_images:
+                    return {"success": False, "error": f"画像は{max_images}枚までです"}
+                with time_phase("x", "upload"):
+                    media_ids, err = await self.upload_images(media)
+                if err:
+                    return {"success": False, "error": err}
+            body = {"text": content}
+            if media_ids:
+                body["media"] = {"media_ids": media_ids}
+            with time_phase("x", "publish"):
+                # ポストの作成は冪等ではないため、接続できなかった場合だけ再試行する
+                response = await with_retry_async(
+                    "x",
+                    lambda: self.client.post(
+                        TWEET_URL, json=body, headers=self._auth_headers(TWEET_URL)
+                    ),
+                    idempotent=False,
+                )
+            if not response.is_success:
+                return {
+                    "success": False,
+                    "error": f"X投稿APIエラー: HTTP {response.status_code}: {response.text[:200]}",
+                    "transient": response.status_code in TRANSIENT_STATUS,
+                }
+            return {"success": True, "response": "投稿成功"}
+        except Exception as e:
+            logger.error(f"X投稿エラー: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache, engine):
+    """
+    アカウントの設定からXのPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（api_key, api_secret, access_token, access_token_secret）
+        media_cache: アップロード済みmedia_idのキャッシュ
+        engine: AsyncSnsClient（HTTPクライアントの取得に使う）
+    Returns:
+        AsyncXPoster
+    """
+    return AsyncXPoster(
+        engine.http_client(TWEET_URL, "x", account, paths=["/2/tweets"]),
+        engine.http_client(UPLOAD_URL, "x", account, paths=["/2/tweets"]),
+        (
+            config["api_key"],
+            config["api_secret"],
+            config["access_token"],
+            config["access_token_secret"],
+        ),
+        media_cache=media_cache,
+    )
@@ -0,0 +1,287 @@
+"""
+asyncio＋httpxによる非同期投稿エンジン（POST_ENGINE=async で有効）。
+専用スレッドで1つのイベントループを動かし、すべての投稿をコルーチンとして実行する。
+通信待ちの間はスレッドを占有しないため、1プロセスで多数の投稿を同時に処理できる。
+クライアントの状態管理・初期化の再試行はSnsClientと共通で、
+同期版（sns_posters）と同じ入出力（iter_post_to_platforms / post_to_platforms）を持つ。
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+from accounts import load_accounts, split_target
+from http_pool import AsyncHttpPool
+from media_cache import media_cache
+from platforms import get_platform
+from rate_limiter import rate_limiter
+from circuit_breaker import circuit_breakers
+from profiler import profiler
+from metrics import (
+    post_batch_duration,
+    post_batches_in_flight,
+    post_duration,
+    posts_in_flight,
+    record_result,
+    time_phase,
+)
+from sns_client import (
+    SnsClient,
+    _AccountResults,
+    account_label,
+    get_post_timeout,
+    is_throttled,
+    rate_limited_result,
+    start_preprocessor,
+    timeout_result,
+)
+
+logger = logging.getLogger(__name__)
+
+# iter_post_to_platformsの終端を表す値
+_DONE = object()
+
+
+class AsyncSnsClient(SnsClient):
+    def __init__(self, accounts=None):
+        accounts = load_accounts() if accounts is None else accounts
+        # 画像加工のワーカープロセスは、イベントループのスレッドより先に起動する
+        start_preprocessor(accounts)
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self.loop.run_forever, name="sns-async-loop", daemon=True
+        )
+        self._loop_thread.start()
+        self.http = AsyncHttpPool(
+            max_connections=int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "0")) or None,
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "0")) or None,
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "0")) or None,
+        )
+        super().__init__(accounts)
+
+    def run(self, coro):
+        """
+        コルーチンをイベントループで実行し、完了まで待って結果を返す（ループ外のスレッドから呼ぶ）。
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def http_client(self, url, platform, account, paths=None):
+        """
+        ホストとアカウントごとのクライアントを返し、レート制限を把握するフックを設定する。
+        """
+        client = self.http.client(url, account=account)
+        client.event_hooks["response"] = [
+            rate_limiter.async_response_hook(platform, account, paths=paths)
+        ]
+        return client
+
+    def create_poster(self, platform, account, config):
+        """
+        非同期版のPosterを生成する（PosterのモジュールとSDKはここで読み込む）。
+        """
+        factory = get_platform(platform).poster_factory("async")
+        return factory(account, config, media_cache.for_account(account), self)
+
+    async def _post_to_platform_async(
+        self, platform, account, content, media, variants, wait_timeout
+    ):
+        """
+        1つのアカウントへ投稿する（イベントループで実行される）。
+        アカウントのレート制限の枠が空くまで待ってから送信する（待つ間もイベントループは止めない）。
+        送信を始めてから投稿期限を過ぎた場合は投稿処理を取り消し、タイムアウトの結果（timeout_result）を返す。
+        Args:
+            platform: SNS名
+            account: アカウント名
+            content: 投稿本文
+            media: 画像（Media）のリスト（最大枚数で制限済み）
+            variants: 加工済み画像のFutureのリスト（prepare_mediaの戻り値）
+            wait_timeout: 送信を始めるまで待つ最大秒数（Noneなら枠が空くまで待つ）
+        Returns:
+            投稿結果のdict
+        """
+
+        label = account_label(platform, account)
+        poster = self.posters[(platform, account)]
+        circuit = self.circuit_key(platform, account)
+        wait_until = None if wait_timeout is None else time.monotonic() + wait_timeout
+        # 最後にSNSへ送信を始めた時刻
+        started = []
+
+        async def acquire():
+            timeout = None
+            if wait_until is not None:
+                timeout = max(0.0, wait_until - time.monotonic())
+            with time_phase(platform, "rate_limit_wait"):
+                return await rate_limiter.acquire_async(platform, account, timeout=timeout)
+
+        async def post():
+            try:
+                if platform == "bluesky":
+                    return await poster.post(
+                        content, media, self.compress_image_for_platform, variants
+                    )
+                return await poster.post(content, media)
+            except Exception as e:
+                return self.handle_exception(e, label)
+
+        async def send():
+            started[:] = [time.monotonic()]
+            sent_at = time.time()
+            with posts_in_flight.track_inprogress(platform=platform), post_duration.time(
+                platform=platform
+            ):
+                try:
+                    result = await asyncio.wait_for(post(), get_post_timeout(platform))
+                except asyncio.TimeoutError:
+                    # 加工済み画像は同じSNSの他のアカウントと共有しているため、ここでは取り消さない
+                    # 送信中に打ち切った投稿は、SNSに届いて投稿されている可能性がある
+                    result = timeout_result(platform, account, sent=True)
+            return result, is_throttled(platform, account, result, sent_at)
+
+        try:
+            if not await acquire():
+                result = rate_limited_result(label)
+            else:
+                result, throttled = await send()
+                # SNSに429を返された投稿は、制限が解けるまで待って1度だけやり直す
+                if throttled and await acquire():
+                    result, throttled = await send()
+                if throttled:
+                    result = {**result, "error_type": "RateLimited", "rate_limited": True}
+        except asyncio.CancelledError:
+            circuit_breakers.release(circuit)
+            raise
+        if started:
+            circuit_breakers.record(circuit, result, time.monotonic() - started[0])
+        else:
+            # レート制限の待ちで終わった投稿はSNSへ送信していない
+            circuit_breakers.release(circuit)
+        return result
+
+    async def aiter_post_results(self, plan, wait_for_rate_limit=False):
+        """
+        投稿先のアカウントへ並行して投稿し、完了したものから結果を返す非同期ジェネレータ。
+        イベントループ（self.loop）上で実行すること。
+        Args:
+            plan: _planの戻り値
+            wait_for_rate_limit: レート制限の枠が空くまで期限なく待つかどうか
+                （SnsClient.iter_post_to_platformsを参照）
+        Yields:
+            (投稿先, アカウント名, 投稿結果のdict)
+        """
+
+        started = set()
+
+        async def run(key, account, coro):
+            started.add(asyncio.current_task())
+            return key, account, await coro
+
+        # タスク -> SNS名
+        tasks = {}
+        variants = []
+        for key, platform, accounts, post in plan:
+            ready = []
+            for account in accounts:
+                result = self._unavailable_result(platform, account)
+                if result is None:
+                    ready.append(account)
+                else:
+                    yield key, account, result
+            if not ready:
+                continue
+            wait_timeout = None if wait_for_rate_limit else get_post_timeout(platform)
+            # 画像の加工はレート制限の待ちを待たずに始め、アカウント間で共有する
+            media = self._get_media_limited(post.get("media"), platform)
+            prepared = self.prepare_media(platform, media, ready)
+            variants.extend(prepared or [])
+            for account in ready:
+                coro = self._post_to_platform_async(
+                    platform, account, post["content"], media, prepared, wait_timeout
+                )
+                task = asyncio.ensure_future(run(key, account, coro))
+                tasks[task] = self.circuit_key(platform, account)
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task, circuit in tasks.items():
+                task.cancel()
+                if task not in started:
+                    # 開始前に取り消した投稿は、_unavailable_resultで得たブレーカーの枠を返す
+                    circuit_breakers.release(circuit)
+            # 完了した投稿の画像は加工済みのため、取り消されるのは使われなかったものだけ
+            for variant in variants:
+                if variant:
+                    variant.cancel()
+
+    async def aiter_post_to_platforms(self, posts, wait_for_rate_limit=False):
+        """
+        複数のプラットフォームへ並行して投稿し、完了したものから結果を返す非同期ジェネレータ。
+        投稿先に複数のアカウントが含まれる場合は、結果を投稿先ごとにまとめて返す。
+        イベントループ（self.loop）上で実行すること。
+        Args:
+            posts: 投稿先（SNS名または"SNS名:アカウント名"）をキー、
+                {"content":..., "media":..., "accounts":...}を値とする辞書
+            wait_for_rate_limit: レート制限の枠が空くまで期限なく待つかどうか
+        Yields:
+            (投稿先, 投稿結果のdict)
+        """
+        plan = self._plan(posts)
+        collected = _AccountResults(plan)
+        async for key, account, result in self.aiter_post_results(plan, wait_for_rate_limit):
+            record_result(split_target(key)[0], result)
+            merged = collected.add(key, account, result)
+            if merged is not None:
+                yield key, merged
+
+    def _iter_post_results(self, plan, wait_for_rate_limit=False):
+        """
+        同期版と同じインターフェースで、完了したものから結果を返すジェネレータ。
+        投稿はイベントループで実行し、呼び出し元のスレッドは結果を受け取るだけになる。
+        途中でジェネレータが閉じられた場合（クライアント切断など）は残りの投稿を取り消す。
+        プロファイル中のリクエストでは、投稿の間イベントループのスレッドも記録する。
+        """
+        results = queue.Queue()
+
+        async def produce():
+            try:
+                async for item in self.aiter_post_results(plan, wait_for_rate_limit):
+                    results.put(item)
+            finally:
+                results.put(_DONE)
+
+        with profiler.attach(profiler.current(), self._loop_thread):
+            future = asyncio.run_coroutine_threadsafe(produce(), self.loop)
+            try:
+                while True:
+                    item = results.get()
+                    if item is _DONE:
+                        break
+                    yield item
+                future.result()
+            finally:
+                future.cancel()
+
+    async def post_to_platforms_async(self, posts, wait_for_rate_limit=False):
+        """
+        post_to_platformsのコルーチン版。任意のイベントループ（非同期ビューなど）から呼べる。
+        投稿処理自体はこのエンジンのイベントループで実行する。
+        Returns:
+            各プラットフォームの投稿結果を含む辞書（postsの順序を保持）
+        """
+
+        async def collect():
+            results = {}
+            with post_batches_in_flight.track_inprogress(), post_batch_duration.time():
+                async for key, result in self.aiter_post_to_platforms(
+                    posts, wait_for_rate_limit
+                ):
+                    results[key] = result
+            return results
+
+        future = asyncio.run_coroutine_threadsafe(collect(), self.loop)
+        results = await asyncio.wrap_future(future)
+        return {platform: results[platform] for platform in posts if platform in results}
@@ -0,0 +1,369 @@
+"""
+ベンチマーク用の各SNS APIの代替サーバー。
+実際のPoster（同期・非同期どちらの投稿エンジンも）をそのまま動かせる範囲で、
+Bluesky（XRPC）・Mastodon・Misskey・X・Threads のAPIを模したレスポンスを返す。
+応答の遅延（固定＋ランダム）と、アップロード・投稿APIでの失敗の割合を指定できる。
+
+単体で起動する場合（backendディレクトリで実行）:
+    python benchmarks/fake_sns.py [--latency 50] [--error-rate 0.05]
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from platforms import PLATFORMS as _PLATFORMS  # noqa: E402
+
+PLATFORMS = tuple(_PLATFORMS)
+
+# 代替サーバーが通知するレート制限（投稿側のレート制限で待たされないよう大きくする）
+RATE_LIMIT = 100000
+
+_ids = itertools.count(1)
+
+
+def _next_id():
+    return str(next(_ids))
+
+
+def _jwt(did, scope):
+    """
+    署名を検証しないクライアント向けの、形式だけ正しいJWTを返す。
+    """
+
+    def encode(value):
+        raw = json.dumps(value).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    now = int(time.time())
+    payload = {"scope": scope, "sub": did, "iat": now, "exp": now + 24 * 60 * 60}
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(payload)}.c2lnbmF0dXJl"
+
+
+def _bluesky_session(handler, body):
+    identifier = json.loads(body or b"{}").get("identifier", "bench.bsky.social")
+    did = "did:plc:benchmark"
+    return 200, {
+        "did": did,
+        "handle": identifier,
+        "accessJwt": _jwt(did, "com.atproto.access"),
+        "refreshJwt": _jwt(did, "com.atproto.refresh"),
+    }
+
+
+def _bluesky_profile(handler, body):
+    return 200, {"did": "did:plc:benchmark", "handle": "bench.bsky.social"}
+
+
+def _bluesky_upload_blob(handler, body):
+    return 200, {
+        "blob": {
+            "$type": "blob",
+            "ref": {"$link": "bafkreigh2akiscaildcqabsyg3dfr6chu3fgpregiymsck7e7aqa4s52zy"},
+            "mimeType": handler.headers.get("Content-Type", "image/jpeg"),
+            "size": len(body),
+        }
+    }
+
+
+def _bluesky_create_record(handler, body):
+    return 200, {
+        "uri": f"at://did:plc:benchmark/app.bsky.feed.post/{_next_id()}",
+        "cid": "bafyreie5737gdxlw5i64vzichcalba3z2v5n6icifvx5xytvske7mr3hpm",
+    }
+
+
+def _mastodon_instance(handler, body):
+    return 200, {"uri": "localhost", "title": "benchmark", "version": "4.2.0"}
+
+
+def _mastodon_media(handler, body):
+    return 200, {"id": _next_id(), "type": "image", "url": None}
+
+
+def _mastodon_status(handler, body):
+    return 200, {
+        "id": _next_id(),
+        "content": "",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _misskey_find_by_hash(handler, body):
+    return 200, []
+
+
+def _misskey_create_file(handler, body):
+    return 200, {"id": _next_id()}
+
+
+def _misskey_delete_file(handler, body):
+    return 204, None
+
+
+def _misskey_create_note(handler, body):
+    return 200, {"createdNote": {"id": _next_id()}}
+
+
+def _x_upload(handler, body):
+    media_id = _next_id()
+    return 200, {"media_id": int(media_id), "media_id_string": media_id}
+
+
+def _x_tweet(handler, body):
+    return 201, {"data": {"id": _next_id(), "text": json.loads(body).get("text")}}
+
+
+def _threads_me(handler, body):
+    return 200, {"id": "1"}
+
+
+def _threads_create(handler, body, user_id):
+    return 200, {"id": _next_id()}
+
+
+def _threads_container(handler, body, container_id):
+    return 200, {"id": container_id, "status": "FINISHED"}
+
+
+# (メソッド, パス, 処理, 失敗を混ぜるか)
+ROUTES = {
+    "bluesky": [
+        ("POST", r"/xrpc/com\.atproto\.server\.createSession", _bluesky_session, False),
+        ("POST", r"/xrpc/com\.atproto\.server\.refreshSession", _bluesky_session, False),
+        ("GET", r"/xrpc/com\.atproto\.server\.getSession", _bluesky_profile, False),
+        ("GET", r"/xrpc/app\.bsky\.actor\.getProfile", _bluesky_profile, False),
+        ("POST", r"/xrpc/com\.atproto\.repo\.uploadBlob", _bluesky_upload_blob, True),
+        ("POST", r"/xrpc/com\.atproto\.repo\.createRecord", _bluesky_create_record, True),
+    ],
+    "mastodon": [
+        ("GET", r"/api/v[12]/instance/?", _mastodon_instance, False),
+        ("POST", r"/api/v[12]/media", _mastodon_media, True),
+        ("POST", r"/api/v1/statuses", _mastodon_status, True),
+    ],
+    "misskey": [
+        ("POST", r"/api/drive/files/find-by-hash", _misskey_find_by_hash, False),
+        ("POST", r"/api/drive/files/create", _misskey_create_file, True),
+        ("POST", r"/api/drive/files/delete", _misskey_delete_file, False),
+        ("POST", r"/api/notes/create", _misskey_create_note, True),
+    ],
+    # media/upload（upload.twitter.com）とポスト作成（api.twitter.com）を1つのサーバーで受ける
+    "x": [
+        ("POST", r"/1\.1/media/upload\.json", _x_upload, True),
+        ("POST", r"/2/tweets", _x_tweet, True),
+    ],
+    "threads": [
+        ("GET", r"/v1\.0/me", _threads_me, False),
+        ("POST", r"/v1\.0/(\w+)/threads", _threads_create, True),
+        ("POST", r"/v1\.0/(\w+)/threads_publish", _threads_create, True),
+        ("GET", r"/v1\.0/(\w+)", _threads_container, False),
+    ],
+}
+
+
+def _rate_limit_headers(platform):
+    """
+    各SNSの形式のレート制限ヘッダーを返す。
+    """
+    if platform == "threads":
+        return {"X-App-Usage": json.dumps({"call_count": 1, "total_time": 1, "total_cputime": 1})}
+    reset = datetime.now(timezone.utc) + timedelta(hours=1)
+    if platform == "x":
+        prefix, reset_value = "x-rate-limit", str(int(reset.timestamp()))
+    elif platform == "bluesky":
+        prefix, reset_value = "ratelimit", str(int(reset.timestamp()))
+    else:
+        prefix, reset_value = "X-RateLimit", reset.isoformat()
+    headers = {
+        f"{prefix}-limit": str(RATE_LIMIT),
+        f"{prefix}-remaining": str(RATE_LIMIT - 1),
+        f"{prefix}-reset": reset_value,
+    }
+    if platform == "bluesky":
+        headers["ratelimit-policy"] = f"{RATE_LIMIT};w=3600"
+    return headers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        path = urlsplit(self.path).path
+        for route_method, pattern, func, faulty in server.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            self._send(404, {"error": f"not found: {method} {path}"})
+            return
+        server.count(path if not match.groups() else pattern)
+        time.sleep(server.delay())
+        if faulty and server.should_fail():
+            self._send(500, {"error": "InternalServerError", "message": "injected failure"})
+            return
+        status, payload = func(self, body, *match.groups())
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in _rate_limit_headers(self.server.platform).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeSnsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, platform, latency=0.0, jitter=0.0, error_rate=0.0, port=0):
+        """
+        FakeSnsServerの初期化。start()で別スレッドで待ち受けを開始する。
+
+        Args:
+            platform: SNS名（ROUTESのキー）
+            latency: 応答までの固定の遅延（秒）
+            jitter: 固定の遅延に加えるランダムな遅延の最大値（秒）
+            error_rate: アップロード・投稿APIが500を返す割合（0〜1）
+            port: 待ち受けポート（0は空いているポート）
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.platform = platform
+        self.routes = ROUTES[platform]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def handle_error(self, request, client_address):
+        # 取り消されたアップロードなどで、応答前にクライアントが切断するのは想定内
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def start(self):
+        thread = threading.Thread(
+            target=self.serve_forever, name=f"fake-{self.platform}", daemon=True
+        )
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_servers(platforms=PLATFORMS, **options):
+    """
+    SNSごとの代替サーバーを起動する。
+
+    Args:
+        platforms: 起動するSNS名のリスト
+        options: FakeSnsServerに渡す遅延・失敗の割合
+    Returns:
+        SNS名をキー、FakeSnsServerを値とする辞書
+    """
+    return {platform: FakeSnsServer(platform, **options).start() for platform in platforms}
+
+
+def client_env(servers):
+    """
+    代替サーバーへ投稿するための環境変数（接続先とダミーの認証情報）を返す。
+
+    Args:
+        servers: start_serversの戻り値
+    Returns:
+        環境変数名をキーとする辞書
+    """
+    env = {}
+    if "bluesky" in servers:
+        env.update(
+            BLUESKY_BASE_URL=f"{servers['bluesky'].url}/xrpc",
+            BLUESKY_USERNAME="bench.bsky.social",
+            BLUESKY_PASSWORD="benchmark",
+        )
+    if "x" in servers:
+        env.update(
+            X_BASE_URL=servers["x"].url,
+            X_UPLOAD_BASE_URL=servers["x"].url,
+            X_API_KEY="benchmark",
+            X_API_SECRET="benchmark",
+            X_ACCESS_TOKEN="benchmark",
+            X_ACCESS_TOKEN_SECRET="benchmark",
+        )
+    if "threads" in servers:
+        env.update(THREADS_BASE_URL=servers["threads"].url, THREADS_ACCESS_TOKEN="benchmark")
+    if "misskey" in servers:
+        env.update(MISSKEY_INSTANCE_URL=servers["misskey"].url, MISSKEY_API_TOKEN="benchmark")
+    if "mastodon" in servers:
+        env.update(
+            MASTODON_INSTANCE_URL=servers["mastodon"].url, MASTODON_ACCESS_TOKEN="benchmark"
+        )
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=50, help="応答の遅延（ミリ秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="ランダムな遅延の最大値（ミリ秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="アップロード・投稿APIの失敗の割合")
+    args = parser.parse_args()
+
+    servers = start_servers(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate
+    )
+    for name, value in client_env(servers).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
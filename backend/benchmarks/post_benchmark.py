@@ -0,0 +1,218 @@
+"""
+投稿処理のエンドツーエンドのベンチマーク。
+5つのSNSの代替サーバー（benchmarks/fake_sns.py）を起動し、実際のアプリ（/api/post）を
+HTTPサーバーとして動かして、本文のみ・画像4枚の投稿を並列に送り、
+スループットとレイテンシ（p50/p95/p99）を計測する。
+
+使い方（backendディレクトリで実行）:
+    python benchmarks/post_benchmark.py [--engine thread|async] [--requests 50]
+        [--concurrency 8] [--latency 50] [--jitter 0] [--error-rate 0]
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.compress_benchmark import make_photo  # noqa: E402
+from benchmarks.fake_sns import PLATFORMS, client_env, start_servers  # noqa: E402
+
+# 画像投稿に対応していないSNS（画像4枚のシナリオから除く）
+TEXT_ONLY_PLATFORMS = ("threads",)
+
+
+def percentile(values, p):
+    """
+    最近接順位法でパーセンタイルを返す。
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_images(count=4):
+    """
+    投稿に添付する写真風のJPEG画像を生成する（Blueskyの上限を超え、圧縮が必要なサイズ）。
+    """
+    images = []
+    for i in range(count):
+        buf = io.BytesIO()
+        make_photo(2400, 1600, seed=i).save(buf, format="JPEG", quality=92)
+        images.append(buf.getvalue())
+    return images
+
+
+def start_app(engine, work_dir):
+    """
+    代替サーバーに接続する設定でアプリを読み込み、HTTPサーバーとして起動する。
+    すべてのSNSクライアントの初期化が終わるまで待つ。
+
+    Returns:
+        (アプリのURL, werkzeugのサーバー)
+    """
+    os.environ.update(
+        POST_ENGINE=engine,
+        BLUESKY_SESSION_FILE=os.path.join(work_dir, "bluesky_sessions.json"),
+        JOB_DB_PATH=os.path.join(work_dir, "jobs.sqlite3"),
+        UPLOAD_FOLDER=os.path.join(work_dir, "uploads"),
+    )
+    from werkzeug.serving import make_server
+
+    import app as app_module
+    from sns_client import STATE_READY, sns_client
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        # SNS全体の状態は1アカウントでも使えればreadyになるため、全アカウントを待つ
+        states = {
+            f"{platform}:{account}": info["state"]
+            for platform in PLATFORMS
+            for account, info in sns_client.account_states(platform).items()
+        }
+        if all(state == STATE_READY for state in states.values()):
+            break
+        time.sleep(0.1)
+    else:
+        raise RuntimeError(f"SNSクライアントの初期化が完了しません: {states}")
+
+    # 投稿ごとのログは計測の妨げになるため抑える（失敗はSNSごとの件数として集計する）
+    logging.disable(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def run_scenario(url, platforms, images, total, concurrency):
+    """
+    /api/postへtotal件の投稿をconcurrency並列で送り、結果を集計する。
+
+    Args:
+        url: アプリのURL
+        platforms: 投稿先のSNS名のリスト
+        images: 添付する画像（bytes）のリスト
+        total: 投稿数
+        concurrency: 同時に送る投稿数
+    Returns:
+        集計結果のdict
+    """
+    local = threading.local()
+
+    def post_one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        post_data = {
+            platform: {"selected": True, "content": f"benchmark post {i}"}
+            for platform in platforms
+        }
+        start = time.perf_counter()
+        if images:
+            # 画像ごとに末尾のバイトを変え、アップロード済みメディアのキャッシュに当たらないようにする
+            files = {
+                f"image{n}": (f"bench{n}.jpg", image + os.urandom(8), "image/jpeg")
+                for n, image in enumerate(images)
+            }
+            response = session.post(
+                f"{url}/api/post", data={"postData": json.dumps(post_data)}, files=files
+            )
+        else:
+            response = session.post(f"{url}/api/post", json=post_data)
+        elapsed = time.perf_counter() - start
+        failed = []
+        if response.status_code == 200:
+            results = response.json().get("results", {})
+            failed = [p for p in platforms if not results.get(p, {}).get("success")]
+        else:
+            failed = list(platforms)
+        return elapsed, response.status_code, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(post_one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for elapsed, _, _ in outcomes]
+    errors = {}
+    for _, _, failed in outcomes:
+        for platform in failed:
+            errors[platform] = errors.get(platform, 0) + 1
+    return {
+        "requests": total,
+        "failed": sum(1 for _, status, failed in outcomes if status != 200 or failed),
+        "throughput": total / wall,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--engine", choices=("thread", "async"), default="thread", help="投稿エンジン")
+    parser.add_argument("--requests", type=int, default=50, help="シナリオごとの投稿数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に送る投稿数")
+    parser.add_argument("--warmup", type=int, default=2, help="計測前に送る投稿数")
+    parser.add_argument("--latency", type=float, default=50, help="代替サーバーの応答の遅延（ミリ秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="ランダムな遅延の最大値（ミリ秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="アップロード・投稿APIの失敗の割合")
+    args = parser.parse_args()
+
+    servers = start_servers(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate
+    )
+    os.environ.update(client_env(servers))
+    work_dir = tempfile.mkdtemp(prefix="sns-bench-")
+    url, app_server = start_app(args.engine, work_dir)
+
+    images = build_images()
+    scenarios = [
+        ("text", list(PLATFORMS), []),
+        (
+            "4 images",
+            [p for p in PLATFORMS if p not in TEXT_ONLY_PLATFORMS],
+            images,
+        ),
+    ]
+    print(
+        f"engine={args.engine} requests={args.requests} concurrency={args.concurrency} "
+        f"latency={args.latency:g}ms jitter={args.jitter:g}ms error_rate={args.error_rate:g}"
+    )
+    header = f"{'scenario':<10}{'reqs':>6}{'failed':>8}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for name, platforms, scenario_images in scenarios:
+            if args.warmup:
+                run_scenario(url, platforms, scenario_images, args.warmup, args.warmup)
+            result = run_scenario(
+                url, platforms, scenario_images, args.requests, args.concurrency
+            )
+            print(
+                f"{name:<10}{result['requests']:>6}{result['failed']:>8}"
+                f"{result['throughput']:>9.2f}"
+                + "".join(f"{result[p] * 1000:>8.0f}ms" for p in ("p50", "p95", "p99"))
+            )
+            if result["errors"]:
+                errors = ", ".join(f"{p}={n}" for p, n in sorted(result["errors"].items()))
+                print(f"{'':<10}SNSごとの失敗: {errors}")
+    finally:
+        app_server.shutdown()
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+一括投稿（/api/bulk）。
+JSONLまたはCSVの本文を1行ずつ読み込み、行ごとの投稿を並列数を制限して実行し、
+完了した行から順に結果を返す。次の行は実行中の行が空いてから読み込むため、
+行数が多くても保持するのは実行中の行だけで、メモリ使用量は一定になる。
+
+行の形式:
+    JSONL: {"id": "任意", "posts": {"bluesky": "本文", "x": "本文"}, "media": ["digest", ...]}
+    CSV:   1行目はヘッダー。SNS名の列に本文を書き（空欄のSNSには投稿しない）、
+           任意でid列とmedia列（digestを空白区切り）を置く
+SNS名はそのSNSのすべてのアカウントに投稿し、"mastodon:brand-a"のように
+アカウント名を付けるとそのアカウントだけに投稿する。
+画像は事前に/api/mediaでアップロードし、返されたdigestで指定する。
+"""
+
+import csv
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from accounts import split_target
+from constants import BULK_SETTINGS
+from platforms import PLATFORMS
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+
+
+class RowError(ValueError):
+    """
+    行の内容が正しくない場合の例外。
+    """
+
+
+def detect_format(content_type):
+    """
+    Content-Typeから行の形式を判定する（CSV以外はJSONLとして扱う）。
+    """
+    if content_type and content_type.split(";")[0].strip() in ("text/csv", "application/csv"):
+        return FORMAT_CSV
+    return FORMAT_JSONL
+
+
+def _iter_lines(stream, max_bytes):
+    """
+    バイナリストリームを1行ずつ読み、文字列として返す。
+    Excelなどが先頭に付けるBOMは取り除く。
+
+    Raises:
+        RowError: 1行が上限を超える、またはUTF-8として読めない場合
+    """
+    encoding = "utf-8-sig"
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes and not line.endswith(b"\n"):
+            # 行の残りを読み捨て、次の行から続けられるようにする
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_bytes + 1)
+            raise RowError(f"1行が{max_bytes}バイトを超えています")
+        try:
+            decoded = line.decode(encoding)
+        except UnicodeDecodeError:
+            raise RowError("UTF-8として読み込めません") from None
+        encoding = "utf-8"
+        yield decoded
+
+
+def _parse_row(record):
+    """
+    1行分のデータを{"id", "posts", "media"}に正規化する。
+
+    Raises:
+        RowError: 内容が正しくない場合
+    """
+    if not isinstance(record, dict):
+        raise RowError("行はオブジェクトで指定してください")
+    posts = record.get("posts")
+    if not isinstance(posts, dict) or not posts:
+        raise RowError("投稿先のSNSが指定されていません")
+    unknown = [
+        str(key) for key in posts if split_target(str(key))[0] not in PLATFORMS
+    ]
+    if unknown:
+        raise RowError(f"不明なSNSです: {', '.join(unknown)}")
+    invalid = [str(key) for key, content in posts.items() if not isinstance(content, str)]
+    if invalid:
+        raise RowError(f"本文は文字列で指定してください: {', '.join(invalid)}")
+    # 本文が空のSNSには投稿しない（CSVの空欄と同じ扱い）
+    posts = {platform: content for platform, content in posts.items() if content}
+    if not posts:
+        raise RowError("投稿先のSNSが指定されていません")
+    media = record.get("media") or []
+    if isinstance(media, str):
+        media = media.split()
+    if not isinstance(media, list) or not all(isinstance(d, str) for d in media):
+        raise RowError("mediaは画像のdigestのリストで指定してください")
+    return {
+        "id": record.get("id"),
+        "posts": posts,
+        "media": media,
+    }
+
+
+def _iter_jsonl(stream, max_bytes):
+    lines = _iter_lines(stream, max_bytes)
+    number = 0
+    while True:
+        number += 1
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except RowError as e:
+            # 読み捨てた行の次から読み直す
+            lines = _iter_lines(stream, max_bytes)
+            yield number, None, str(e)
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield number, _parse_row(json.loads(line)), None
+        except ValueError as e:
+            # json.JSONDecodeErrorとRowErrorはどちらもValueError
+            yield number, None, str(e)
+
+
+def _iter_csv(stream, max_bytes):
+    reader = csv.DictReader(_iter_lines(stream, max_bytes))
+    number = 0
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except (csv.Error, RowError) as e:
+            # 引用符の途中などで読めなくなると以降の行の区切りがわからないため、ここで打ち切る
+            yield reader.line_num, None, f"CSVを読み込めません: {e}"
+            return
+        number = reader.line_num
+        if None in record:
+            yield number, None, "列の数がヘッダーと一致しません"
+            continue
+        row_id = record.pop("id", None) or None
+        media = record.pop("media", None)
+        posts = {platform: content for platform, content in record.items() if content}
+        try:
+            yield number, _parse_row({"id": row_id, "posts": posts, "media": media}), None
+        except RowError as e:
+            yield number, None, str(e)
+
+
+def iter_rows(stream, format=FORMAT_JSONL, max_row_bytes=None):
+    """
+    ストリームから行を1つずつ読み込む。
+
+    Args:
+        stream: 本文のバイナリストリーム（request.streamなど）
+        format: "jsonl"または"csv"
+        max_row_bytes: 1行の最大バイト数
+    Returns:
+        (行番号, 行のdict, エラーメッセージ)のイテレータ（行が正しければエラーはNone）
+    """
+    max_row_bytes = max_row_bytes or BULK_SETTINGS["max_row_bytes"]
+    if format == FORMAT_CSV:
+        return _iter_csv(stream, max_row_bytes)
+    return _iter_jsonl(stream, max_row_bytes)
+
+
+class BulkPoster:
+    def __init__(self, sns_client, upload_store, max_concurrency=None):
+        """
+        BulkPosterの初期化。
+
+        Args:
+            sns_client: 投稿に使うSnsClient
+            upload_store: 行が参照する画像の保存先
+            max_concurrency: 同時に投稿する行数の上限
+        """
+        self.sns_client = sns_client
+        self.upload_store = upload_store
+        self.max_concurrency = max_concurrency or BULK_SETTINGS["max_concurrency"]
+
+    def _resolve_media(self, digests):
+        """
+        digestから画像を取り出す（参照を保持する）。
+
+        Returns:
+            (Mediaのリスト, None) or (None, エラーメッセージ)
+        """
+        media = []
+        for digest in digests:
+            item = self.upload_store.get(digest)
+            if item is None:
+                self.upload_store.release(media)
+                return None, f"画像が見つかりません: {digest}"
+            media.append(item)
+        return media, None
+
+    def _post_row(self, row, media):
+        try:
+            posts = {
+                platform: {"content": content, "media": media or None}
+                for platform, content in row["posts"].items()
+            }
+            # レート制限に達したSNSの行は失敗させず、枠が空くまで待って投稿する
+            return self.sns_client.post_to_platforms(posts, wait_for_rate_limit=True)
+        finally:
+            self.upload_store.release(media)
+
+    def run(self, rows, concurrency=None):
+        """
+        行ごとに投稿し、完了した行から順に結果を返す。
+        同時に実行する行数を超えて先の行は読み込まない。
+
+        Args:
+            rows: iter_rowsの戻り値
+            concurrency: 同時に投稿する行数（上限はmax_concurrency）
+        Returns:
+            行ごとの結果のdictのイテレータ。
+            各要素は{"row": 行番号, "id": ..., "success": ..., "results"または"error": ...}、
+            最後の要素は{"done": true, "rows": 行数, "succeeded": 成功数, "failed": 失敗数}
+        """
+        concurrency = max(1, min(concurrency or self.max_concurrency, self.max_concurrency))
+        executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="sns-bulk"
+        )
+        in_flight = {}
+        summary = {"rows": 0, "succeeded": 0, "failed": 0}
+
+        def finish(number, row_id, results=None, error=None):
+            summary["rows"] += 1
+            if error is None:
+                success = all(r.get("success", False) for r in results.values())
+                line = {"row": number, "id": row_id, "success": success, "results": results}
+            else:
+                success = False
+                line = {"row": number, "id": row_id, "success": False, "error": error}
+            summary["succeeded" if success else "failed"] += 1
+            return line
+
+        def drain():
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, row_id = in_flight.pop(future)
+                try:
+                    yield finish(number, row_id, results=future.result())
+                except Exception as e:
+                    logger.error(f"一括投稿の行{number}でエラー: {str(e)}", exc_info=True)
+                    yield finish(number, row_id, error=str(e))
+
+        try:
+            for number, row, error in rows:
+                if error is not None:
+                    yield finish(number, None, error=error)
+                    continue
+                while len(in_flight) >= concurrency:
+                    yield from drain()
+                media, error = self._resolve_media(row["media"])
+                if error is not None:
+                    yield finish(number, row["id"], error=error)
+                    continue
+                future = executor.submit(self._post_row, row, media)
+                in_flight[future] = (number, row["id"])
+            while in_flight:
+                yield from drain()
+            yield {"done": True, **summary}
+        finally:
+            # クライアントが切断した場合も、実行中の行は投稿を終えてから画像の参照を解放する
+            executor.shutdown(wait=False)
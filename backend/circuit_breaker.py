@@ -0,0 +1,183 @@
+"""
+SNSごとのサーキットブレーカー。
+ブレーカーはキー（SnsClient.circuit_keyが返す、インスタンスごとまたはアカウントごとの値）で分け、
+障害（タイムアウト・一時的なエラー・応答の遅い投稿）が続いた投稿先への投稿を一定時間止め、
+投稿ごとに期限まで待たずにすぐ失敗を返す。停止時間が過ぎると少数の投稿だけを試しに通し
+（半開）、成功すれば再開、失敗すれば再び停止する。
+認証エラーや入力エラーなどSNSが応答している失敗は障害として数えない。
+"""
+
+import logging
+import threading
+import time
+
+from constants import CIRCUIT_BREAKER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def is_failure(result, elapsed=None):
+    """
+    投稿結果がSNSの障害を表すかどうかを判定する。
+
+    Args:
+        result: 投稿結果のdict
+        elapsed: 投稿にかかった秒数（レート制限の待ちを除く、任意）
+    """
+    if result.get("timeout") or result.get("transient"):
+        return True
+    return elapsed is not None and elapsed >= CIRCUIT_BREAKER_SETTINGS["slow_call_seconds"]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, open_seconds, half_open_probes):
+        """
+        CircuitBreakerの初期化。
+
+        Args:
+            failure_threshold: 停止するまでの連続失敗回数
+            open_seconds: 停止してから試しに投稿を通すまでの秒数
+            half_open_probes: 半開状態で同時に通す投稿数
+        """
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def try_acquire(self, now):
+        """
+        投稿を通してよいか判定する。半開状態では試行の枠を1つ使う。
+        Returns:
+            通せる場合は0、停止中の場合は再開を試みるまでの秒数
+        """
+        if self.state == STATE_OPEN:
+            remaining = self.opened_at + self.open_seconds - now
+            if remaining > 0:
+                return remaining
+            self.state = STATE_HALF_OPEN
+            self.probes = 0
+        if self.state == STATE_HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                # 試行中の投稿の結果が出るまで待つ
+                return self.open_seconds
+            self.probes += 1
+        return 0
+
+    def release(self):
+        """
+        try_acquireで通した投稿を実行しなかった場合に枠を返す。
+        """
+        if self.state == STATE_HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record(self, now, failed):
+        """
+        通した投稿の結果を記録する。
+        Returns:
+            状態が変わった場合は新しい状態、変わらない場合はNone
+        """
+        if self.state == STATE_HALF_OPEN:
+            self.probes = max(0, self.probes - 1)
+        if not failed:
+            self.failures = 0
+            if self.state != STATE_CLOSED:
+                self.state = STATE_CLOSED
+                return STATE_CLOSED
+            return None
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or (
+            self.state == STATE_CLOSED and self.failures >= self.failure_threshold
+        ):
+            self.state = STATE_OPEN
+            self.opened_at = now
+            return STATE_OPEN
+        return None
+
+    def snapshot(self, now):
+        retry_after = None
+        if self.state == STATE_OPEN:
+            retry_after = max(0.0, self.opened_at + self.open_seconds - now)
+        return {"state": self.state, "failures": self.failures, "retry_after": retry_after}
+
+
+class CircuitBreakers:
+    def __init__(self, settings=None):
+        """
+        CircuitBreakersの初期化。
+
+        Args:
+            settings: CIRCUIT_BREAKER_SETTINGSと同じ形式の設定（任意）
+        """
+        self.settings = settings or CIRCUIT_BREAKER_SETTINGS
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def _breaker(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(
+                self.settings["failure_threshold"],
+                self.settings["open_seconds"],
+                self.settings["half_open_probes"],
+            )
+        return breaker
+
+    def allow(self, key):
+        """
+        投稿先（ブレーカーのキー）への投稿を通してよいか判定する。
+        通した場合は、投稿後にrecord()、実行しなかった場合はrelease()を呼ぶこと。
+
+        Returns:
+            通せる場合は0、停止中の場合は再開を試みるまでの秒数
+        """
+        with self._lock:
+            return self._breaker(key).try_acquire(time.monotonic())
+
+    def release(self, key):
+        """
+        allow()で通した投稿を実行しなかった場合（レート制限・取り消し）に枠を返す。
+        """
+        with self._lock:
+            self._breaker(key).release()
+
+    def record(self, key, result, elapsed=None):
+        """
+        allow()で通した投稿の結果を記録する。
+
+        Args:
+            key: ブレーカーのキー
+            result: 投稿結果のdict
+            elapsed: 投稿にかかった秒数（レート制限の待ちを除く、任意）
+        """
+        failed = is_failure(result, elapsed)
+        with self._lock:
+            breaker = self._breaker(key)
+            changed = breaker.record(time.monotonic(), failed)
+            failures = breaker.failures
+        if changed == STATE_OPEN:
+            logger.warning(
+                f"{key}の障害が続いているため、{self.settings['open_seconds']:g}秒間投稿を停止します"
+                f"（連続失敗{failures}回）"
+            )
+        elif changed == STATE_CLOSED:
+            logger.info(f"{key}への投稿を再開しました")
+
+    def snapshot(self, key):
+        """
+        ブレーカーの状態を返す。
+        Returns:
+            {"state": closed/open/half_open, "failures": 連続失敗回数,
+             "retry_after": 停止中の場合は再開を試みるまでの秒数}
+        """
+        with self._lock:
+            return self._breaker(key).snapshot(time.monotonic())
+
+
+circuit_breakers = CircuitBreakers()
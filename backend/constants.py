@@ -14,18 +14,181 @@ IMAGE_LIMITS = {
         "min_size": 100,  # px
         "max_attempts": 15,
         "max_images": 4,
+        "upload_concurrency": 2,  # 同時アップロード数
     },
     "mastodon": {
         "max_images": 4,
+        "upload_concurrency": 2,
     },
     "misskey": {
         "max_images": 4,
+        "upload_concurrency": 2,
     },
     "x": {
         "max_images": 4,
+        "upload_concurrency": 4,
     },
     "threads": {
         "max_images": 4,
     },
     # 他SNS用も必要に応じて追加可能
 }
+
+# 投稿処理の並列実行設定
+POST_SETTINGS = {
+    "max_workers": 10,  # 同時に投稿処理を行うワーカースレッド数
+    "default_timeout": 60,  # 秒
+}
+
+# プラットフォームごとの投稿期限（秒）
+# 環境変数 POST_TIMEOUT_<PLATFORM> で上書き可能
+POST_TIMEOUTS = {
+    "bluesky": 60,
+    "x": 60,
+    "threads": 60,
+    "misskey": 60,
+    "mastodon": 60,
+}
+
+# 各SNS APIの接続先（Misskey・Mastodonはインスタンスのアドレスを環境変数で指定する）
+# 環境変数 <NAME>_BASE_URL（例: BLUESKY_BASE_URL, X_UPLOAD_BASE_URL）で上書き可能
+API_BASE_URLS = {
+    "bluesky": "https://bsky.social/xrpc",
+    "x": "https://api.twitter.com",
+    "x_upload": "https://upload.twitter.com",
+    "threads": "https://graph.threads.net",
+}
+
+# 投稿ジョブキューの設定
+JOB_SETTINGS = {
+    "max_workers": 4,  # ジョブを並列実行するワーカースレッド数
+    "retention": 7 * 24 * 60 * 60,  # 完了したジョブを保持する秒数
+    "prune_interval": 60 * 60,  # 保持期間を過ぎたジョブを削除する間隔（秒）
+}
+
+# 予約投稿の設定
+SCHEDULER_SETTINGS = {
+    "max_workers": 2,  # 予約投稿を並列実行するワーカースレッド数
+    "catch_up_window": 24 * 60 * 60,  # 再起動時、予約時刻をこの秒数以上過ぎた予約は投稿しない
+    "max_wait": 5 * 60,  # 次の予約時刻まで1度に待つ最大秒数（時計の補正に追従するため）
+    "retention": 30 * 24 * 60 * 60,  # 実行済み・取り消した予約を保持する秒数
+}
+
+# 一括投稿（/api/bulk）の設定
+BULK_SETTINGS = {
+    "max_concurrency": 4,  # 同時に投稿する行数の上限
+    "max_row_bytes": 64 * 1024,  # 1行の最大バイト数
+}
+
+# 受け付けるアップロードの上限
+# /api/bulkは本文をストリーミングで読むため、リクエストサイズの上限を適用しない
+UPLOAD_LIMITS = {
+    "max_request_bytes": 64 * 1024 * 1024,  # 1回のリクエストの最大サイズ
+    "max_images": 10,  # 1回のリクエストで受け付ける画像の枚数
+    "max_pixels": 40_000_000,  # 1枚の画像の最大画素数（展開すると画素数×3〜4バイトになる）
+    "spool_threshold": 512 * 1024,  # 受信中の画像がこれを超えたらディスクに書き出す
+}
+
+# アップロード画像の保存設定
+UPLOAD_STORE_SETTINGS = {
+    "max_bytes": 512 * 1024 * 1024,  # 保存する画像の合計サイズ上限
+    "orphan_ttl": 24 * 60 * 60,  # 参照されていない画像を残しておく秒数
+}
+
+# アップロード済みメディアのキャッシュ有効期限（秒）
+# uploaded: アップロードしてから投稿に添付されるまで
+# posted: 投稿に添付された後（0は再利用不可としてキャッシュから外す、Noneは期限を変えない）
+MEDIA_CACHE_TTLS = {
+    # 投稿から参照されていないblobはPDSに削除されるため短めにする
+    "bluesky": {"uploaded": 60 * 60, "posted": 7 * 24 * 60 * 60},
+    # 未添付のメディアは約1日で削除され、添付済みのメディアは別の投稿に使えない
+    "mastodon": {"uploaded": 12 * 60 * 60, "posted": 0},
+    # ドライブのファイルは削除されない限り使い続けられる
+    "misskey": {"uploaded": 7 * 24 * 60 * 60, "posted": 7 * 24 * 60 * 60},
+    # media_idはアップロードから24時間で失効する
+    "x": {"uploaded": 23 * 60 * 60, "posted": None},
+}
+
+# SNS APIへのHTTP接続プールの設定
+HTTP_POOL_SETTINGS = {
+    "pool_connections": 2,  # セッション（ホスト）ごとに保持する接続プール数
+    "pool_maxsize": 10,  # 1ホストあたりの最大同時接続数
+    "connect_timeout": 5,  # 秒
+    "read_timeout": 30,  # 秒
+}
+
+# 投稿画像のバッファ設定（これを超える画像はメモリに載せず、保存済みファイルをmmapで参照する）
+MEDIA_SETTINGS = {
+    "memory_threshold": 8 * 1024 * 1024,  # 8MB
+}
+
+# 画像加工（圧縮・リサイズ）を行うプロセスプールの設定
+PREPROCESS_SETTINGS = {
+    "max_workers": 0,  # 0の場合はCPUコア数
+    # 同時に展開する画像の数（ワーカープロセスと投稿処理のスレッドで共有し、超えた分は順番待ち）
+    "max_decodes": 2,
+    # これを超える画像は縮小してデコードする（JPEGはdraft、それ以外は読み込み直後にreduce）
+    "decode_pixels": 8_000_000,
+}
+
+# /api/postのプロファイリング（profiler.py）の設定
+PROFILE_SETTINGS = {
+    "sample_rate": 0.0,  # X-Profileヘッダーなしでプロファイルを取るリクエストの割合（0は無効）
+    "interval": 0.005,  # スタックを採取する間隔（秒）
+    "max_profiles": 50,  # 保持するプロファイルの数（超えたら古いものから削除）
+    "max_depth": 128,  # 記録するスタックの深さ
+    "max_duration": 300,  # これを超えたプロファイルは記録を打ち切る（秒）
+}
+
+# /metricsで出力する所要時間ヒストグラムのバケット（秒）
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 非同期投稿エンジン（POST_ENGINE=async）のHTTP接続設定
+ASYNC_HTTP_SETTINGS = {
+    "max_connections": 100,  # 1ホストあたりの最大同時接続数
+    "max_keepalive_connections": 20,  # 1ホストあたりに保持するkeep-alive接続数
+}
+
+# Threadsのコンテナ状態確認の設定（秒）
+THREADS_SETTINGS = {
+    "poll_interval": 0.5,  # 最初の確認間隔
+    "poll_max_interval": 4,  # 確認間隔の上限
+    "poll_timeout": 30,  # コンテナの準備を待つ最大時間
+}
+
+# SNSクライアント初期化の再試行設定（秒）
+CLIENT_INIT_SETTINGS = {
+    "retry_interval": 5,  # 最初の再試行までの間隔
+    "retry_max_interval": 300,  # 再試行間隔の上限
+    "max_workers": 8,  # 並列に初期化するアカウント数
+}
+
+# SNSごとの既定のレート制限（投稿数）。レスポンスヘッダーで実際の値に更新される
+# capacity: 連続で投稿できる数 / window: capacity分が回復するまでの秒数
+# （ヘッダーの上限は、ratelimit-policyで期間が示されない限りwindowあたりの値とみなす）
+# cost: ヘッダーの上限・残りが投稿数でなくポイントの場合の1投稿あたりのポイント
+# （Blueskyは1時間5000ポイントで、createRecordは1回3ポイント）
+# retry_after: 429にRetry-After・リセット時刻がない場合に待つ秒数
+RATE_LIMITS = {
+    "bluesky": {"capacity": 1666, "window": 60 * 60, "cost": 3, "retry_after": 60},
+    "x": {"capacity": 17, "window": 24 * 60 * 60, "retry_after": 60},
+    "threads": {"capacity": 250, "window": 24 * 60 * 60, "retry_after": 60},
+    "misskey": {"capacity": 300, "window": 60 * 60, "retry_after": 60},
+    "mastodon": {"capacity": 300, "window": 3 * 60 * 60, "retry_after": 60},
+}
+
+# 一時的な障害（接続エラー・5xx）の再試行設定
+# 環境変数 POST_RETRY_MAX_ATTEMPTS で最大試行回数を上書き可能（1で再試行しない）
+RETRY_SETTINGS = {
+    "max_attempts": 3,  # 最初の1回を含む最大試行回数
+    "base_delay": 0.5,  # 1回目の再試行までの待ち時間の上限（秒）。以降は2倍ずつ伸ばす
+    "max_delay": 8,  # 待ち時間の上限（秒）
+}
+
+# SNSごとのサーキットブレーカーの設定
+CIRCUIT_BREAKER_SETTINGS = {
+    "failure_threshold": 5,  # 投稿を停止するまでの連続失敗回数
+    "slow_call_seconds": 30,  # これ以上かかった投稿は成功しても失敗として数える
+    "open_seconds": 30,  # 停止してから試しに投稿を通すまでの秒数
+    "half_open_probes": 1,  # 試しに同時に通す投稿数
+}
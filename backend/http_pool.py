@@ -0,0 +1,210 @@
+"""
+SNS APIへのHTTP接続を共有するセッションプール。
+ホストごとにrequests.Sessionを1つ持ち、keep-aliveで接続を再利用する。
+タイムアウトが指定されていないリクエストには既定の接続/読み取りタイムアウトを付与する。
+"""
+
+import os
+import threading
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from constants import API_BASE_URLS, ASYNC_HTTP_SETTINGS, HTTP_POOL_SETTINGS
+
+
+def api_base_url(name):
+    """
+    SNS APIの接続先を返す。
+    環境変数 <NAME>_BASE_URL が設定されていればそちらを優先する（ベンチマーク用の代替サーバーなど）。
+
+    Args:
+        name: API_BASE_URLSのキー
+    Returns:
+        末尾の/を除いたベースURL
+    """
+    return os.getenv(f"{name.upper()}_BASE_URL", API_BASE_URLS[name]).rstrip("/")
+
+
+def _pool_key(url, account=None):
+    """
+    接続を共有する単位（ホスト、アカウントを指定した場合はホストとアカウント）のキーを返す。
+    """
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    key = f"{parsed.scheme}://{parsed.netloc}"
+    return f"{key} ({account})" if account else key
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    タイムアウト未指定のリクエストに既定値を設定するアダプタ。
+    """
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class RebaseHTTPAdapter(TimeoutHTTPAdapter):
+    """
+    接続先が固定されたSDK（tweepyなど）のリクエストを、別のベースURLへ送るアダプタ。
+    """
+
+    def __init__(self, prefix, base_url, timeout, **kwargs):
+        self.prefix = prefix
+        self.base_url = base_url
+        super().__init__(timeout, **kwargs)
+
+    def send(self, request, **kwargs):
+        if request.url.startswith(self.prefix):
+            request.url = self.base_url + request.url[len(self.prefix) :]
+        return super().send(request, **kwargs)
+
+
+class HttpPool:
+    def __init__(
+        self,
+        pool_connections=None,
+        pool_maxsize=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ):
+        """
+        HttpPoolの初期化。
+
+        Args:
+            pool_connections: セッションごとに保持する接続プール数
+            pool_maxsize: 1ホストあたりの最大接続数
+            connect_timeout: 接続タイムアウト（秒）
+            read_timeout: 読み取りタイムアウト（秒）
+        """
+        self.pool_connections = pool_connections or HTTP_POOL_SETTINGS["pool_connections"]
+        self.pool_maxsize = pool_maxsize or HTTP_POOL_SETTINGS["pool_maxsize"]
+        self.timeout = (
+            connect_timeout or HTTP_POOL_SETTINGS["connect_timeout"],
+            read_timeout or HTTP_POOL_SETTINGS["read_timeout"],
+        )
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def session(self, url, account=None):
+        """
+        URLのホストに対応する共有セッションを返す（なければ作成する）。
+        accountを指定した場合はアカウントごとに別のセッションを返す
+        （レート制限を把握するフックなどをアカウントごとに設定するため）。
+
+        Args:
+            url: 接続先のURL（ベースURLで可）
+            account: アカウント名（任意）
+        Returns:
+            requests.Session
+        """
+        key = _pool_key(url, account)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = TimeoutHTTPAdapter(
+                    self.timeout,
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[key] = session
+            return session
+
+    def stats(self):
+        """
+        ホストごとのリクエスト数・新規接続数・接続再利用数を返す。
+        """
+        stats = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+        for key, session in sessions.items():
+            requests_count = 0
+            connections = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in pools.keys():
+                    pool = pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+            stats[key] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(0, requests_count - connections),
+            }
+        return stats
+
+
+class AsyncHttpPool:
+    """
+    非同期投稿エンジン用のHTTP接続プール。
+    ホストごとにhttpx.AsyncClientを1つ持つ。AsyncClientは作成したイベントループに
+    結び付くため、1つのイベントループ（投稿エンジンのループ）からのみ使う。
+    """
+
+    def __init__(self, max_connections=None, connect_timeout=None, read_timeout=None):
+        """
+        AsyncHttpPoolの初期化。
+
+        Args:
+            max_connections: 1ホストあたりの最大同時接続数
+            connect_timeout: 接続タイムアウト（秒）
+            read_timeout: 読み取りタイムアウト（秒）
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections or ASYNC_HTTP_SETTINGS["max_connections"],
+            max_keepalive_connections=ASYNC_HTTP_SETTINGS["max_keepalive_connections"],
+        )
+        self.timeout = httpx.Timeout(
+            read_timeout or HTTP_POOL_SETTINGS["read_timeout"],
+            connect=connect_timeout or HTTP_POOL_SETTINGS["connect_timeout"],
+        )
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def client(self, url, account=None):
+        """
+        URLのホストに対応する共有クライアントを返す（なければ作成する）。
+        accountを指定した場合はアカウントごとに別のクライアントを返す。
+
+        Args:
+            url: 接続先のURL（ベースURLで可）
+            account: アカウント名（任意）
+        Returns:
+            httpx.AsyncClient
+        """
+        key = _pool_key(url, account)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                self._clients[key] = client
+            return client
+
+    async def aclose(self):
+        """
+        すべてのクライアントの接続を閉じる。
+        """
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+http_pool = HttpPool(
+    pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "0")) or None,
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "0")) or None,
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "0")) or None,
+)
@@ -0,0 +1,218 @@
+"""
+画像をサイズ上限以下に圧縮する処理。
+再エンコードの回数を抑えるため、サイズ比から縮小率を見積もり、
+JPEG品質は補間による探索で決める。大きなJPEGはdraftで縮小デコードする。
+画素数が上限を超える画像は展開する前（ヘッダーを読んだ時点）で拒否する。
+"""
+
+import io
+import math
+import os
+
+from PIL import Image
+
+from constants import PREPROCESS_SETTINGS, UPLOAD_LIMITS
+from media import BufferReader
+
+# 画素数はmax_image_pixelsで判定する。Pillowの上限（既定で約1.8億画素を超えると
+# DecompressionBombError）は画像を開く前に送出され画素数が分からないため無効にする
+Image.MAX_IMAGE_PIXELS = None
+
+DEFAULT_QUALITY = 85
+MIN_QUALITY = 30
+# 品質探索の最大ステップ数
+QUALITY_SEARCH_STEPS = 4
+# 上限に対してこの割合以上まで埋まれば探索を打ち切る
+FILL_RATIO = 0.75
+# 品質を最低まで下げたときのおおよそのサイズ比（品質85比）
+MIN_QUALITY_SIZE_RATIO = 0.2
+# 見積もりの誤差を吸収するための係数
+SCALE_MARGIN = 0.92
+
+
+class ImageTooLargeError(ValueError):
+    """
+    画像の画素数が上限を超えている場合の例外。
+    """
+
+
+def max_image_pixels():
+    """
+    1枚の画像の最大画素数を返す。
+    環境変数 MAX_IMAGE_PIXELS が設定されていればそちらを優先する。
+    """
+    return int(os.getenv("MAX_IMAGE_PIXELS", "0")) or UPLOAD_LIMITS["max_pixels"]
+
+
+def _check_pixels(img):
+    w, h = img.size
+    limit = max_image_pixels()
+    if w * h > limit:
+        raise ImageTooLargeError(
+            f"画像の画素数({w}x{h})が上限({limit:,}画素)を超えています"
+        )
+
+
+def open_image(img_bytes):
+    """
+    画像のヘッダーだけを読み込んで開く（画素の展開はしない）。
+
+    Args:
+        img_bytes: 画像のバイト列（bytes / memoryviewなど、複製せずに読み込む）
+    Returns:
+        PIL.Image
+    Raises:
+        ImageTooLargeError: 画素数が上限を超えている場合
+    """
+    img = Image.open(BufferReader(img_bytes))
+    _check_pixels(img)
+    return img
+
+
+def check_image(stream):
+    """
+    アップロードされた画像の画素数が上限以下か、ヘッダーだけを読んで確認する。
+    Pillowで開けないファイルは判定せずに通す（各SNSのアップロードで扱う）。
+    確認後はstreamの読み取り位置を先頭に戻す。
+
+    Args:
+        stream: 画像のストリーム（werkzeugのFileStorage.streamなど）
+    Returns:
+        上限を超えている場合はエラーメッセージ、それ以外はNone
+    """
+    try:
+        with Image.open(stream) as img:
+            _check_pixels(img)
+    except ImageTooLargeError as e:
+        return str(e)
+    except (OSError, ValueError):
+        pass
+    finally:
+        stream.seek(0)
+    return None
+
+
+def _encode(img, format, quality, stats):
+    """
+    画像を指定フォーマット・品質でエンコードする。
+    """
+    buf = io.BytesIO()
+    img.save(buf, format=format, quality=quality, optimize=True)
+    if stats is not None:
+        stats["encodes"] = stats.get("encodes", 0) + 1
+    return buf
+
+
+def _resize(img, scale):
+    """
+    画像を指定倍率で縮小する。
+    """
+    w, h = img.size
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _search_quality(img, size, max_size, attempts, max_attempts, stats):
+    """
+    上限に収まる範囲でできるだけ高いJPEG品質を探す。
+    サイズの対数が品質にほぼ比例すると見なして区間を補間し、二分探索より少ない回数で絞り込む。
+
+    Args:
+        img: 画像
+        size: 品質DEFAULT_QUALITYでのエンコードサイズ
+        max_size: バイト単位の最大サイズ
+        attempts: ここまでのエンコード回数
+        max_attempts: 最大エンコード回数
+        stats: エンコード回数を記録するdict
+    Returns:
+        (収まったバッファ or None, エンコード回数)
+    """
+    lo_q, lo_s = MIN_QUALITY, size * MIN_QUALITY_SIZE_RATIO
+    hi_q, hi_s = DEFAULT_QUALITY, size
+    target = max_size * 0.97
+    best = None
+    for _ in range(QUALITY_SEARCH_STEPS):
+        if hi_q - lo_q <= 1 or attempts >= max_attempts:
+            break
+        ratio = math.log(target / lo_s) / math.log(hi_s / lo_s)
+        quality = int(lo_q + ratio * (hi_q - lo_q))
+        quality = min(hi_q - 1, max(lo_q if best is None else lo_q + 1, quality))
+        buf = _encode(img, "JPEG", quality, stats)
+        attempts += 1
+        if buf.tell() <= max_size:
+            best, lo_q, lo_s = buf, quality, buf.tell()
+            if lo_s >= max_size * FILL_RATIO:
+                break
+        else:
+            hi_q, hi_s = quality, buf.tell()
+            if best is None and quality == MIN_QUALITY:
+                break
+    return best, attempts
+
+
+def _reduce_decode(img, img_bytes, max_size):
+    """
+    必要な解像度に近いサイズで画像を読み込む。
+    JPEGはdraftで縮小デコードし（縮小率は1/2、1/4、1/8のみ）、それ以外の形式は
+    読み込み直後に縮小して、以降の処理で扱う画素数をdecode_pixels程度に抑える。
+    """
+    w, h = img.size
+    scale = min(1.0, math.sqrt(PREPROCESS_SETTINGS["decode_pixels"] / (w * h)))
+    if img.format == "JPEG":
+        if len(img_bytes) > max_size:
+            # サイズはおおよそ画素数に比例するので、比率から必要な解像度を見積もる
+            scale = min(scale, math.sqrt(max_size / len(img_bytes)))
+        if scale <= 0.5:
+            img.draft("RGB", (int(w * scale), int(h * scale)))
+        return img
+    if scale < 1.0:
+        reduced = _resize(img, scale)
+        img.close()
+        return reduced
+    return img
+
+
+def compress_image(img_bytes, max_size, min_size, max_attempts, stats=None):
+    """
+    画像をmax_sizeバイト以下に圧縮する。
+
+    Args:
+        img_bytes: 元画像のバイト列（bytes / memoryviewなど、複製せずに読み込む）
+        max_size: バイト単位の最大サイズ
+        min_size: 最小幅・高さ
+        max_attempts: 最大エンコード回数
+        stats: エンコード回数を記録するdict（任意）
+    Returns:
+        (buf, format) or (None, None)
+    Raises:
+        ImageTooLargeError: 画素数が上限を超えている場合
+    """
+    img = open_image(img_bytes)
+    format = img.format if img.format in ["JPEG", "PNG"] else "JPEG"
+    img = _reduce_decode(img, img_bytes, max_size)
+    if format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    attempts = 0
+    while attempts < max_attempts:
+        buf = _encode(img, format, DEFAULT_QUALITY, stats)
+        attempts += 1
+        size = buf.tell()
+        if size <= max_size:
+            buf.seek(0)
+            return buf, format
+
+        if format == "JPEG" and size * MIN_QUALITY_SIZE_RATIO <= max_size:
+            # 品質を下げれば収まる見込みがある場合は、品質を補間探索する
+            best, attempts = _search_quality(img, size, max_size, attempts, max_attempts, stats)
+            if best is not None:
+                best.seek(0)
+                return best, format
+
+        # サイズはおおよそ画素数に比例するので、比率から縮小率を見積もる
+        w, h = img.size
+        if w < min_size or h < min_size:
+            break
+        scale = min(0.9, math.sqrt(max_size / size) * SCALE_MARGIN)
+        img = _resize(img, scale)
+    return None, None
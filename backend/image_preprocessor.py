@@ -0,0 +1,200 @@
+"""
+投稿前の画像加工（SNSごとのサイズ上限に合わせた圧縮・リサイズ）をプロセスプールで行う。
+Pillowの処理をリクエストのスレッドから切り離してCPUコア数まで並列化し、
+通信処理とGILを取り合わないようにする。
+加工は投稿を受け付けた時点で画像ごとに開始し、各アップロードは
+自分の画像の加工が終わり次第始められる（他の画像の加工を待たない）。
+同時に展開する画像の数はプロセス間で共有するセマフォで制限し、
+大きな画像が重なってもメモリの使用量がおおよそ一定に収まるようにする。
+"""
+
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from constants import IMAGE_LIMITS, PREPROCESS_SETTINGS
+from metrics import phase_duration
+
+logger = logging.getLogger(__name__)
+
+
+def max_decodes():
+    """
+    同時に展開する画像の数を返す。
+    環境変数 IMAGE_MAX_DECODES が設定されていればそちらを優先する。
+    """
+    return int(os.getenv("IMAGE_MAX_DECODES", "0")) or PREPROCESS_SETTINGS["max_decodes"]
+
+
+# 画像を展開する枠（ワーカープロセスには_init_workerで同じセマフォを渡す）
+_decode_slots = multiprocessing.BoundedSemaphore(max_decodes())
+
+
+def _init_worker(decode_slots):
+    global _decode_slots
+    _decode_slots = decode_slots
+
+
+def _open_source(source):
+    """
+    加工元の画像をバッファとして返す（ファイルパスの場合はmmapで開く）。
+    """
+    if not isinstance(source, str):
+        return source
+    with open(source, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def compress_variant(source, filename, max_size, min_size, max_attempts):
+    """
+    画像をmax_sizeバイト以下に圧縮する（ワーカープロセスで実行される）。
+
+    Args:
+        source: 画像データ（bytes / memoryview）またはファイルパス
+        filename: エラーメッセージに使うファイル名
+        max_size: バイト単位の最大サイズ
+        min_size: 最小幅・高さ
+        max_attempts: 最大エンコード回数
+    Returns:
+        (圧縮後のbytes, format) or (None, error_message)
+    """
+    # Pillowは画像を加工するプロセスでだけ読み込む（圧縮が必要なSNSを使わない場合は不要）
+    from image_compressor import compress_image
+
+    try:
+        # 展開の枠が空くまで待つ（待っている間は画像を読み込まない）
+        with _decode_slots:
+            buf, format = compress_image(
+                _open_source(source), max_size, min_size, max_attempts
+            )
+        if buf is not None:
+            return buf.getvalue(), format
+        return None, f"画像が制限({max_size // 1024}KB)以下になりません: {filename}"
+    except Exception as e:
+        return None, str(e)
+
+
+def _ready():
+    return True
+
+
+class ImagePreprocessor:
+    def __init__(self, max_workers=None):
+        """
+        ImagePreprocessorの初期化。プロセスはstart()または最初の加工時に起動する。
+
+        Args:
+            max_workers: ワーカープロセス数（省略時はCPUコア数）
+        """
+        self.max_workers = (
+            max_workers or PREPROCESS_SETTINGS["max_workers"] or os.cpu_count() or 1
+        )
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(_decode_slots,),
+        )
+
+    def start(self):
+        """
+        ワーカープロセスを起動しておく。
+        fork方式ではスレッドが動き出す前に起動するのが安全なため、アプリ起動時に呼ぶ。
+        """
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = self._new_executor()
+            executor = self._executor
+        for future in [executor.submit(_ready) for _ in range(self.max_workers)]:
+            future.result()
+
+    def _submit(self, *args):
+        for attempt in range(2):
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._new_executor()
+                executor = self._executor
+            try:
+                return executor.submit(compress_variant, *args)
+            except BrokenProcessPool:
+                # ワーカーが異常終了した場合はプールを作り直す。
+                # 終了したワーカーが展開の枠を持ったままの場合があるので、セマフォも作り直す
+                logger.warning("画像加工のプロセスプールを再起動します")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                        _init_worker(multiprocessing.BoundedSemaphore(max_decodes()))
+                if attempt:
+                    raise
+
+    def submit(self, media, max_size, min_size, max_attempts):
+        """
+        1枚の画像の圧縮をワーカープロセスで開始する。
+
+        Args:
+            media: 画像（Media）
+            max_size: バイト単位の最大サイズ
+            min_size: 最小幅・高さ
+            max_attempts: 最大エンコード回数
+        Returns:
+            (圧縮後のbytes, format) or (None, error_message) を結果とするFuture
+        """
+        return self._submit(
+            media.source(), media.filename, max_size, min_size, max_attempts
+        )
+
+    def prepare(self, platform, media, skip=None):
+        """
+        SNSに合わせた画像の加工を開始する。
+        サイズ上限（IMAGE_LIMITSのmax_size）がないSNSには元の画像をそのまま使うため加工しない。
+
+        Args:
+            platform: SNS名
+            media: 画像（Media）のリスト
+            skip: 加工を省略する画像を判定する関数（アップロード済みの画像など、任意）
+        Returns:
+            画像ごとのFuture（省略した画像はNone）のリスト、加工が不要なSNSはNone
+        """
+        limits = IMAGE_LIMITS.get(platform, {})
+        if not media or "max_size" not in limits:
+            return None
+        variants = []
+        for item in media:
+            if skip and skip(item):
+                variants.append(None)
+                continue
+            variant = self.submit(
+                item, limits["max_size"], limits["min_size"], limits["max_attempts"]
+            )
+            self._observe(variant, platform)
+            variants.append(variant)
+        return variants
+
+    def _observe(self, variant, platform):
+        """
+        加工の所要時間（プールの待ちを含む）をcompress段階として記録する。
+        取り消された加工は記録しない。
+        """
+        start = time.perf_counter()
+
+        def done(future):
+            if not future.cancelled():
+                phase_duration.observe(
+                    time.perf_counter() - start, platform=platform, phase="compress"
+                )
+
+        variant.add_done_callback(done)
+
+
+image_preprocessor = ImagePreprocessor(
+    max_workers=int(os.getenv("IMAGE_WORKERS", "0")) or None
+)
@@ -0,0 +1,179 @@
+"""
+投稿ジョブのキュー。
+/api/postをジョブモードで受け付け、プロセス内のワーカープールで投稿を実行する。
+ジョブの進捗と結果はローカルのSQLiteに保存する。
+投稿内容（本文・画像）は保存しないため、プロセスの再起動で完了しなかったジョブは
+再実行せず中断扱いにする。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import JOB_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, sns_client, db_path, max_workers=None):
+        """
+        JobQueueの初期化。
+
+        Args:
+            sns_client: 投稿に使うSnsClient
+            db_path: ジョブを保存するSQLiteファイルのパス
+            max_workers: ジョブを実行するワーカースレッド数
+        """
+        self.sns_client = sns_client
+        self.db_path = db_path
+        if max_workers is None:
+            max_workers = JOB_SETTINGS["max_workers"]
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._pruned_at = 0.0
+        self._init_db()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sns-job"
+        )
+
+    def _init_db(self):
+        """
+        テーブルを作成し、前回プロセスで完了しなかったジョブを中断扱いにする。
+        保持期間を過ぎたジョブは削除する。
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    results TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = 'interrupted', updated_at = ? "
+                "WHERE status IN ('queued', 'running')",
+                (now,),
+            )
+            self._prune(now)
+
+    def _prune(self, now):
+        """
+        保持期間を過ぎた終了済みのジョブを削除する（ロック取得済みのトランザクション内で呼ぶこと）。
+        """
+        self._conn.execute(
+            "DELETE FROM jobs WHERE updated_at < ? AND status NOT IN ('queued', 'running')",
+            (now - JOB_SETTINGS["retention"],),
+        )
+        self._pruned_at = now
+
+    def _update(self, job_id, **fields):
+        """
+        ジョブの列を更新する。dict/listの値はJSONに変換して保存する。
+        """
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        values = [
+            json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+            for v in fields.values()
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", (*values, job_id)
+            )
+
+    def submit(self, posts, on_complete=None):
+        """
+        投稿ジョブを登録し、ワーカープールに投入する。
+        長時間動き続けるプロセスでもデータベースが大きくならないよう、
+        前回からprune_interval以上経っていれば保持期間を過ぎたジョブを削除する。
+
+        Args:
+            posts: プラットフォーム名をキー、{"content":..., "media":...}を値とする辞書
+            on_complete: ジョブ終了時に呼ばれるコールバック（任意）
+        Returns:
+            ジョブID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        progress = {platform: {"status": "pending"} for platform in posts}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, progress, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(progress), now, now),
+            )
+            if now - self._pruned_at >= JOB_SETTINGS["prune_interval"]:
+                self._prune(now)
+        self.executor.submit(self._run, job_id, posts, progress, on_complete)
+        return job_id
+
+    def _run(self, job_id, posts, progress, on_complete):
+        """
+        ジョブを実行し、プラットフォームごとの進捗を逐次保存する。
+        """
+        try:
+            self._update(job_id, status="running")
+            results = {}
+            # ジョブはリクエストの応答を待たせないため、レート制限の枠が空くまで待って投稿する
+            for platform, result in self.sns_client.iter_post_to_platforms(
+                posts, wait_for_rate_limit=True
+            ):
+                results[platform] = result
+                progress[platform] = {"status": "done", **result}
+                self._update(job_id, progress=progress)
+            for platform, state in progress.items():
+                if state["status"] == "pending":
+                    state["status"] = "skipped"
+            results = {p: results[p] for p in posts if p in results}
+            self._update(job_id, status="done", progress=progress, results=results)
+        except Exception as e:
+            logger.error(f"ジョブ実行エラー({job_id}): {str(e)}", exc_info=True)
+            self._update(job_id, status="failed", error=str(e))
+        finally:
+            if on_complete:
+                on_complete()
+
+    def get(self, job_id):
+        """
+        ジョブの状態を取得する。
+
+        Args:
+            job_id: ジョブID
+        Returns:
+            ジョブ情報のdict、存在しない場合はNone
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        results = json.loads(row["results"]) if row["results"] else None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]),
+            "results": results,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if results is not None:
+            job["success"] = all(r.get("success", False) for r in results.values())
+        if row["error"]:
+            job["error"] = row["error"]
+        return job
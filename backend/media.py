@@ -0,0 +1,169 @@
+"""
+投稿に添付する画像1枚分のデータ。
+アップロードされた画像を1度だけ読み込み、読み取り専用のバッファとして全SNSで共有する。
+一定サイズ以下はメモリ上のbytes、それを超える画像は保存済みファイルのmmapで保持し、
+各Posterにはファイルパスではなくバッファのビュー（memoryview / 読み取り用ストリーム）を渡す。
+"""
+
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+
+from constants import MEDIA_SETTINGS
+
+# 先頭バイトから判定する画像形式（拡張子がない場合に使う）
+MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def memory_threshold():
+    """
+    メモリ上に保持する画像サイズの上限（バイト）を返す。
+    環境変数 MEDIA_MEMORY_THRESHOLD が設定されていればそちらを優先する。
+    """
+    return int(os.getenv("MEDIA_MEMORY_THRESHOLD", "0")) or MEDIA_SETTINGS["memory_threshold"]
+
+
+class BufferReader(io.RawIOBase):
+    """
+    バッファを複製せずに読み取るストリーム。
+    読み取り位置はストリームごとに持つため、複数のSNSへ並列に渡せる。
+    """
+
+    def __init__(self, buffer, name=None):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+        if name:
+            self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._view[self._pos : self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        chunk = self._view[self._pos : end]
+        self._pos += len(chunk)
+        return bytes(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def __len__(self):
+        return len(self._view)
+
+
+class Media:
+    def __init__(self, buffer, digest, path=None, filename=None):
+        """
+        Mediaの初期化。通常はload()またはUploadStore.save()で生成する。
+
+        Args:
+            buffer: 画像データ（bytesまたは読み取り専用のmmap）
+            digest: 画像内容のSHA-256（16進文字列）
+            path: 保存先のファイルパス（UploadStoreの参照解放・ジョブの永続化に使う）
+            filename: アップロード時のファイル名
+        """
+        self._buffer = buffer
+        self.digest = digest
+        self.path = path
+        self.filename = filename or (os.path.basename(path) if path else digest)
+        self._md5 = None
+
+    @classmethod
+    def load(cls, path, digest=None):
+        """
+        保存済みのファイルからMediaを生成する。
+        上限以下のファイルは1度だけ読み込み、それを超えるファイルはmmapで参照する。
+
+        Args:
+            path: ファイルパス
+            digest: 内容のSHA-256（省略時は計算する）
+        Returns:
+            Media
+        """
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > memory_threshold():
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+        if digest is None:
+            digest = hashlib.sha256(buffer).hexdigest()
+        return cls(buffer, digest, path=path)
+
+    @property
+    def size(self):
+        return len(self._buffer)
+
+    @property
+    def md5(self):
+        """
+        内容のMD5（Misskeyのドライブ検索用）。初回のみ計算する。
+        """
+        if self._md5 is None:
+            self._md5 = hashlib.md5(self._buffer).hexdigest()
+        return self._md5
+
+    @property
+    def mime_type(self):
+        """
+        画像のMIMEタイプ。拡張子から判定できない場合は先頭バイトから判定する。
+        """
+        mime_type = mimetypes.guess_type(self.filename)[0]
+        if mime_type:
+            return mime_type
+        head = bytes(self._buffer[:12])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        for magic, mime_type in MAGIC_NUMBERS:
+            if head.startswith(magic):
+                return mime_type
+        return "application/octet-stream"
+
+    def source(self):
+        """
+        別プロセスに渡すための参照を返す。
+        メモリ上の画像はbytes、mmapで参照している画像はファイルパス（大きなデータをpickleしない）。
+        """
+        if isinstance(self._buffer, mmap.mmap):
+            return self.path
+        return self._buffer
+
+    def view(self):
+        """
+        画像データの読み取り専用ビューを返す（複製しない）。
+        """
+        return memoryview(self._buffer).toreadonly()
+
+    def open(self):
+        """
+        画像データを読み取るストリームを返す（呼び出しごとに独立した読み取り位置を持つ）。
+        """
+        return BufferReader(self._buffer, name=self.filename)
+
+    def __repr__(self):
+        return f"Media({self.filename!r}, {self.size} bytes)"
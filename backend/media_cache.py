@@ -0,0 +1,147 @@
+"""
+アップロード済みメディアのキャッシュ。
+画像内容のハッシュから各SNS上の参照（Blueskyのblob、Mastodon/Xのmedia_id、
+Misskeyのドライブfile_id）を引けるようにし、同じ画像の再アップロードを省く。
+有効期限は各SNSでメディアが保持される期間に合わせる（MEDIA_CACHE_TTLS）。
+"""
+
+import threading
+import time
+
+from constants import MEDIA_CACHE_TTLS
+
+
+class MediaCache:
+    def __init__(self, ttls=None):
+        """
+        MediaCacheの初期化。
+
+        Args:
+            ttls: プラットフォームごとの有効期限設定（省略時はMEDIA_CACHE_TTLS）
+        """
+        self.ttls = ttls or MEDIA_CACHE_TTLS
+        self._lock = threading.Lock()
+        # (platform, account, digest) -> (参照, 有効期限)
+        self._entries = {}
+
+    def get(self, platform, digest, account="default"):
+        """
+        キャッシュ済みの参照を取得する。期限切れの場合はNoneを返す。
+        """
+        key = (platform, account, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            ref, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            return ref
+
+    def take(self, platform, digest, account="default"):
+        """
+        キャッシュ済みの参照を取得する。
+        添付後に再利用できないSNS（posted=0）では、同時に投稿される別の投稿が同じ参照を
+        使わないようキャッシュから取り出す（投稿に失敗した場合はputで戻すこと）。
+
+        Returns:
+            (参照, 有効期限) or None
+        """
+        key = (platform, account, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            if self.ttls[platform]["posted"] == 0:
+                del self._entries[key]
+            return entry
+
+    def put(self, platform, digest, ref, account="default", expires_at=None):
+        """
+        アップロード直後の参照を登録する。
+        takeで取り出した参照を戻す場合は、取り出したときの有効期限を渡す。
+        """
+        if expires_at is None:
+            self._set(platform, digest, ref, account, self.ttls[platform]["uploaded"])
+            return
+        with self._lock:
+            if expires_at > time.time():
+                self._entries[(platform, account, digest)] = (ref, expires_at)
+
+    def mark_posted(self, platform, digests, account="default"):
+        """
+        投稿に添付されたメディアの有効期限を更新する。
+        添付後に再利用できないSNS（posted=0）ではキャッシュから外し、
+        期限がアップロード時点から決まるSNS（posted=None）では何もしない。
+        """
+        ttl = self.ttls[platform]["posted"]
+        if ttl is None:
+            return
+        for digest in digests:
+            ref = self.get(platform, digest, account)
+            if ref is None:
+                continue
+            if ttl > 0:
+                self._set(platform, digest, ref, account, ttl)
+            else:
+                self.invalidate(platform, digest, account)
+
+    def invalidate(self, platform, digest, account="default"):
+        """
+        参照をキャッシュから削除する。
+        """
+        with self._lock:
+            self._entries.pop((platform, account, digest), None)
+
+    def for_account(self, account):
+        """
+        アカウントを固定したキャッシュのビューを返す（Posterにはアカウントごとにこれを渡す）。
+        """
+        return AccountMediaCache(self, account)
+
+    def _set(self, platform, digest, ref, account, ttl):
+        with self._lock:
+            self._entries[(platform, account, digest)] = (ref, time.time() + ttl)
+            self._purge_expired()
+
+    def _purge_expired(self):
+        """
+        期限切れのエントリを削除する（ロック取得済みで呼ぶこと）。
+        """
+        now = time.time()
+        expired = [key for key, (_, exp) in self._entries.items() if exp <= now]
+        for key in expired:
+            del self._entries[key]
+
+
+class AccountMediaCache:
+    """
+    1つのアカウント用のMediaCacheのビュー。
+    アップロード先のメディアはアカウントごとに別物のため、キャッシュもアカウントごとに分ける。
+    """
+
+    def __init__(self, cache, account):
+        self.cache = cache
+        self.account = account
+
+    def get(self, platform, digest):
+        return self.cache.get(platform, digest, self.account)
+
+    def take(self, platform, digest):
+        return self.cache.take(platform, digest, self.account)
+
+    def put(self, platform, digest, ref, expires_at=None):
+        self.cache.put(platform, digest, ref, self.account, expires_at)
+
+    def mark_posted(self, platform, digests):
+        self.cache.mark_posted(platform, digests, self.account)
+
+    def invalidate(self, platform, digest):
+        self.cache.invalidate(platform, digest, self.account)
+
+
+media_cache = MediaCache()
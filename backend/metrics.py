@@ -0,0 +1,247 @@
+"""
+投稿処理の計測値（Prometheus形式）。
+SNSごと・処理段階（compress / upload / publish など）ごとの所要時間のヒストグラム、
+成功・失敗（エラー種別ごと）のカウンタ、処理中の件数のゲージを保持し、
+/metricsでテキスト形式（exposition format 0.0.4）として出力する。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from constants import METRICS_BUCKETS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames:
+            # ラベルのない計測値は観測前から0として出力する
+            self._values[()] = self._initial()
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}のラベルが一致しません: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """
+        ブロックを実行している間だけ値を1増やす。
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        self.buckets = tuple(sorted(buckets or METRICS_BUCKETS)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def _initial(self):
+        # [各バケットの件数..., 合計値, 件数]
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = self._initial()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        ブロックの所要時間（秒）を記録する。
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value[-2])}")
+        lines.append(f"{self.name}_count{labels} {value[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        登録済みのすべての計測値をテキスト形式で返す。
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+post_batch_duration = registry.histogram(
+    "sns_post_batch_duration_seconds",
+    "1回の投稿リクエスト（選択された全SNS）の所要時間",
+)
+post_batches_in_flight = registry.gauge(
+    "sns_post_batches_in_flight",
+    "処理中の投稿リクエスト数",
+)
+post_duration = registry.histogram(
+    "sns_post_duration_seconds",
+    "SNSごとの投稿の所要時間（レート制限の待ちを含む）",
+    ["platform"],
+)
+phase_duration = registry.histogram(
+    "sns_post_phase_duration_seconds",
+    "SNSごと・処理段階ごとの所要時間",
+    ["platform", "phase"],
+)
+posts_in_flight = registry.gauge(
+    "sns_posts_in_flight",
+    "SNSごとの処理中の投稿数",
+    ["platform"],
+)
+post_results = registry.counter(
+    "sns_posts_total",
+    "SNSごとの投稿結果（失敗はエラー種別ごと）",
+    ["platform", "result", "error_class"],
+)
+post_retries = registry.counter(
+    "sns_post_retries_total",
+    "SNSごとの一時的な障害による再試行の回数",
+    ["platform"],
+)
+
+
+def time_phase(platform, phase):
+    """
+    処理段階の所要時間を記録するコンテキストマネージャを返す。
+
+    Args:
+        platform: SNS名
+        phase: 処理段階（compress / upload / publish / rate_limit_wait）
+    """
+    return phase_duration.time(platform=platform, phase=phase)
+
+
+def record_result(platform, result):
+    """
+    投稿結果を成功・失敗のカウンタに記録する。
+    失敗の種別は結果のerror_type、なければタイムアウト・レート制限・APIエラーに分類する。
+
+    Args:
+        platform: SNS名
+        result: 投稿結果のdict
+    """
+    if result.get("success"):
+        post_results.inc(platform=platform, result="success", error_class="")
+        return
+    if result.get("error_type"):
+        error_class = result["error_type"]
+    elif result.get("timeout"):
+        error_class = "Timeout"
+    elif result.get("rate_limited"):
+        error_class = "RateLimited"
+    else:
+        error_class = "ApiError"
+    post_results.inc(platform=platform, result="error", error_class=error_class)
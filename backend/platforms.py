@@ -0,0 +1,114 @@
+"""
+対応しているSNSの一覧。
+SNSごとにアカウントの設定項目・文字数制限・画像の制限と、Posterを生成する関数を持つ。
+Posterのモジュール（と各SNSのSDK）は、そのSNSのアカウントが設定されている場合だけ
+最初のPoster生成時に読み込むため、使わないSNSのSDKは起動時に読み込まれない。
+新しいSNSを追加する場合は、PLATFORMSに1行追加し、Posterのモジュールにcreate_posterを実装する。
+"""
+
+import importlib
+
+from constants import CHARACTER_LIMITS, IMAGE_LIMITS
+
+
+class Platform:
+    def __init__(self, name, fields, poster, async_poster):
+        """
+        Platformの初期化。
+
+        Args:
+            name: SNS名
+            fields: アカウントの設定項目と、ACCOUNTS_FILEがない場合に読む環境変数
+            poster: 同期版のPosterを生成する関数（"モジュール名:関数名"）
+            async_poster: 非同期版のPosterを生成する関数（"モジュール名:関数名"）
+        """
+        self.name = name
+        self.fields = fields
+        self.poster = poster
+        self.async_poster = async_poster
+
+    @property
+    def limit(self):
+        """
+        文字数制限。
+        """
+        return CHARACTER_LIMITS[self.name]
+
+    @property
+    def image_limits(self):
+        """
+        画像の制限（IMAGE_LIMITS）。
+        """
+        return IMAGE_LIMITS.get(self.name, {})
+
+    @property
+    def needs_preprocess(self):
+        """
+        投稿前に画像の圧縮（ワーカープロセス）が必要かどうか。
+        """
+        return "max_size" in self.image_limits
+
+    def poster_factory(self, engine="thread"):
+        """
+        Posterを生成する関数を返す（Posterのモジュールはここで初めて読み込む）。
+
+        Args:
+            engine: 投稿エンジン（thread / async）
+        Returns:
+            create_poster関数
+        """
+        path = self.async_poster if engine == "async" else self.poster
+        module, _, name = path.partition(":")
+        return getattr(importlib.import_module(module), name)
+
+
+PLATFORMS = {
+    platform.name: platform
+    for platform in [
+        Platform(
+            "bluesky",
+            {"username": "BLUESKY_USERNAME", "password": "BLUESKY_PASSWORD"},
+            "sns_posters.bluesky:create_poster",
+            "async_posters.bluesky:create_poster",
+        ),
+        Platform(
+            "x",
+            {
+                "api_key": "X_API_KEY",
+                "api_secret": "X_API_SECRET",
+                "access_token": "X_ACCESS_TOKEN",
+                "access_token_secret": "X_ACCESS_TOKEN_SECRET",
+            },
+            "sns_posters.x:create_poster",
+            "async_posters.x:create_poster",
+        ),
+        Platform(
+            "threads",
+            {"access_token": "THREADS_ACCESS_TOKEN"},
+            "sns_posters.threads:create_poster",
+            "async_posters.threads:create_poster",
+        ),
+        Platform(
+            "misskey",
+            {"api_token": "MISSKEY_API_TOKEN", "instance_url": "MISSKEY_INSTANCE_URL"},
+            "sns_posters.misskey:create_poster",
+            "async_posters.misskey:create_poster",
+        ),
+        Platform(
+            "mastodon",
+            {
+                "access_token": "MASTODON_ACCESS_TOKEN",
+                "instance_url": "MASTODON_INSTANCE_URL",
+            },
+            "sns_posters.mastodon:create_poster",
+            "async_posters.mastodon:create_poster",
+        ),
+    ]
+}
+
+
+def get_platform(name):
+    """
+    SNS名に対応するPlatformを返す（対応していないSNSはNone）。
+    """
+    return PLATFORMS.get(name)
@@ -0,0 +1,295 @@
+"""
+投稿リクエストのサンプリングプロファイラ（既定では無効）。
+プロファイルを取るリクエストの間だけ採取用のスレッドを動かし、一定間隔で
+リクエストのスレッドと、そのリクエストのために投稿処理を行うスレッド
+（スレッドプールのワーカー・非同期エンジンのイベントループ）のスタックを記録する。
+結果はフレームグラフにそのまま使える折りたたみ形式（"関数;関数;関数 回数"）で、
+リクエストIDごとに直近のものだけをメモリに保持する。
+
+スレッドを止めずにスタックを読むだけなので、本番環境でも再起動せずに使える。
+ワーカープロセスで行う画像加工はスタックに現れず、加工を待つ時間として記録される。
+非同期エンジンのイベントループは全投稿で共有するため、同時に処理していた
+他のリクエストのスタックが含まれることがある。
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from constants import PROFILE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_rate():
+    """
+    ヘッダーの指定なしにプロファイルを取るリクエストの割合を返す。
+    環境変数 PROFILE_SAMPLE_RATE が設定されていればそちらを優先する。
+    """
+    return float(os.getenv("PROFILE_SAMPLE_RATE", "0")) or PROFILE_SETTINGS["sample_rate"]
+
+
+def _short_path(filename):
+    """
+    スタックに表示するファイル名（アプリはbackendから、ライブラリはsite-packagesからの相対パス）。
+    """
+    if filename.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(filename, BASE_DIR)
+    _, sep, rest = filename.rpartition("site-packages" + os.sep)
+    return rest if sep else os.path.basename(filename)
+
+
+class Profile:
+    def __init__(self, profile_id, path):
+        """
+        Profileの初期化。
+
+        Args:
+            profile_id: リクエストID
+            path: リクエストのパス
+        """
+        self.id = profile_id
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.duration = None
+        self.samples = 0
+        self.stacks = Counter()
+
+    @property
+    def running(self):
+        return self.duration is None
+
+    def elapsed(self):
+        """
+        開始からの秒数（終了したプロファイルは記録した時間）。
+        """
+        return time.monotonic() - self._start if self.running else self.duration
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration": self.elapsed(),
+            "samples": self.samples,
+            "running": self.running,
+        }
+
+
+class SamplingProfiler:
+    def __init__(self, settings=None):
+        """
+        SamplingProfilerの初期化。採取用のスレッドは最初のプロファイルの開始時に起動する。
+
+        Args:
+            settings: PROFILE_SETTINGSと同じ形式の設定（任意）
+        """
+        self.settings = settings or PROFILE_SETTINGS
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # スレッドID -> (スタックの根に表示する名前, そのスレッドを記録するProfileのリスト)
+        self._threads = {}
+        self._active = []
+        self._profiles = OrderedDict()
+        self._labels = {}
+        self._sampler = None
+
+    def sampled(self):
+        """
+        sample_rateに従って、このリクエストのプロファイルを取るかどうかを決める。
+        """
+        rate = sample_rate()
+        return rate > 0 and random.random() < rate
+
+    def start(self, profile_id, path):
+        """
+        呼び出し元のスレッドのプロファイルを開始する。stop()で終了すること。
+
+        Args:
+            profile_id: リクエストID（同じIDのプロファイルは置き換える）
+            path: リクエストのパス
+        Returns:
+            Profile
+        """
+        profile = Profile(profile_id, path)
+        with self._lock:
+            self._profiles.pop(profile_id, None)
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self.settings["max_profiles"]:
+                self._profiles.popitem(last=False)
+            self._active.append(profile)
+            self._attach(profile, threading.current_thread(), "request")
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._sampler.start()
+            self._wakeup.notify()
+        return profile
+
+    def stop(self, profile):
+        """
+        プロファイルを終了し、記録を止める（2回呼んでもよい）。
+        """
+        with self._lock:
+            self._finish(profile)
+
+    def _finish(self, profile):
+        if not profile.running:
+            return
+        profile.duration = profile.elapsed()
+        self._active.remove(profile)
+        for ident in list(self._threads):
+            _, profiles = self._threads[ident]
+            if profile in profiles:
+                profiles.remove(profile)
+            if not profiles:
+                del self._threads[ident]
+
+    def _attach(self, profile, thread, label):
+        entry = self._threads.setdefault(thread.ident, (label, []))
+        entry[1].append(profile)
+
+    def _detach(self, profile, thread):
+        entry = self._threads.get(thread.ident)
+        if entry and profile in entry[1]:
+            entry[1].remove(profile)
+            if not entry[1]:
+                del self._threads[thread.ident]
+
+    def current(self):
+        """
+        呼び出し元のスレッドを記録しているProfileを返す（プロファイル中でなければNone）。
+        """
+        with self._lock:
+            entry = self._threads.get(threading.get_ident())
+            return entry[1][-1] if entry else None
+
+    @contextmanager
+    def attach(self, profile, thread=None, label=None):
+        """
+        ブロックの間、スレッドのスタックもプロファイルに記録する。
+        profileがNone（プロファイル中でない）の場合は何もしない。
+
+        Args:
+            profile: Profile
+            thread: 記録するスレッド（省略時は呼び出し元のスレッド）
+            label: スタックの根に表示する名前（省略時はスレッド名）
+        """
+        if profile is None:
+            yield
+            return
+        thread = thread or threading.current_thread()
+        with self._lock:
+            attached = profile.running
+            if attached:
+                self._attach(profile, thread, label or thread.name)
+        try:
+            yield
+        finally:
+            if attached:
+                with self._lock:
+                    self._detach(profile, thread)
+
+    def bind(self, func):
+        """
+        呼び出し元のプロファイルを引き継いで実行する関数を返す（スレッドプールに渡す関数に使う）。
+        プロファイル中でなければfuncをそのまま返す。
+        """
+        profile = self.current()
+        if profile is None:
+            return func
+
+        def run(*args, **kwargs):
+            # ワーカーのスタックはスレッドによらず1つにまとめる
+            with self.attach(profile, label="worker"):
+                return func(*args, **kwargs)
+
+        return run
+
+    def list(self):
+        """
+        保持しているプロファイルの概要を新しい順に返す。
+        """
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles.values())]
+
+    def collapsed(self, profile_id):
+        """
+        プロファイルを折りたたみ形式のテキスト（1行に"スタック 回数"）で返す。
+        flamegraph.plやspeedscopeでそのまま読み込める。
+
+        Returns:
+            テキスト（プロファイルがない場合はNone）
+        """
+        with self._lock:
+            profile = self._profiles.get(profile_id)
+            if profile is None:
+                return None
+            stacks = profile.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return label
+
+    def _stack(self, frame, root):
+        labels = []
+        while frame is not None and len(labels) < self.settings["max_depth"]:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(root)
+        return ";".join(reversed(labels))
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            targets = [
+                (ident, root, list(profiles))
+                for ident, (root, profiles) in self._threads.items()
+            ]
+        samples = []
+        for ident, root, profiles in targets:
+            frame = frames.get(ident)
+            if frame is not None:
+                samples.append((self._stack(frame, root), profiles))
+        del frames
+        with self._lock:
+            for stack, profiles in samples:
+                for profile in profiles:
+                    if profile.running:
+                        profile.stacks[stack] += 1
+            for profile in list(self._active):
+                profile.samples += 1
+                if profile.elapsed() > self.settings["max_duration"]:
+                    logger.warning(
+                        f"プロファイル{profile.id}が{self.settings['max_duration']}秒を超えたため記録を打ち切ります"
+                    )
+                    self._finish(profile)
+
+    def _run(self):
+        interval = self.settings["interval"]
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+            try:
+                self._sample()
+            except Exception:
+                logger.exception("スタックの採取に失敗しました")
+            time.sleep(interval)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,555 @@
+"""
+SNSごと・アカウントごとのレート制限を考慮した投稿スケジューラ。
+トークンバケットで投稿数を管理し、各SNSのレスポンスヘッダー
+（残り回数・リセット時刻・Retry-After）で状態を更新する。
+制限に達した投稿は失敗させずに待ち行列に入れ、枠が空いた順に送信する。
+同期版の投稿エンジンはreserveで待ち行列に並び、枠が空くまでスレッドを使わずに待つ
+（枠が空いた時点で、専用のスレッドがコールバックを呼ぶ）。
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from constants import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# 非同期版で順番待ちの間に先頭かどうかを確認する間隔（秒）
+ASYNC_POLL_INTERVAL = 0.1
+
+# レスポンスヘッダー名（小文字）。X / Mastodon・Misskey / Bluesky の順
+REMAINING_HEADERS = ("x-rate-limit-remaining", "x-ratelimit-remaining", "ratelimit-remaining")
+LIMIT_HEADERS = ("x-rate-limit-limit", "x-ratelimit-limit", "ratelimit-limit")
+RESET_HEADERS = ("x-rate-limit-reset", "x-ratelimit-reset", "ratelimit-reset")
+# 上限の期間を示すヘッダー（Bluesky。"5000;w=3600"の形式）
+POLICY_HEADERS = ("ratelimit-policy",)
+# Threads（Meta Graph API）の利用率ヘッダー
+USAGE_HEADERS = ("x-app-usage", "x-business-use-case-usage")
+
+# RATE_LIMITSに設定がないSNSの既定値
+DEFAULT_LIMIT = {"capacity": 60, "window": 60, "retry_after": 60}
+
+
+def _parse_time(value, now):
+    """
+    リセット時刻を表すヘッダー値をUNIX時刻に変換する。
+    UNIX時刻・秒数・ISO 8601・HTTP日付のいずれにも対応する。
+    """
+    value = str(value).strip()
+    try:
+        number = float(value)
+        # 大きな値はUNIX時刻、それ以外は現在からの秒数とみなす
+        return number if number > 1e9 else now + number
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _policy_window(value, limit):
+    """
+    ratelimit-policyヘッダー（"上限;w=秒数"をカンマ区切りで並べたもの）から、
+    上限がlimitのポリシーの期間（秒）を返す（該当するものがなければ先頭のポリシー、読めなければNone）。
+    """
+    windows = []
+    for policy in str(value).split(","):
+        quota, _, params = policy.strip().partition(";")
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "w":
+                try:
+                    windows.append((quota.strip(), float(number)))
+                except ValueError:
+                    pass
+    for quota, window in windows:
+        if limit is not None and quota == str(limit):
+            return window
+    return windows[0][1] if windows else None
+
+
+def _usage_block_seconds(value):
+    """
+    Meta Graph APIの利用率ヘッダーから、制限解除までの秒数を返す（制限中でなければ0）。
+    """
+    try:
+        usage = json.loads(value)
+    except ValueError:
+        return 0
+    entries = []
+    if isinstance(usage, dict):
+        for item in usage.values():
+            entries.extend(item if isinstance(item, list) else [item])
+        entries.append(usage)
+    blocked = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        minutes = entry.get("estimated_time_to_regain_access") or 0
+        percent = max(
+            entry.get("call_count", 0) or 0,
+            entry.get("total_time", 0) or 0,
+            entry.get("total_cputime", 0) or 0,
+        )
+        if minutes:
+            blocked = max(blocked, minutes * 60)
+        elif percent >= 100:
+            blocked = max(blocked, 60)
+    return blocked
+
+
+class TokenBucket:
+    def __init__(self, capacity, window):
+        """
+        TokenBucketの初期化。
+
+        Args:
+            capacity: バケットの容量（連続で送信できる数）
+            window: 容量分が回復するまでの秒数
+        """
+        self.capacity = capacity
+        self.window = window
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        # 最後に429を返された時刻（UNIX時刻）
+        self.throttled_at = 0.0
+        self.waiters = deque()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def blocked_for(self, now):
+        """
+        SNSが指定した時刻（リセット時刻・Retry-After）まで送信できない場合、その秒数を返す（なければ0）。
+        トークンの回復の見込みと違い、後のレスポンスで早まることはない。
+        """
+        return max(0.0, self.blocked_until - now)
+
+    def try_take(self, now):
+        """
+        トークンを1つ取得する。
+        Returns:
+            取得できた場合は0、できない場合は次に取得できるまでの秒数
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.blocked_until:
+            # SNSが指定した時刻（リセット時刻・Retry-After）を過ぎたら、少なくとも1回は送れる
+            self.blocked_until = 0.0
+            self.tokens = max(self.tokens, 1.0)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def update(
+        self, now, remaining=None, limit=None, reset_at=None, throttled=False, window=None
+    ):
+        """
+        SNSから通知された残り回数・上限・リセット時刻で状態を更新する。
+        throttledは429を返されたかどうか、windowは上限の期間（秒、分かる場合）。
+        """
+        self._refill(now)
+        if throttled:
+            self.throttled_at = now
+        if window and window > 0:
+            self.window = window
+            self.rate = self.capacity / window
+        if limit and limit > 0:
+            # 既定値より厳しい上限も反映し、残りの枠は新しい上限までに抑える
+            self.capacity = limit
+            self.rate = limit / self.window
+            self.tokens = min(self.tokens, self.capacity)
+        if remaining is not None:
+            self.tokens = min(float(remaining), self.capacity)
+            if remaining <= 0 and reset_at and reset_at > now:
+                self.blocked_until = max(self.blocked_until, reset_at)
+        elif reset_at and reset_at > now:
+            self.blocked_until = max(self.blocked_until, reset_at)
+
+
+class Reservation:
+    def __init__(self, limiter, callback, deadline):
+        """
+        Reservationの初期化（RateLimiter.reserveが生成する）。
+
+        Args:
+            limiter: 予約したRateLimiter
+            callback: 枠を取得できたらTrue、期限内に取得できなければFalseを渡して呼ぶ関数
+            deadline: 待つ期限（time.monotonic()の値、Noneなら無制限）
+        """
+        self.limiter = limiter
+        self.callback = callback
+        self.deadline = deadline
+        # 待ち行列に並んでいるバケット（すぐに枠を取得できた場合はNone）
+        self.bucket = None
+
+    def cancel(self):
+        """
+        予約を待ち行列から外す。
+        Returns:
+            外した場合True、すでにコールバックを呼んだ（呼んでいる）場合False
+        """
+        with self.limiter._cond:
+            if self.bucket is None or self not in self.bucket.waiters:
+                return False
+            self.bucket.waiters.remove(self)
+            self.limiter._cond.notify_all()
+            return True
+
+
+class RateLimiter:
+    def __init__(self, limits=None):
+        """
+        RateLimiterの初期化。
+
+        Args:
+            limits: SNSごとの既定のレート制限（省略時はRATE_LIMITS）
+        """
+        self.limits = limits or RATE_LIMITS
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._dispatcher = None
+
+    def _bucket(self, platform, account):
+        key = (platform, account)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit = self.limits.get(platform, DEFAULT_LIMIT)
+            bucket = TokenBucket(limit["capacity"], limit["window"])
+            self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, platform, account="default", timeout=None):
+        """
+        投稿枠を1つ取得する。枠がなければ到着順に待つ。
+
+        Args:
+            platform: SNS名
+            account: アカウント名
+            timeout: 待つ最大秒数（Noneなら無制限）
+        Returns:
+            取得できた場合True、timeout内に取得できなかった場合False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            bucket = self._bucket(platform, account)
+            bucket.waiters.append(ticket)
+            logged = False
+            try:
+                while True:
+                    wait = None
+                    if bucket.waiters[0] is ticket:
+                        wait = bucket.try_take(time.time())
+                        if wait == 0:
+                            return True
+                        if not logged:
+                            logger.info(
+                                f"{platform}({account})のレート制限のため投稿を待機します（約{wait:.0f}秒）"
+                            )
+                            logged = True
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        # 期限内に枠が空かないことが分かっている場合も待たずに失敗させる
+                        if remaining <= 0 or bucket.blocked_for(time.time()) > remaining:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                bucket.waiters.remove(ticket)
+                self._cond.notify_all()
+
+    async def acquire_async(self, platform, account="default", timeout=None):
+        """
+        acquireの非同期版。待機中もイベントループ（他の投稿）を止めない。
+        同期版の待ち行列と同じ順番待ちに並ぶ。
+
+        Args:
+            platform: SNS名
+            account: アカウント名
+            timeout: 待つ最大秒数（Noneなら無制限）
+        Returns:
+            取得できた場合True、timeout内に取得できなかった場合False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            bucket = self._bucket(platform, account)
+            bucket.waiters.append(ticket)
+        logged = False
+        try:
+            while True:
+                with self._cond:
+                    wait = ASYNC_POLL_INTERVAL
+                    if bucket.waiters[0] is ticket:
+                        wait = bucket.try_take(time.time())
+                        if wait == 0:
+                            return True
+                        if not logged:
+                            logger.info(
+                                f"{platform}({account})のレート制限のため投稿を待機します（約{wait:.0f}秒）"
+                            )
+                            logged = True
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    # 期限内に枠が空かないことが分かっている場合も待たずに失敗させる
+                    if remaining <= 0 or bucket.blocked_for(time.time()) > remaining:
+                        return False
+                    wait = min(wait, remaining)
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                bucket.waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def reserve(self, platform, account, callback, timeout=None):
+        """
+        投稿枠を予約する。acquireと同じ待ち行列に並ぶが、呼び出し元のスレッドは待たない。
+        枠が空いていればその場で、空いていなければ枠が空いた時点で専用のスレッドから
+        callback(True)を呼ぶ。timeout内に枠が空かない（空かないことが分かった）場合はcallback(False)を呼ぶ。
+        callbackは時間のかかる処理をせず、スレッドプールへの投入などにとどめること。
+
+        Args:
+            platform: SNS名
+            account: アカウント名
+            callback: 取得できたかどうかを受け取る関数
+            timeout: 待つ最大秒数（Noneなら無制限）
+        Returns:
+            Reservation（cancel()で待ち行列から外せる）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reservation = Reservation(self, callback, deadline)
+        with self._cond:
+            bucket = self._bucket(platform, account)
+            wait = None if bucket.waiters else bucket.try_take(time.time())
+            if wait != 0:
+                logger.info(
+                    f"{platform}({account})のレート制限のため投稿を待ち行列に入れます"
+                    + (f"（約{wait:.0f}秒）" if wait else f"（{len(bucket.waiters)}件待ち）")
+                )
+                reservation.bucket = bucket
+                bucket.waiters.append(reservation)
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(
+                        target=self._dispatch, name="rate-limit", daemon=True
+                    )
+                    self._dispatcher.start()
+                self._cond.notify_all()
+                return reservation
+        callback(True)
+        return reservation
+
+    def _dispatch(self):
+        """
+        待ち行列の先頭の予約に枠を割り当て、コールバックを呼ぶ（専用のスレッドで実行される）。
+        """
+        while True:
+            fired = []
+            with self._cond:
+                now = time.monotonic()
+                wait = None
+                for bucket in self._buckets.values():
+                    while bucket.waiters and isinstance(bucket.waiters[0], Reservation):
+                        head = bucket.waiters[0]
+                        delay = bucket.try_take(time.time())
+                        if delay == 0:
+                            fired.append((bucket.waiters.popleft(), True))
+                        elif (
+                            head.deadline is not None
+                            and now + bucket.blocked_for(time.time()) > head.deadline
+                        ):
+                            # 期限内に枠が空かないことが分かっている予約はすぐに失敗させる
+                            fired.append((bucket.waiters.popleft(), False))
+                        else:
+                            wait = delay if wait is None else min(wait, delay)
+                            break
+                    # 制限が解けるまでは後ろの予約も送れないため、それまでに期限が来る予約も失敗させる
+                    ready_at = now + bucket.blocked_for(time.time())
+                    for waiter in list(bucket.waiters):
+                        if not isinstance(waiter, Reservation) or waiter.deadline is None:
+                            continue
+                        if waiter.deadline < ready_at or waiter.deadline <= now:
+                            bucket.waiters.remove(waiter)
+                            fired.append((waiter, False))
+                        else:
+                            remaining = waiter.deadline - now
+                            wait = remaining if wait is None else min(wait, remaining)
+                if fired:
+                    # 先頭になったacquireの待ちを起こす
+                    self._cond.notify_all()
+                else:
+                    self._cond.wait(wait)
+            for reservation, acquired in fired:
+                try:
+                    reservation.callback(acquired)
+                except Exception:
+                    logger.exception("レート制限の予約のコールバックでエラーが発生しました")
+
+    def refund(self, platform, account="default"):
+        """
+        取得した投稿枠を使わなかった場合（送信前に取り消した投稿など）に返す。
+        """
+        with self._cond:
+            bucket = self._bucket(platform, account)
+            bucket._refill(time.time())
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+            self._cond.notify_all()
+
+    def update(
+        self,
+        platform,
+        account="default",
+        remaining=None,
+        limit=None,
+        reset_at=None,
+        throttled=False,
+        window=None,
+    ):
+        """
+        残り回数・上限（投稿数）・リセット時刻（UNIX時刻）を直接指定して状態を更新する。
+        throttledは429を返されたかどうか（throttled_sinceで参照する）、windowは上限の期間（秒）。
+        """
+        with self._cond:
+            self._bucket(platform, account).update(
+                time.time(),
+                remaining=remaining,
+                limit=limit,
+                reset_at=reset_at,
+                throttled=throttled,
+                window=window,
+            )
+            self._cond.notify_all()
+
+    def throttled_since(self, platform, account, since):
+        """
+        since（UNIX時刻）以降に、SNSから429（レート制限）を返されたかどうかを返す。
+        """
+        with self._cond:
+            return self._bucket(platform, account).throttled_at >= since
+
+    def update_from_headers(self, platform, headers, account="default", status_code=None):
+        """
+        レスポンスヘッダーからレート制限の状態を更新する。
+        上限の期間はratelimit-policyヘッダーがあればその値、なければ既定のwindowとし、
+        ポイントで示される上限・残り（RATE_LIMITSのcost）は投稿数に換算する。
+
+        Args:
+            platform: SNS名
+            headers: レスポンスヘッダー（大文字小文字を区別しないdict）
+            account: アカウント名
+            status_code: HTTPステータスコード（429の場合は制限中として扱う）
+        """
+        if headers is None:
+            return
+        now = time.time()
+        lowered = {k.lower(): v for k, v in headers.items()}
+
+        def first(names):
+            for name in names:
+                if name in lowered:
+                    return lowered[name]
+            return None
+
+        remaining = first(REMAINING_HEADERS)
+        limit = first(LIMIT_HEADERS)
+        reset = first(RESET_HEADERS)
+        policy = first(POLICY_HEADERS)
+        retry_after = lowered.get("retry-after")
+        reset_at = _parse_time(reset, now) if reset is not None else None
+        if retry_after is not None:
+            reset_at = _parse_time(retry_after, now) or reset_at
+        for name in USAGE_HEADERS:
+            if name in lowered:
+                blocked = _usage_block_seconds(lowered[name])
+                if blocked:
+                    remaining, reset_at = 0, now + blocked
+        settings = self.limits.get(platform, DEFAULT_LIMIT)
+        if status_code == 429:
+            remaining = 0
+            retry_seconds = settings.get("retry_after", DEFAULT_LIMIT["retry_after"])
+            reset_at = reset_at or now + retry_seconds
+        if remaining is None and reset_at is None:
+            return
+        try:
+            remaining = int(float(remaining)) if remaining is not None else None
+            limit = int(float(limit)) if limit is not None else None
+        except ValueError:
+            return
+        window = _policy_window(policy, limit) if policy is not None else None
+        cost = settings.get("cost", 1)
+        if cost > 1:
+            remaining = remaining // cost if remaining is not None else None
+            limit = limit // cost if limit is not None else None
+        self.update(
+            platform,
+            account,
+            remaining=remaining,
+            limit=limit,
+            reset_at=reset_at,
+            throttled=status_code == 429,
+            window=window,
+        )
+
+    def response_hook(self, platform, account="default", paths=None):
+        """
+        requests/httpxのレスポンスフックを返す。
+        pathsを指定した場合は、そのパスへのレスポンスと429のみを反映する。
+        """
+
+        def hook(response, *args, **kwargs):
+            url = str(response.request.url) if response.request is not None else ""
+            if response.status_code == 429 or not paths or any(p in url for p in paths):
+                self.update_from_headers(
+                    platform, response.headers, account, response.status_code
+                )
+            return response
+
+        return hook
+
+    def async_response_hook(self, platform, account="default", paths=None):
+        """
+        httpx.AsyncClient用のレスポンスフック（コルーチン関数）を返す。
+        """
+        hook = self.response_hook(platform, account, paths)
+
+        async def async_hook(response):
+            hook(response)
+
+        return async_hook
+
+    def snapshot(self):
+        """
+        各バケットの状態を返す。
+        """
+        now = time.time()
+        with self._cond:
+            result = {}
+            for (platform, account), bucket in self._buckets.items():
+                bucket._refill(now)
+                result[f"{platform}:{account}"] = {
+                    "tokens": round(bucket.tokens, 2),
+                    "capacity": bucket.capacity,
+                    "blocked_for": max(0.0, round(bucket.blocked_until - now, 1)),
+                    "waiting": len(bucket.waiters),
+                }
+            return result
+
+
+rate_limiter = RateLimiter()
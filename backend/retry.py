@@ -0,0 +1,211 @@
+"""
+SNS APIの一時的な障害（接続エラー・タイムアウト・5xx）に対する再試行。
+待ち時間は試行ごとに上限を2倍にし、その範囲で乱数にする（full jitter）。
+複数の投稿が同時に失敗しても、再試行が同じ時刻に集中しない。
+
+再試行すると二重投稿になりうる処理（投稿の作成）は、冪等にできる場合
+（MastodonのIdempotency-Keyなど）を除き、リクエストがサーバーに届いていないことが
+確実なエラー（接続の確立に失敗）のときだけ再試行する。
+429（レート制限）はここでは再試行せず、投稿エンジンがrate_limiterの制限が解けるまで
+（投稿期限内で）待ってから投稿をやり直す。
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from constants import RETRY_SETTINGS
+from metrics import post_retries
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+# エラーレスポンスのコードで判定するSDK（Misskeyはステータスコードを例外に含めない）
+TRANSIENT_ERROR_CODES = {"INTERNAL_ERROR"}
+
+
+class TransientError(Exception):
+    """
+    一時的な障害を表すHTTPレスポンスを受け取った場合の例外。
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_transient(response, message=None):
+    """
+    レスポンスが一時的な障害（5xxなど）であればTransientErrorを送出する。
+    それ以外のレスポンスはそのまま返す（エラーの扱いは呼び出し側に任せる）。
+
+    Args:
+        response: requests.Responseまたはhttpx.Response
+        message: 例外のメッセージ（省略時はHTTPステータス）
+    Returns:
+        response
+    Raises:
+        TransientError: ステータスコードが一時的な障害を表す場合
+    """
+    if response.status_code in TRANSIENT_STATUS:
+        raise TransientError(
+            message or f"HTTP {response.status_code}: {response.text[:200]}",
+            response.status_code,
+        )
+    return response
+
+
+def max_attempts():
+    """
+    最初の1回を含む最大試行回数（環境変数 POST_RETRY_MAX_ATTEMPTS で上書き可能）。
+    """
+    return int(os.getenv("POST_RETRY_MAX_ATTEMPTS", "0")) or RETRY_SETTINGS["max_attempts"]
+
+
+def backoff(attempt):
+    """
+    attempt回目の失敗の後に待つ秒数を返す。
+
+    Args:
+        attempt: 失敗した試行の回数（1から）
+    """
+    limit = min(RETRY_SETTINGS["max_delay"], RETRY_SETTINGS["base_delay"] * 2 ** (attempt - 1))
+    return random.uniform(0, limit)
+
+
+def _chain(error):
+    """
+    例外と、その原因（SDKが包み直す前の例外）を順に返す。
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error):
+    """
+    SDKの例外からHTTPステータスコードを取り出す（取り出せない場合はNone）。
+    """
+    sources = [error, getattr(error, "response", None)]
+    if error.args:
+        sources.append(error.args[0])
+    for source in sources:
+        code = getattr(source, "status_code", None)
+        if isinstance(code, int):
+            return code
+    # Mastodon.pyの例外は(メッセージ, ステータスコード, 理由, 詳細)を引数に持つ
+    if len(error.args) > 1 and isinstance(error.args[1], int):
+        return error.args[1]
+    return None
+
+
+def is_transient(error):
+    """
+    再試行すれば成功する見込みのある一時的な障害かどうかを判定する。
+    """
+    for e in _chain(error):
+        if isinstance(e, TransientError):
+            return True
+        if isinstance(
+            e,
+            (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                httpx.TransportError,
+            ),
+        ):
+            return True
+        if _status_code(e) in TRANSIENT_STATUS:
+            return True
+        if getattr(e, "code", None) in TRANSIENT_ERROR_CODES:
+            return True
+    return False
+
+
+def is_unsent(error):
+    """
+    リクエストがサーバーに届いていないことが確実なエラー（接続の確立に失敗）かどうかを判定する。
+    """
+    for e in _chain(error):
+        if isinstance(
+            e,
+            (
+                requests.exceptions.ConnectTimeout,
+                httpx.ConnectError,
+                httpx.ConnectTimeout,
+                httpx.PoolTimeout,
+            ),
+        ):
+            return True
+        if isinstance(e, requests.ConnectionError) and e.args:
+            if isinstance(getattr(e.args[0], "reason", None), NewConnectionError):
+                return True
+    return False
+
+
+def _should_retry(error, idempotent, attempt):
+    if attempt >= max_attempts():
+        return False
+    return is_transient(error) if idempotent else is_unsent(error)
+
+
+def _log_retry(platform, error, attempt, delay):
+    logger.warning(
+        f"{platform}: 一時的なエラーのため{delay:.2f}秒後に再試行します"
+        f"（{attempt}回目の失敗）: {type(error).__name__}: {error}"
+    )
+    post_retries.inc(platform=platform)
+
+
+def with_retry(platform, func, idempotent=True):
+    """
+    funcを呼び出し、一時的な障害で失敗した場合は待ち時間を置いて再試行する。
+    funcは試行ごとに呼び直されるため、送信するファイルなどはfuncの中で開くこと。
+
+    Args:
+        platform: SNS名（ログと計測用）
+        func: 引数なしの関数
+        idempotent: 再送しても結果が変わらない処理かどうか。
+            Falseの場合はリクエストが届いていないことが確実なエラーだけ再試行する
+    Returns:
+        funcの戻り値
+    Raises:
+        funcが最後に送出した例外
+    """
+    attempt = 1
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if not _should_retry(e, idempotent, attempt):
+                raise
+            delay = backoff(attempt)
+            _log_retry(platform, e, attempt, delay)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def with_retry_async(platform, func, idempotent=True):
+    """
+    with_retryの非同期版。funcは引数なしでコルーチンを返す関数。
+    """
+    attempt = 1
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            if not _should_retry(e, idempotent, attempt):
+                raise
+            delay = backoff(attempt)
+            _log_retry(platform, e, attempt, delay)
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,364 @@
+"""
+予約投稿のスケジューラ。
+予約された投稿と添付画像の参照をローカルのSQLiteに保存し、予約時刻に
+SnsClient.post_to_platformsで投稿する。
+待機中の予約は予約時刻順のヒープで管理し、1つのスレッドが次の予約時刻まで
+Conditionで待つため、予約が何件あってもポーリングは発生しない。
+プロセスを再起動した場合は未実行の予約を読み込み直し、過ぎていたものは直ちに投稿する。
+予約の一覧と画像の参照は起動時に読み込んだものをプロセス内で管理するため、
+1つのデータベースは1つのプロセスだけで使うこと（別のプロセスが追加した予約は実行されず、
+起動時に実行中の予約を中断扱いにし、画像の参照も共有されない）。
+"""
+
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from constants import SCHEDULER_SETTINGS
+from media import Media
+
+logger = logging.getLogger(__name__)
+
+STATUS_SCHEDULED = "scheduled"
+
+
+def parse_scheduled_at(value):
+    """
+    予約時刻をUNIX時刻に変換する。
+
+    Args:
+        value: UNIX時刻（数値）またはISO 8601の文字列（タイムゾーン省略時はローカル時刻）
+    Returns:
+        UNIX時刻、解釈できない場合はNone
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class Scheduler:
+    def __init__(self, sns_client, upload_store, db_path, max_workers=None):
+        """
+        Schedulerの初期化。予約の実行はstart()で開始する。
+
+        Args:
+            sns_client: 投稿に使うSnsClient
+            upload_store: 添付画像の保存先（予約中の画像が削除されないよう参照を保持する）
+            db_path: 予約を保存するSQLiteファイルのパス
+            max_workers: 予約投稿を実行するワーカースレッド数
+        """
+        self.sns_client = sns_client
+        self.upload_store = upload_store
+        self.db_path = db_path
+        if max_workers is None:
+            max_workers = SCHEDULER_SETTINGS["max_workers"]
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # (予約時刻, 予約ID)のヒープ。取り消された予約は取り出した時に読み飛ばす
+        self._heap = []
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._init_db()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sns-schedule"
+        )
+
+    def _init_db(self):
+        """
+        テーブルを作成し、前回プロセスで実行中だった予約を中断扱いにする
+        （投稿済みのSNSがあるかもしれないため、再実行はしない）。
+        保持期間を過ぎた予約は削除する。
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schedules (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    scheduled_at REAL NOT NULL,
+                    posts TEXT NOT NULL,
+                    media TEXT NOT NULL,
+                    results TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS schedules_status "
+                "ON schedules (status, scheduled_at)"
+            )
+            now = time.time()
+            self._conn.execute(
+                "UPDATE schedules SET status = 'interrupted', updated_at = ? "
+                "WHERE status = 'running'",
+                (now,),
+            )
+            self._conn.execute(
+                "DELETE FROM schedules WHERE status != ? AND updated_at < ?",
+                (STATUS_SCHEDULED, now - SCHEDULER_SETTINGS["retention"]),
+            )
+
+    def _update(self, schedule_id, expected=None, **fields):
+        """
+        予約の列を更新する。dict/listの値はJSONに変換して保存する。
+        expectedを指定した場合は、その状態の予約だけを更新する。
+
+        Returns:
+            更新できたかどうか
+        """
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        values = [
+            json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+            for v in fields.values()
+        ]
+        sql = f"UPDATE schedules SET {columns} WHERE id = ?"
+        params = [*values, schedule_id]
+        if expected:
+            sql += " AND status = ?"
+            params.append(expected)
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount > 0
+
+    def start(self):
+        """
+        未実行の予約を読み込み、予約時刻を待つスレッドを開始する。
+        予約時刻を過ぎてから再開した予約は、見逃しを許す期間内であれば直ちに投稿する。
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, scheduled_at, media FROM schedules WHERE status = ?",
+                (STATUS_SCHEDULED,),
+            ).fetchall()
+        missed = 0
+        for row in rows:
+            if now - row["scheduled_at"] > SCHEDULER_SETTINGS["catch_up_window"]:
+                self._update(
+                    row["id"],
+                    expected=STATUS_SCHEDULED,
+                    status="missed",
+                    error="予約時刻を大幅に過ぎていたため投稿しませんでした",
+                )
+                missed += 1
+                continue
+            # 画像の参照はプロセス内でのみ保持されるため、再起動後に取り直す
+            self.upload_store.acquire(
+                [item["path"] for item in json.loads(row["media"])]
+            )
+            self._push(row["id"], row["scheduled_at"])
+        if rows:
+            logger.info(
+                f"予約投稿を{len(rows) - missed}件読み込みました"
+                + (f"（期限切れ{missed}件）" if missed else "")
+            )
+        self._thread = threading.Thread(
+            target=self._loop, name="sns-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def _push(self, schedule_id, scheduled_at):
+        with self._cond:
+            self._pending[schedule_id] = scheduled_at
+            heapq.heappush(self._heap, (scheduled_at, schedule_id))
+            # 先頭が変わった場合だけ待機中のスレッドを起こす
+            if self._heap[0][1] == schedule_id:
+                self._cond.notify()
+
+    def _loop(self):
+        """
+        次の予約時刻まで待ち、時刻になった予約をワーカーに渡す。
+        """
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                scheduled_at, schedule_id = self._heap[0]
+                delay = scheduled_at - time.time()
+                if delay > 0:
+                    # 時計の補正で予約時刻がずれても遅れすぎないよう、待つ時間に上限を設ける
+                    self._cond.wait(min(delay, SCHEDULER_SETTINGS["max_wait"]))
+                    continue
+                heapq.heappop(self._heap)
+                if self._pending.get(schedule_id) != scheduled_at:
+                    continue
+                del self._pending[schedule_id]
+                self.executor.submit(self._run, schedule_id)
+
+    def schedule(self, posts, media, scheduled_at):
+        """
+        投稿を予約する。画像は投稿が終わるか予約が取り消されるまで参照を保持する。
+
+        Args:
+            posts: プラットフォーム名をキー、投稿本文（投稿するアカウントを指定する場合は
+                {"content": 投稿本文, "accounts": アカウント名のリスト}）を値とする辞書
+            media: 添付する画像（Media）のリスト（UploadStoreで保存したもの）
+            scheduled_at: 予約時刻（UNIX時刻）
+        Returns:
+            予約情報のdict
+        """
+        schedule_id = uuid.uuid4().hex
+        now = time.time()
+        media_refs = [
+            {"path": item.path, "digest": item.digest, "filename": item.filename}
+            for item in media or []
+        ]
+        self.upload_store.acquire(media)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO schedules "
+                "(id, status, scheduled_at, posts, media, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    schedule_id,
+                    STATUS_SCHEDULED,
+                    scheduled_at,
+                    json.dumps(posts, ensure_ascii=False),
+                    json.dumps(media_refs, ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+        self._push(schedule_id, scheduled_at)
+        return self.get(schedule_id)
+
+    def cancel(self, schedule_id):
+        """
+        予約を取り消す。実行前の予約のみ取り消せる。
+
+        Args:
+            schedule_id: 予約ID
+        Returns:
+            取り消せたかどうか
+        """
+        if not self._update(schedule_id, expected=STATUS_SCHEDULED, status="canceled"):
+            return False
+        with self._cond:
+            self._pending.pop(schedule_id, None)
+        self.upload_store.release(self._media_paths(schedule_id))
+        return True
+
+    def _media_paths(self, schedule_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT media FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        return [item["path"] for item in json.loads(row["media"])] if row else []
+
+    def _run(self, schedule_id):
+        """
+        予約を実行し、結果を保存する。
+        実行前に取り消された予約は実行しない。
+        """
+        if not self._update(schedule_id, expected=STATUS_SCHEDULED, status="running"):
+            return
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT posts, media FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        media_refs = json.loads(row["media"])
+        try:
+            media = [
+                Media.load(item["path"], digest=item["digest"]) for item in media_refs
+            ]
+            posts = {}
+            for platform, post in json.loads(row["posts"]).items():
+                if not isinstance(post, dict):
+                    post = {"content": post}
+                posts[platform] = {**post, "media": media or None}
+            # 予約時刻にレート制限に達していた場合は、枠が空くまで待って投稿する
+            results = self.sns_client.post_to_platforms(posts, wait_for_rate_limit=True)
+            self._update(schedule_id, status="done", results=results)
+        except Exception as e:
+            logger.error(f"予約投稿の実行エラー({schedule_id}): {str(e)}", exc_info=True)
+            self._update(schedule_id, status="failed", error=str(e))
+        finally:
+            self.upload_store.release([item["path"] for item in media_refs])
+
+    def _to_dict(self, row):
+        results = json.loads(row["results"]) if row["results"] else None
+        schedule = {
+            "schedule_id": row["id"],
+            "status": row["status"],
+            "scheduled_at": row["scheduled_at"],
+            "posts": json.loads(row["posts"]),
+            "media": [item["filename"] for item in json.loads(row["media"])],
+            "results": results,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if results is not None:
+            schedule["success"] = all(r.get("success", False) for r in results.values())
+        if row["error"]:
+            schedule["error"] = row["error"]
+        return schedule
+
+    def get(self, schedule_id):
+        """
+        予約の状態を取得する。
+
+        Args:
+            schedule_id: 予約ID
+        Returns:
+            予約情報のdict、存在しない場合はNone
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        """
+        予約を予約時刻順に返す。
+
+        Args:
+            status: 絞り込む状態（任意）
+            limit: 最大件数
+        Returns:
+            予約情報のdictのリスト
+        """
+        sql = "SELECT * FROM schedules"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY scheduled_at LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def stats(self):
+        """
+        待機中の予約数と次の予約時刻を返す。
+        """
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "next_at": min(self._pending.values()) if self._pending else None,
+            }
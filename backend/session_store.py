@@ -0,0 +1,129 @@
+"""
+SNSのログインセッションをローカルファイルに保存する。
+プロセスを再起動してもセッションを再利用し、パスワードでの再ログインを避けるために使う。
+ファイルはアカウント名をキー、セッション文字列を値とするJSON。
+複数のプロセスで共有できるよう、セッションを更新する間はファイルロック（lock）を取る。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windowsではプロセス間のロックを行わない
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    def __init__(self, path):
+        """
+        SessionStoreの初期化。
+
+        Args:
+            path: セッションを保存するファイルのパス
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _open_lock(self):
+        """
+        ロックファイルを開き、排他ロックを取得するまで待つ（閉じるとロックが解放される）。
+        """
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        f = open(f"{self.path}.lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            except BaseException:
+                f.close()
+                raise
+        return f
+
+    @contextmanager
+    def lock(self):
+        """
+        セッションを更新する間、他のプロセス・スレッドの更新を待たせるロック。
+        同じリフレッシュトークンで同時に更新すると、後の更新が失敗するため使う。
+        ロックを取得したらloadで最新のセッションを読み直すこと。
+        """
+        f = self._open_lock()
+        try:
+            yield
+        finally:
+            f.close()
+
+    @asynccontextmanager
+    async def lock_async(self):
+        """
+        lockの非同期版。ロックの取得はスレッドで待ち、イベントループを止めない。
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, self._open_lock)
+        try:
+            f = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 待っている間に取り消された場合は、取得できた時点でロックを解放する
+            future.add_done_callback(
+                lambda done: done.exception() is None and done.result().close()
+            )
+            raise
+        try:
+            yield
+        finally:
+            f.close()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"セッションファイルを読み込めません: {e}")
+            return {}
+
+    def load(self, account):
+        """
+        保存済みのセッション文字列を返す。
+
+        Args:
+            account: アカウント名
+        Returns:
+            セッション文字列、保存されていなければNone
+        """
+        with self._lock:
+            return self._read().get(account)
+
+    def save(self, account, session_string):
+        """
+        セッション文字列を保存する。
+        書き込み途中で壊れないよう一時ファイル経由で置き換え、所有者のみ読めるようにする。
+
+        Args:
+            account: アカウント名
+            session_string: セッション文字列（Noneの場合は削除）
+        """
+        with self._lock:
+            sessions = self._read()
+            if session_string is None:
+                sessions.pop(account, None)
+            else:
+                sessions[account] = session_string
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".session-")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(sessions, f)
+                os.chmod(tmp_path, 0o600)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
@@ -1,167 +1,542 @@
 import os
-from atproto import Client as AtprotoClient
-import tweepy
-from mastodon import Mastodon
-import misskey
 from dotenv import load_dotenv
-import io
-from PIL import Image
-from sns_posters.bluesky import BlueskyPoster
-from sns_posters.x import XPoster
-from sns_posters.threads import ThreadsPoster
-from sns_posters.misskey import MisskeyPoster
-from sns_posters.mastodon import MastodonPoster
-from constants import CHARACTER_LIMITS, IMAGE_LIMITS
 
 # .envファイルから環境変数を読み込む
+# （APIの接続先はPosterのモジュールを読み込む時点で決まるため、先に読み込む）
 load_dotenv()
 
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from image_preprocessor import compress_variant, image_preprocessor
+from media_cache import media_cache
+from accounts import DEFAULT_ACCOUNT, load_accounts, split_target
+from platforms import get_platform
+from rate_limiter import rate_limiter
+from circuit_breaker import circuit_breakers
+from profiler import profiler
+from retry import is_transient
+from metrics import (
+    phase_duration,
+    post_batch_duration,
+    post_batches_in_flight,
+    post_duration,
+    posts_in_flight,
+    record_result,
+    time_phase,
+)
+from constants import (
+    CHARACTER_LIMITS,
+    CLIENT_INIT_SETTINGS,
+    IMAGE_LIMITS,
+    POST_SETTINGS,
+    POST_TIMEOUTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 期限なく順番を待っている投稿がある間、送信を始めたかどうかを確認する間隔（秒）
+QUEUED_POLL_INTERVAL = 1.0
+
 
 def get_character_limits():
     """文字数制限を取得する関数"""
     return CHARACTER_LIMITS
 
 
+def get_post_timeout(platform):
+    """
+    プラットフォームごとの投稿期限（秒）を取得する。
+    環境変数 POST_TIMEOUT_<PLATFORM> が設定されていればそちらを優先する。
+    """
+    env_value = os.getenv(f"POST_TIMEOUT_{platform.upper()}")
+    if env_value:
+        try:
+            return float(env_value)
+        except ValueError:
+            pass
+    return POST_TIMEOUTS.get(platform, POST_SETTINGS["default_timeout"])
+
+
+# クライアントの状態
+STATE_PENDING = "pending"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+def account_label(platform, account):
+    """
+    ログやエラーメッセージに使うアカウントの表記（既定のアカウントはSNS名のみ）。
+    """
+    return platform if account == DEFAULT_ACCOUNT else f"{platform}({account})"
+
+
+def merge_account_results(results):
+    """
+    1つの投稿先（SNS）に含まれるアカウントごとの結果を1つにまとめる。
+    アカウントが1つの場合はその結果をそのまま返し、
+    複数の場合はすべて成功したかどうかと、アカウントごとの結果（accounts）を返す。
+
+    Args:
+        results: アカウント名をキー、投稿結果のdictを値とする辞書
+    Returns:
+        投稿結果のdict
+    """
+    if len(results) == 1:
+        return next(iter(results.values()))
+    merged = {
+        "success": all(r.get("success", False) for r in results.values()),
+        "accounts": results,
+    }
+    errors = [
+        f"{account}: {r.get('error')}" for account, r in results.items() if not r.get("success")
+    ]
+    if errors:
+        merged["error"] = " / ".join(errors)
+    return merged
+
+
+class _AccountResults:
+    """
+    アカウントごとに届く投稿結果を、投稿先（postsのキー）ごとにまとめる。
+    """
+
+    def __init__(self, plan):
+        self._accounts = {key: accounts for key, _, accounts, _ in plan}
+        self._results = {}
+
+    def add(self, key, account, result):
+        """
+        結果を追加する。
+
+        Returns:
+            投稿先のすべてのアカウントの結果が揃った場合はまとめた結果、揃っていなければNone
+        """
+        results = self._results.setdefault(key, {})
+        results[account] = result
+        if len(results) < len(self._accounts[key]):
+            return None
+        del self._results[key]
+        return merge_account_results(
+            {account: results[account] for account in self._accounts[key]}
+        )
+
+
+def start_preprocessor(accounts):
+    """
+    画像の圧縮が必要なSNSのアカウントがあれば、画像加工のワーカープロセスを起動する。
+    該当するSNSがなければ起動せず、Pillowも読み込まない。
+    Args:
+        accounts: AccountRegistry
+    """
+    if any(get_platform(platform).needs_preprocess for platform in accounts.platforms()):
+        image_preprocessor.start()
+
+
+def rate_limited_result(label):
+    """
+    レート制限のため期限内に投稿できなかった場合の結果を返す。
+    """
+    return {
+        "success": False,
+        "error": f"{label}のレート制限に達しているため、期限内に投稿できませんでした",
+        "error_type": "RateLimited",
+        "rate_limited": True,
+    }
+
+
+def timeout_result(platform, account, sent):
+    """
+    投稿期限を過ぎた場合の結果を返す。
+    送信を始めていた投稿はSNSに届いている可能性があるため、結果は不明（unknown）とする。
+
+    Args:
+        platform: SNS名
+        account: アカウント名
+        sent: 送信を始めていたかどうか
+    """
+    timeout = get_post_timeout(platform)
+    if not sent:
+        return {
+            "success": False,
+            "error": f"{timeout:g}秒以内に投稿を開始できなかったため、投稿を取り消しました（タイムアウト）",
+            "timeout": True,
+            "sent": False,
+        }
+    return {
+        "success": False,
+        "error": (
+            f"{timeout:g}秒以内に投稿が完了しませんでした（タイムアウト）。"
+            f"送信済みのため、{account_label(platform, account)}に投稿されている（このあと投稿される）可能性があります。"
+            "再投稿する前に投稿されたかどうかを確認してください"
+        ),
+        "timeout": True,
+        "unknown": True,
+    }
+
+
+def is_throttled(platform, account, result, since):
+    """
+    投稿が失敗し、since（UNIX時刻）以降にSNSから429（レート制限）を返されていたかどうかを返す。
+    """
+    return not result.get("success") and rate_limiter.throttled_since(
+        platform, account, since
+    )
+
+
+class _QueuedPost:
+    """
+    同期版の投稿エンジンで、1つのアカウントへの投稿を進める。
+    レート制限の枠を待つ間はレートリミッターの待ち行列に置き（スレッドを使わない）、
+    枠を取得してからスレッドプールで送信する。SNSに429を返された投稿も待ち行列に戻し、1度だけやり直す。
+    """
+
+    def __init__(self, client, platform, account, wait_timeout, **post):
+        """
+        _QueuedPostの初期化。start()で待ち行列に並ぶ。
+
+        Args:
+            client: SnsClient
+            platform: SNS名
+            account: アカウント名
+            wait_timeout: 送信を始めるまで待つ最大秒数（Noneなら枠が空くまで待つ）
+            post: _post_to_platformに渡すcontent・media・variants
+        """
+        self.client = client
+        self.platform = platform
+        self.account = account
+        self.post = post
+        self.future = Future()
+        self.wait_until = None if wait_timeout is None else time.monotonic() + wait_timeout
+        # 送信を始めた時刻（time.monotonic()の値、送信していない間はNone）
+        self.sending_since = None
+        self._lock = threading.Lock()
+        self._reservation = None
+        # 結果が決まったか取り消した（これ以上送信しない）かどうか
+        self._closed = False
+        # 429を返された1回目の結果と、その送信にかかった秒数
+        self._throttled = None
+        self._elapsed = None
+        self._queued_at = None
+        self._circuit = client.circuit_key(platform, account)
+        self._run = profiler.bind(self._send)
+
+    def start(self):
+        """
+        レート制限の待ち行列に並ぶ（枠が空いていればすぐにスレッドプールへ投入する）。
+        """
+        timeout = None
+        if self.wait_until is not None:
+            timeout = max(0.0, self.wait_until - time.monotonic())
+        self._queued_at = time.monotonic()
+        reservation = rate_limiter.reserve(
+            self.platform, self.account, self._on_acquired, timeout=timeout
+        )
+        with self._lock:
+            self._reservation = reservation
+
+    def expires_at(self):
+        """
+        打ち切る時刻（time.monotonic()の値）を返す。期限なく待つ投稿はNone。
+        送信中の投稿は送信を始めてから投稿期限まで、送信前の投稿はwait_untilまで。
+        """
+        with self._lock:
+            if self.sending_since is not None:
+                return self.sending_since + get_post_timeout(self.platform)
+            return self.wait_until
+
+    def expire(self):
+        """
+        期限を過ぎていれば投稿を打ち切り、結果を返す。
+        送信前の投稿は取り消し、送信中の投稿は止められないため結果が不明として返す。
+        Returns:
+            投稿結果のdict（期限内、または結果が出ている場合はNone）
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.future.done():
+                return None
+            if self.sending_since is not None:
+                if now < self.sending_since + get_post_timeout(self.platform):
+                    return None
+                return timeout_result(self.platform, self.account, sent=True)
+            if self._closed or self.wait_until is None or now < self.wait_until:
+                return None
+            self._closed = True
+            reservation = self._reservation
+        self.future.cancel()
+        # 枠を待っている予約は待ち行列から外す（枠を取得済みの場合は送信前に返される）
+        waiting = reservation is not None and reservation.cancel()
+        if self._throttled is not None:
+            result = self._rate_limited(self._throttled)
+            circuit_breakers.record(self._circuit, result, self._elapsed)
+            return result
+        circuit_breakers.release(self._circuit)
+        if waiting:
+            return rate_limited_result(account_label(self.platform, self.account))
+        return timeout_result(self.platform, self.account, sent=False)
+
+    def _rate_limited(self, result):
+        return {**result, "error_type": "RateLimited", "rate_limited": True}
+
+    def _on_acquired(self, acquired):
+        """
+        レート制限の枠を取得できた（できなかった）ときに呼ばれる。
+        """
+        phase_duration.observe(
+            time.monotonic() - self._queued_at,
+            platform=self.platform,
+            phase="rate_limit_wait",
+        )
+        with self._lock:
+            if self._closed:
+                if acquired:
+                    rate_limiter.refund(self.platform, self.account)
+                return
+            self._closed = not acquired
+        if not acquired:
+            if self._throttled is not None:
+                self._finish(self._rate_limited(self._throttled), self._elapsed)
+            else:
+                circuit_breakers.release(self._circuit)
+                self._set_result(rate_limited_result(account_label(self.platform, self.account)))
+            return
+        try:
+            self.client.executor.submit(self._run)
+        except RuntimeError as e:
+            # シャットダウン中でスレッドプールに投入できない
+            rate_limiter.refund(self.platform, self.account)
+            circuit_breakers.release(self._circuit)
+            self._set_result(
+                self.client.handle_exception(e, account_label(self.platform, self.account))
+            )
+
+    def _send(self):
+        """
+        投稿を送信する（ワーカースレッドで実行される）。
+        """
+        with self._lock:
+            if self._closed:
+                rate_limiter.refund(self.platform, self.account)
+                return
+            self.sending_since = started = time.monotonic()
+        sent_at = time.time()
+        with posts_in_flight.track_inprogress(platform=self.platform), post_duration.time(
+            platform=self.platform
+        ):
+            result = self.client._post_to_platform(self.platform, self.account, **self.post)
+        elapsed = time.monotonic() - started
+        if is_throttled(self.platform, self.account, result, sent_at):
+            if self._throttled is None:
+                # SNSに429を返された投稿は、ワーカーを空けて制限が解けるまで待ち行列で待つ
+                with self._lock:
+                    self._throttled = result
+                    self._elapsed = elapsed
+                    self.sending_since = None
+                self.start()
+                return
+            result = self._rate_limited(result)
+        self._finish(result, elapsed)
+
+    def _finish(self, result, elapsed):
+        # 期限切れで結果を待たれなくなった投稿も、かかった時間を障害の判定に使う
+        circuit_breakers.record(self._circuit, result, elapsed)
+        self._set_result(result)
+
+    def _set_result(self, result):
+        with self._lock:
+            self._closed = True
+            if not self.future.done():
+                self.future.set_result(result)
+
+
 class SnsClient:
-    def __init__(self):
-        self.clients = {}
-        self.setup_clients()
+    def __init__(self, accounts=None):
+        """
+        SnsClientの初期化。
+
+        Args:
+            accounts: AccountRegistry（省略時はload_accounts()で読み込む）
+        """
+        self.accounts = load_accounts() if accounts is None else accounts
+        # 画像加工のワーカープロセスは、投稿用のスレッドが動き出す前に起動する
+        start_preprocessor(self.accounts)
+        # posters / client_states のキーは(SNS名, アカウント名)
         self.posters = {}
-        self.setup_posters()
+        self.client_states = {}
+        self._state_lock = threading.Lock()
+        max_workers = int(os.getenv("POST_MAX_WORKERS", POST_SETTINGS["max_workers"]))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sns-post"
+        )
+        self.init_executor = ThreadPoolExecutor(
+            max_workers=max(1, min(len(self.accounts), CLIENT_INIT_SETTINGS["max_workers"])),
+            thread_name_prefix="sns-init",
+        )
+        self.setup_clients()
 
     def setup_clients(self):
         """
-        各SNSクライアントのセットアップを行う。
-        環境変数から認証情報を取得し、各SNSのAPIクライアントを初期化する。
+        各SNSクライアントのセットアップを開始する。
+        設定されているアカウントごとに、バックグラウンドで並列に初期化する。
+        初期化の完了を待たずに戻るため、起動時にネットワーク待ちが発生しない。
         """
-        try:
-            bluesky_username = os.getenv("BLUESKY_USERNAME")
-            bluesky_password = os.getenv("BLUESKY_PASSWORD")
-            if bluesky_username and bluesky_password:
-                bluesky_client = AtprotoClient()
-                bluesky_client.login(bluesky_username, bluesky_password)
-                # Blueskyの認証情報も保持
-                self.clients["bluesky"] = {
-                    "client": bluesky_client,
-                    "username": bluesky_username,
-                    "password": bluesky_password,
-                }
-        except Exception as e:
-            print(f"Bluesky setup error: {e}")
+        for platform, account, _ in self.accounts:
+            self._set_state(platform, account, STATE_PENDING, attempts=0)
+            self.init_executor.submit(self._init_platform, platform, account)
 
-        try:
-            x_api_key = os.getenv("X_API_KEY")
-            x_api_secret = os.getenv("X_API_SECRET")
-            x_access_token = os.getenv("X_ACCESS_TOKEN")
-            x_access_token_secret = os.getenv("X_ACCESS_TOKEN_SECRET")
-            if all([x_api_key, x_api_secret, x_access_token, x_access_token_secret]):
-                auth = tweepy.Client(
-                    consumer_key=x_api_key,
-                    consumer_secret=x_api_secret,
-                    access_token=x_access_token,
-                    access_token_secret=x_access_token_secret,
-                )
-                x_client = auth
-                self.clients["x"] = x_client
-        except Exception as e:
-            print(f"X/Twitter setup error: {e}")
+    def _set_state(self, platform, account, state, **fields):
+        with self._state_lock:
+            current = self.client_states.get((platform, account), {})
+            self.client_states[(platform, account)] = {**current, "state": state, **fields}
 
-        try:
-            misskey_token = os.getenv("MISSKEY_API_TOKEN")
-            misskey_instance = os.getenv("MISSKEY_INSTANCE_URL")
-            if misskey_token and misskey_instance:
-                misskey_client = misskey.Misskey(misskey_instance, i=misskey_token)
-                self.clients["misskey"] = misskey_client
-        except Exception as e:
-            print(f"Misskey setup error: {e}")
+    def get_state(self, platform, account=None):
+        """
+        SNSクライアントの状態を返す。
+        アカウントを省略した場合はSNS全体の状態（利用できるアカウントがあればready、
+        なければ初期化中のアカウントがあればpending、すべて失敗していればfailed）を返す。
+        Returns:
+            "pending" / "ready" / "failed"、未設定の場合はNone
+        """
+        with self._state_lock:
+            if account is not None:
+                return self.client_states.get((platform, account), {}).get("state")
+            states = {
+                info["state"]
+                for (name, _), info in self.client_states.items()
+                if name == platform
+            }
+        for state in (STATE_READY, STATE_PENDING, STATE_FAILED):
+            if state in states:
+                return state
+        return None
 
-        try:
-            threads_instance = os.getenv("THREADS_ACCESS_TOKEN")
-            if threads_instance:
-                self.clients["threads"] = threads_instance
-        except Exception as e:
-            print(f"Misskey setup error: {e}")
+    def account_states(self, platform):
+        """
+        SNSのアカウントごとの状態を返す。
+        Returns:
+            アカウント名をキー、{"state": ..., "error": ..., "circuit": サーキットブレーカーの状態}を
+            値とする辞書（circuitのkeyはブレーカーを共有する単位）
+        """
+        with self._state_lock:
+            states = {
+                account: {"state": info["state"], "error": info.get("error")}
+                for (name, account), info in self.client_states.items()
+                if name == platform
+            }
+        for account, info in states.items():
+            key = self.circuit_key(platform, account)
+            info["circuit"] = {"key": key, **circuit_breakers.snapshot(key)}
+        return states
+
+    def circuit_key(self, platform, account):
+        """
+        アカウントの投稿に使うサーキットブレーカーのキーを返す。
+        インスタンスごとに障害が分かれるSNS（Mastodon・Misskey）は"SNS名@ホスト名[:ポート]"で
+        同じインスタンスのアカウント間で共有し、それ以外は"SNS名:アカウント名"とする。
+        """
+        config = self.accounts.get(platform, account) or {}
+        url = urlparse(config.get("instance_url") or "")
+        host = url.hostname and (f"{url.hostname}:{url.port}" if url.port else url.hostname)
+        if host:
+            return f"{platform}@{host}"
+        return f"{platform}:{account}"
 
+    def _init_platform(self, platform, account):
+        """
+        1つのアカウントのクライアントとPosterを初期化する。
+        失敗した場合は間隔を伸ばしながら再試行を予約する。
+        """
+        label = account_label(platform, account)
+        with self._state_lock:
+            attempts = self.client_states[(platform, account)].get("attempts", 0) + 1
         try:
-            mastodon_token = os.getenv("MASTODON_ACCESS_TOKEN")
-            mastodon_instance = os.getenv("MASTODON_INSTANCE_URL")
-            if mastodon_token and mastodon_instance:
-                mastodon_client = Mastodon(
-                    access_token=mastodon_token, api_base_url=mastodon_instance
-                )
-                self.clients["mastodon"] = mastodon_client
+            config = self.accounts.get(platform, account)
+            self.posters[(platform, account)] = self.create_poster(platform, account, config)
+            self._set_state(platform, account, STATE_READY, attempts=attempts, error=None)
+            logger.info(f"{label}クライアントの初期化が完了しました")
         except Exception as e:
-            print(f"Mastodon setup error: {e}")
+            delay = min(
+                CLIENT_INIT_SETTINGS["retry_interval"] * 2 ** (attempts - 1),
+                CLIENT_INIT_SETTINGS["retry_max_interval"],
+            )
+            error = str(e) or e.__class__.__name__
+            self._set_state(platform, account, STATE_FAILED, attempts=attempts, error=error)
+            logger.error(
+                f"{label}クライアントの初期化に失敗しました: {error}（{delay}秒後に再試行）"
+            )
+            timer = threading.Timer(
+                delay,
+                self.init_executor.submit,
+                args=(self._init_platform, platform, account),
+            )
+            timer.daemon = True
+            timer.start()
 
-    def setup_posters(self):
+    def create_poster(self, platform, account, config):
         """
-        各SNS投稿クラス（Poster）のセットアップを行う。
-        利用可能なSNSクライアントごとにPosterインスタンスを生成し、self.postersに格納する。
+        アカウントのSNSクライアントとPosterを生成する（PosterのモジュールとSDKはここで読み込む）。
+        アップロード済みメディアのキャッシュはアカウントごとに分ける。
+        Args:
+            platform: SNS名
+            account: アカウント名
+            config: アカウントの設定
+        Returns:
+            Poster
         """
-        if "bluesky" in self.clients:
-            # BlueskyPosterに認証情報も渡す
-            bluesky_info = self.clients["bluesky"]
-            self.posters["bluesky"] = BlueskyPoster(
-                bluesky_info["client"],
-                username=bluesky_info["username"],
-                password=bluesky_info["password"],
-            )
-        if "x" in self.clients:
-            self.posters["x"] = XPoster(self.clients["x"])
-        if "threads" in self.clients:
-            self.posters["threads"] = ThreadsPoster(self.clients["threads"])
-        if "misskey" in self.clients:
-            self.posters["misskey"] = MisskeyPoster(self.clients["misskey"])
-        if "mastodon" in self.clients:
-            self.posters["mastodon"] = MastodonPoster(self.clients["mastodon"])
+        factory = get_platform(platform).poster_factory()
+        return factory(account, config, media_cache.for_account(account))
 
     def compress_image_for_platform(
-        self, image_path, max_size=None, min_size=None, max_attempts=None
+        self, media, platform="bluesky", max_size=None, min_size=None, max_attempts=None
     ):
         """
-        汎用画像圧縮・リサイズ関数。
+        汎用画像圧縮・リサイズ関数（呼び出し元のスレッドで実行する）。
         指定サイズ・回数制限内で画像を圧縮・リサイズし、バイト列を返す。
+        縮小率の見積もりと品質の補間探索により、少ないエンコード回数で収める。
+        通常の投稿ではprepare_mediaでワーカープロセスに加工させ、これは予備として使う。
         Args:
-            image_path: 画像ファイルパス
+            media: 画像（Media）
+            platform: SNS名（省略した制限の既定値と、所要時間の計測に使う）
             max_size: バイト単位の最大サイズ
             min_size: 最小幅・高さ
-            max_attempts: 最大試行回数
+            max_attempts: 最大エンコード回数
         Returns:
             (buf, format) or (None, error_message)
         """
+        limits = IMAGE_LIMITS[platform]
         if max_size is None:
-            max_size = IMAGE_LIMITS["bluesky"]["max_size"]
+            max_size = limits["max_size"]
         if min_size is None:
-            min_size = IMAGE_LIMITS["bluesky"]["min_size"]
+            min_size = limits["min_size"]
         if max_attempts is None:
-            max_attempts = IMAGE_LIMITS["bluesky"]["max_attempts"]
-        try:
-            with open(image_path, "rb") as f:
-                img_bytes = f.read()
-            img = Image.open(io.BytesIO(img_bytes))
-            format = img.format if img.format in ["JPEG", "PNG"] else "JPEG"
-            quality = 85
-            buf = io.BytesIO()
-            for attempt in range(max_attempts):
-                buf = io.BytesIO()
-                img.save(buf, format=format, quality=quality, optimize=True)
-                if buf.tell() <= max_size:
-                    buf.seek(0)
-                    return buf, format
-                if (attempt + 1) % 5 == 0:
-                    w, h = img.size
-                    if w < min_size or h < min_size:
-                        break
-                    img = img.resize((max(1, int(w * 0.8)), max(1, int(h * 0.8))))
-                    quality = 85
-                else:
-                    quality = max(30, quality - 10)
-            return (
-                None,
-                f"画像が制限({max_size // 1024}KB)以下になりません: {os.path.basename(image_path)}",
+            max_attempts = limits["max_attempts"]
+        with time_phase(platform, "compress"):
+            return compress_variant(
+                media.view(), media.filename, max_size, min_size, max_attempts
             )
-        except Exception as e:
-            return None, str(e)
+
+    def prepare_media(self, platform, media, accounts=(DEFAULT_ACCOUNT,)):
+        """
+        プラットフォームに合わせた画像の加工をワーカープロセスで開始する。
+        加工結果は同じSNSのアカウント間で共有し、
+        すべてのアカウントでアップロード済み（キャッシュにある）の画像は加工しない。
+        Args:
+            platform: SNS名
+            media: 画像（Media）のリスト
+            accounts: 投稿するアカウント名のリスト
+        Returns:
+            画像ごとの加工結果のFutureのリスト（加工が不要な場合はNone）
+        """
+        return image_preprocessor.prepare(
+            platform,
+            media,
+            skip=lambda item: all(
+                media_cache.get(platform, item.digest, account) for account in accounts
+            ),
+        )
 
     def handle_exception(self, e, platform_name=None):
         """
@@ -175,70 +550,228 @@ class SnsClient:
         msg = str(e)
         if platform_name:
             msg = f"{platform_name}エラー: {msg}"
-        return {"success": False, "error": msg}
+        return {
+            "success": False,
+            "error": msg,
+            "error_type": type(e).__name__,
+            "transient": is_transient(e),
+        }
 
-    def _get_image_paths_limited(self, image_paths, platform):
+    def _get_media_limited(self, media, platform):
         """
-        指定プラットフォームの最大枚数まで画像パスリストを制限する。
+        指定プラットフォームの最大枚数まで画像リストを制限する。
         Args:
-            image_paths: 画像パスのリスト
+            media: 画像（Media）のリスト
             platform: SNS名
         Returns:
-            制限後の画像パスリスト
+            制限後の画像リスト
         """
-        if not image_paths:
+        if not media:
             return []
         max_images = IMAGE_LIMITS.get(platform, {}).get("max_images", 4)
-        return image_paths[:max_images]
+        return media[:max_images]
 
-    def _upload_images_bluesky(self, bluesky_client, image_paths):
+    def _post_to_platform(self, platform, account, content, media, variants):
         """
-        Bluesky用の画像アップロード処理。
-        圧縮・リサイズ後の画像をBlueskyにアップロードし、blob情報リストを返す。
+        1つのアカウントへ投稿する（ワーカースレッドで実行される）。
+        レート制限の枠は呼び出し元（_QueuedPost）が取得済み。
         Args:
-            bluesky_client: Blueskyクライアント
-            image_paths: 画像パスリスト
+            platform: SNS名
+            account: アカウント名
+            content: 投稿本文
+            media: 画像（Media）のリスト（最大枚数で制限済み）
+            variants: 加工済み画像のFutureのリスト（prepare_mediaの戻り値）
         Returns:
-            (images, None) or (None, error_message)
-        """
-        images = []
-        for image_path in self._get_image_paths_limited(image_paths, "bluesky"):
-            buf, err = self.compress_image_for_platform(
-                image_path,
-                max_size=IMAGE_LIMITS["bluesky"]["max_size"],
-                min_size=IMAGE_LIMITS["bluesky"]["min_size"],
-                max_attempts=IMAGE_LIMITS["bluesky"]["max_attempts"],
-            )
-            if buf is None:
-                return None, err
-            blob = bluesky_client.com.atproto.repo.upload_blob(buf)
-            images.append({"alt": "image", "image": blob["blob"]})
-        return images, None
+            投稿結果のdict
+        """
+        poster = self.posters[(platform, account)]
+        try:
+            if platform == "bluesky":
+                return poster.post(content, media, self.compress_image_for_platform, variants)
+            return poster.post(content, media)
+        except Exception as e:
+            return self.handle_exception(e, account_label(platform, account))
 
-    def post_to_platforms(self, posts):
+    def _plan(self, posts):
         """
-        複数のプラットフォームに投稿する関数。
+        投稿先（postsのキー）ごとに、投稿するアカウントを決める。
+        キーが"SNS名"の場合はそのSNSのすべてのアカウント（postのaccountsで絞り込める）、
+        "SNS名:アカウント名"の場合はそのアカウントだけに投稿する。
+        本文がない投稿先と、アカウントが設定されていないSNSは除く。
         Args:
-            posts: プラットフォーム名をキー、{"content":..., "image_paths":...}を値とする辞書
+            posts: 投稿先をキー、{"content":..., "media":..., "accounts":...}を値とする辞書
+        Returns:
+            (投稿先, SNS名, アカウント名のリスト, post)のリスト
+        """
+        plan = []
+        for key, post in posts.items():
+            if not post.get("content"):
+                continue
+            platform, account = split_target(key)
+            if account:
+                accounts = [account]
+            else:
+                accounts = post.get("accounts") or self.accounts.names(platform)
+            if accounts:
+                plan.append((key, platform, list(accounts), post))
+        return plan
+
+    def _unavailable_result(self, platform, account):
+        """
+        アカウントが投稿できる状態でなければ、その理由の結果を返す。
+        アカウントのサーキットブレーカー（circuit_key）が投稿を停止している場合も、すぐに失敗の結果を返す。
+        Noneを返した（投稿できる）場合は、投稿しなかったときにcircuit_breakers.release()を呼ぶこと。
         Returns:
-            各プラットフォームの投稿結果を含む辞書
-        """
-        results = {}
-        for platform, post in posts.items():
-            content = post.get("content")
-            image_paths = post.get("image_paths")
-            if platform in self.posters and content:
-                if platform == "bluesky":
-                    results[platform] = self.posters[platform].post(
-                        content,
-                        self._get_image_paths_limited(image_paths, platform),
-                        self.compress_image_for_platform,
-                    )
+            投稿結果のdict、投稿できる場合はNone
+        """
+        label = account_label(platform, account)
+        state = self.get_state(platform, account)
+        if state is None:
+            return {
+                "success": False,
+                "error": f"{label}のアカウントは設定されていません",
+                "error_type": "UnknownAccount",
+            }
+        if state == STATE_PENDING:
+            return {
+                "success": False,
+                "error": f"{label}クライアントを初期化中です。しばらくしてから再度お試しください",
+                "error_type": "ClientNotReady",
+            }
+        if state == STATE_FAILED:
+            with self._state_lock:
+                error = self.client_states[(platform, account)].get("error")
+            return {
+                "success": False,
+                "error": f"{label}クライアントの初期化に失敗しています: {error}",
+                "error_type": "ClientNotReady",
+            }
+        circuit = self.circuit_key(platform, account)
+        retry_after = circuit_breakers.allow(circuit)
+        if retry_after:
+            return {
+                "success": False,
+                "error": f"{circuit}で障害が続いているため投稿を停止しています（{retry_after:.0f}秒後に再開を試みます）",
+                "error_type": "CircuitOpen",
+            }
+        return None
+
+    def iter_post_to_platforms(self, posts, wait_for_rate_limit=False):
+        """
+        複数のプラットフォームへ並列に投稿し、完了したものから結果を返すジェネレータ。
+        各プラットフォームには投稿期限があり、期限内に終わらなかったものは
+        タイムアウトの結果（timeout_result）として返す。
+        投稿期限は送信を始めた時点から数え、レート制限やスレッドプールの順番待ちは含まない。
+        順番待ちも投稿期限までに送信を始められなければ打ち切るが、
+        wait_for_rate_limitを指定した場合はレート制限の枠が空くまで待つ（ジョブ・一括投稿・予約投稿）。
+        投稿先に複数のアカウントが含まれる場合は、すべてのアカウントへ同時に投稿し、
+        結果は投稿先ごとにまとめて返す（merge_account_results）。
+        Args:
+            posts: 投稿先（SNS名または"SNS名:アカウント名"）をキー、
+                {"content":..., "media":..., "accounts":...}を値とする辞書
+            wait_for_rate_limit: レート制限の枠が空くまで期限なく待つかどうか
+        Yields:
+            (投稿先, 投稿結果のdict)
+        """
+        plan = self._plan(posts)
+        collected = _AccountResults(plan)
+        with post_batches_in_flight.track_inprogress(), post_batch_duration.time():
+            for key, account, result in self._iter_post_results(plan, wait_for_rate_limit):
+                record_result(split_target(key)[0], result)
+                merged = collected.add(key, account, result)
+                if merged is not None:
+                    yield key, merged
+
+    def _iter_post_results(self, plan, wait_for_rate_limit=False):
+        """
+        iter_post_to_platformsの本体（計測・集約を除く）。投稿エンジンごとに実装する。
+        Yields:
+            (投稿先, アカウント名, 投稿結果のdict)
+        """
+        queued = {}
+        variants = {}
+        for key, platform, accounts, post in plan:
+            ready = []
+            for account in accounts:
+                result = self._unavailable_result(platform, account)
+                if result is None:
+                    ready.append(account)
                 else:
-                    results[platform] = self.posters[platform].post(
-                        content, self._get_image_paths_limited(image_paths, platform)
-                    )
-        return results
+                    yield key, account, result
+            if not ready:
+                continue
+            wait_timeout = None if wait_for_rate_limit else get_post_timeout(platform)
+            # 画像の加工は投稿スレッドやレート制限の待ちを待たずに始め、アカウント間で共有する
+            media = self._get_media_limited(post.get("media"), platform)
+            variants[key] = self.prepare_media(platform, media, ready)
+            for account in ready:
+                queued_post = _QueuedPost(
+                    self,
+                    platform,
+                    account,
+                    wait_timeout,
+                    content=post["content"],
+                    media=media,
+                    variants=variants[key],
+                )
+                queued[queued_post.future] = (key, account, queued_post)
+                queued_post.start()
+
+        pending = set(queued)
+        # 期限を過ぎても送信中の投稿がある投稿先（加工済み画像を取り消さない）
+        running = set()
+        while pending:
+            expiries = [queued[f][2].expires_at() for f in pending]
+            known = [e for e in expiries if e is not None]
+            timeout = max(0, min(known) - time.monotonic()) if known else None
+            if len(known) < len(expiries):
+                # 期限なく待っている投稿は、送信を始めたら期限を数え始める
+                timeout = min(timeout, QUEUED_POLL_INTERVAL) if known else QUEUED_POLL_INTERVAL
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, account, _ = queued[future]
+                yield key, account, future.result()
+            for future in list(pending):
+                key, account, queued_post = queued[future]
+                result = queued_post.expire()
+                if result is None:
+                    continue
+                if result.get("unknown"):
+                    running.add(key)
+                pending.discard(future)
+                if key not in running and not any(queued[f][0] == key for f in pending):
+                    for variant in variants[key] or []:
+                        if variant:
+                            variant.cancel()
+                yield key, account, result
+
+    def post_to_platforms(self, posts, wait_for_rate_limit=False):
+        """
+        複数のプラットフォームに並列で投稿する関数。
+        全体の所要時間は最も遅いプラットフォーム（最大で投稿期限）で決まる。
+        Args:
+            posts: 投稿先（SNS名または"SNS名:アカウント名"）をキー、
+                {"content":..., "media":..., "accounts":...}を値とする辞書
+            wait_for_rate_limit: レート制限の枠が空くまで期限なく待つかどうか
+                （iter_post_to_platformsを参照）
+        Returns:
+            各投稿先の投稿結果を含む辞書（postsの順序を保持）
+        """
+        results = dict(self.iter_post_to_platforms(posts, wait_for_rate_limit))
+        return {platform: results[platform] for platform in posts if platform in results}
+
+
+def create_sns_client():
+    """
+    環境変数POST_ENGINEに応じた投稿エンジンを生成する。
+    thread（既定）: 同期Poster＋スレッドプール / async: asyncio＋httpxの非同期Poster
+    """
+    if os.getenv("POST_ENGINE", "thread") == "async":
+        # async_sns_clientはこのモジュールに依存するため、ここで読み込む
+        from async_sns_client import AsyncSnsClient
+
+        return AsyncSnsClient()
+    return SnsClient()
 
 
-sns_client = SnsClient()
+sns_client = create_sns_client()
@@ -6,14 +6,35 @@ Attributes:
     client: Bluesky APIクライアントインスタンス
 """
 
-from constants import IMAGE_LIMITS
 import logging
+import os
+
+from atproto import Client as AtprotoClient
+from atproto_client.request import Request as AtprotoRequest
+
+from constants import IMAGE_LIMITS
+from http_pool import api_base_url
+from rate_limiter import rate_limiter
+from session_store import SessionStore
+from sns_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import is_transient, with_retry
 
 logger = logging.getLogger(__name__)
 
+# Blueskyのセッション保存先（同期版・非同期版で共有する）
+bluesky_sessions = SessionStore(
+    os.getenv(
+        "BLUESKY_SESSION_FILE",
+        os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "data", "bluesky_sessions.json"
+        ),
+    )
+)
+
 
 class BlueskyPoster:
-    def __init__(self, client, username=None, password=None):
+    def __init__(self, client, username=None, password=None, media_cache=None):
         """
         BlueskyPosterの初期化。
 
@@ -21,115 +42,233 @@ class BlueskyPoster:
             client: Bluesky APIクライアント
             username: Blueskyユーザー名（リフレッシュ用）
             password: Blueskyパスワード（リフレッシュ用）
+            media_cache: アップロード済みblobのキャッシュ（任意）
         """
         self.client = client
         self.username = username
         self.password = password
+        self.media_cache = media_cache
 
-    def compress_image(self, compress_image_for_platform, image_path):
+    def compress_image(self, compress_image_for_platform, media):
         """
         Bluesky用に画像を圧縮する。
 
         Args:
             compress_image_for_platform: 圧縮関数
-            image_path: 画像ファイルパス
+            media: 画像（Media）
         Returns:
             (圧縮後バッファ, エラー文字列)
         """
         return compress_image_for_platform(
-            image_path,
+            media,
+            platform="bluesky",
             max_size=IMAGE_LIMITS["bluesky"]["max_size"],
             min_size=IMAGE_LIMITS["bluesky"]["min_size"],
             max_attempts=IMAGE_LIMITS["bluesky"]["max_attempts"],
         )
 
-    def upload_images(self, compress_image_for_platform, image_paths):
+    def upload_images(self, compress_image_for_platform, media, variants=None):
         """
-        画像をBlueskyにアップロードする。
+        画像をBlueskyに並列でアップロードする。
+        同じ画像のblobがキャッシュにあれば、圧縮とアップロードを省略する。
+        加工済み画像のFutureが渡された場合は、各画像の加工が終わり次第アップロードする。
+        未参照のblobはPDS側で削除されるため、失敗時の後始末は行わない。
 
         Args:
-            compress_image_for_platform: 圧縮関数
-            image_paths: 画像ファイルパスのリスト
+            compress_image_for_platform: 圧縮関数（加工済み画像がない場合に使う）
+            media: 画像（Media）のリスト
+            variants: 画像ごとの加工結果のFutureのリスト（任意）
         Returns:
             (アップロード済み画像リスト, エラー文字列)
         """
-        images = []
-        for image_path in image_paths:
-            buf, err = self.compress_image(compress_image_for_platform, image_path)
+
+        def upload_one(pair):
+            item, variant = pair
+            blob = self.media_cache and self.media_cache.get("bluesky", item.digest)
+            if blob:
+                if variant:
+                    variant.cancel()
+                return blob, None, False
+            if variant:
+                buf, err = variant.result()
+            else:
+                buf, err = self.compress_image(compress_image_for_platform, item)
             if buf is None:
-                return None, err
-            blob = self.client.com.atproto.repo.upload_blob(buf)
-            images.append({"alt": "image", "image": blob["blob"]})
-        return images, None
+                return None, err, False
+            # blobは内容で識別されるため、再送しても重複しない
+            blob = with_retry(
+                "bluesky", lambda: self.client.com.atproto.repo.upload_blob(buf)
+            )["blob"]
+            if self.media_cache:
+                self.media_cache.put("bluesky", item.digest, blob)
+            return blob, None, True
+
+        blobs, err = upload_in_parallel(
+            upload_one,
+            list(zip(media, variants or [None] * len(media))),
+            IMAGE_LIMITS["bluesky"]["upload_concurrency"],
+        )
+        if err:
+            return None, err
+        return [{"alt": "image", "image": blob} for blob in blobs], None
 
-    def post(self, content, image_paths, compress_image_for_platform):
+    def refresh_session(self):
+        """
+        セッションを更新する。
+        他のプロセスが保存した新しいセッションがあればそれを使い、なければリフレッシュトークンで
+        更新し、失敗した場合のみパスワードで再ログインする
+        （Blueskyはセッション作成の回数を制限しているため）。
+        更新は他のプロセスとファイルロックで排他する。
+
+        Returns:
+            エラー文字列（成功時はNone）
+        """
+        # セッションファイルは他のプロセスと共有するため、ロックを取ってから読み直す
+        with bluesky_sessions.lock():
+            stored = bluesky_sessions.load(self.username)
+            if stored and stored != self.client.export_session_string():
+                # 他のプロセスが更新済みのセッションを使う（期限切れならここで更新される）
+                try:
+                    self.client.login(session_string=stored)
+                    return None
+                except Exception as e:
+                    logger.warning(f"保存済みのBlueskyセッションを利用できません: {e}")
+            try:
+                self.client._refresh_and_set_session()
+                return None
+            except Exception as e:
+                logger.warning(f"Blueskyリフレッシュトークンでの更新に失敗: {str(e)}")
+            # loginにはユーザー名・パスワードが必要
+            if hasattr(self.client, "login") and self.username and self.password:
+                self.client.login(self.username, self.password)
+                return None
+        return "Bluesky認証情報が不足しています（ユーザー名・パスワード）"
+
+    def post(self, content, media, compress_image_for_platform, variants=None):
         """
         Blueskyへ投稿を行う。
 
         Args:
             content: 投稿本文
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）のリスト
             compress_image_for_platform: 画像圧縮関数
+            variants: 画像ごとの加工結果のFutureのリスト（任意）
         Returns:
             dict: 投稿結果（success, response/error）
         """
 
+        # アップロード済みのblobはトークン更新後の再試行でも使い回す
+        uploaded = {}
+
         def try_post():
-            images = []
             err = None
-            if image_paths:
-                images, err = self.upload_images(
-                    compress_image_for_platform, image_paths
-                )
+            if media and "images" not in uploaded:
+                with time_phase("bluesky", "upload"):
+                    images, err = self.upload_images(
+                        compress_image_for_platform, media, variants
+                    )
                 if err:
                     return {"success": False, "error": err}
-            if images:
-                self.client.send_post(
-                    content,
-                    embed={
-                        "$type": "app.bsky.embed.images",
-                        "images": images,
-                    },
-                    langs=["ja"],
+                uploaded["images"] = images
+            images = uploaded.get("images")
+            with time_phase("bluesky", "publish"):
+                embed = None
+                if images:
+                    embed = {"$type": "app.bsky.embed.images", "images": images}
+                # 投稿の作成は冪等ではないため、接続できなかった場合だけ再試行する
+                with_retry(
+                    "bluesky",
+                    lambda: self.client.send_post(content, embed=embed, langs=["ja"]),
+                    idempotent=False,
+                )
+            if images and self.media_cache:
+                self.media_cache.mark_posted(
+                    "bluesky", [item.digest for item in media]
                 )
-            else:
-                self.client.send_post(content, langs=["ja"])
             return {"success": True, "response": "投稿成功"}
 
         try:
             return try_post()
         except Exception as e:
             logger.error(f"Bluesky投稿エラー: {str(e)}", exc_info=True)
-            # InvalidTokenエラー時はリフレッシュして再試行
+            # InvalidToken/ExpiredTokenエラー時はセッションを更新して再試行
             def is_invalid_token_error(e):
+                token_errors = ("InvalidToken", "ExpiredToken")
                 # 1. e.args[0]がstr型で"InvalidToken"を含む
                 if hasattr(e, "args") and e.args:
-                    if isinstance(e.args[0], str) and "InvalidToken" in e.args[0]:
+                    if isinstance(e.args[0], str) and any(t in e.args[0] for t in token_errors):
                         return True
                     # 2. atproto_client.exceptions.BadRequestError等: e.args[0].content.error == "InvalidToken"
-                    if hasattr(e.args[0], "content") and getattr(e.args[0].content, "error", None) == "InvalidToken":
+                    if hasattr(e.args[0], "content") and getattr(e.args[0].content, "error", None) in token_errors:
                         return True
                 # 3. e.error属性が"InvalidToken"
-                if hasattr(e, "error") and getattr(e, "error", None) == "InvalidToken":
+                if hasattr(e, "error") and getattr(e, "error", None) in token_errors:
                     return True
                 return False
 
             if is_invalid_token_error(e):
                 try:
-                    # loginにはユーザー名・パスワードが必要
-                    if (
-                        hasattr(self.client, "login")
-                        and self.username
-                        and self.password
-                    ):
-                        self.client.login(self.username, self.password)
-                    else:
-                        return {
-                            "success": False,
-                            "error": "Bluesky認証情報が不足しています（ユーザー名・パスワード）",
-                        }
+                    err = self.refresh_session()
+                    if err:
+                        return {"success": False, "error": err}
                     return try_post()
                 except Exception as e2:
                     logger.error(f"Blueskyリフレッシュ失敗: {str(e2)}", exc_info=True)
-                    return {"success": False, "error": f"リフレッシュ失敗: {str(e2)}"}
-            return {"success": False, "error": str(e)}
+                    return {
+                        "success": False,
+                        "error": f"リフレッシュ失敗: {str(e2)}",
+                        "error_type": type(e2).__name__,
+                    }
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache=None):
+    """
+    アカウントの設定からBlueskyにログインし、Posterを生成する。
+    保存済みのセッションがあれば再利用し、パスワードでのログインを避ける。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（username, password）
+        media_cache: アップロード済みblobのキャッシュ（任意）
+    Returns:
+        BlueskyPoster
+    """
+    username = config["username"]
+    password = config["password"]
+    # 投稿（createRecord）のレスポンスヘッダーからレート制限を把握する
+    client = AtprotoClient(
+        base_url=api_base_url("bluesky"),
+        request=AtprotoRequest(
+            event_hooks={
+                "response": [
+                    rate_limiter.response_hook(
+                        "bluesky", account, paths=["com.atproto.repo.createRecord"]
+                    )
+                ]
+            }
+        ),
+    )
+    # セッションが作成・更新されるたびに保存し、再起動後も再利用する
+    client.on_session_change(
+        lambda event, session: bluesky_sessions.save(username, session.encode())
+    )
+    session_string = bluesky_sessions.load(username)
+    logged_in = False
+    if session_string:
+        try:
+            # アクセストークンが期限切れならリフレッシュトークンで更新される
+            client.login(session_string=session_string)
+            logged_in = True
+        except Exception as e:
+            logger.warning(f"保存済みのBlueskyセッションを利用できません: {e}")
+    if not logged_in:
+        client.login(username, password)
+    return BlueskyPoster(
+        client, username=username, password=password, media_cache=media_cache
+    )
@@ -1,5 +1,14 @@
 import logging
+import uuid
+
+from mastodon import Mastodon
+
 from constants import IMAGE_LIMITS
+from http_pool import http_pool
+from rate_limiter import rate_limiter
+from sns_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import is_transient, is_unsent, with_retry
 
 logger = logging.getLogger(__name__)
 
@@ -13,54 +22,128 @@ Attributes:
 
 
 class MastodonPoster:
-    def __init__(self, client):
+    def __init__(self, client, media_cache=None):
         """
         MastodonPosterの初期化。
 
         Args:
             client: Mastodon APIクライアント
+            media_cache: アップロード済みmedia_idのキャッシュ（任意）
         """
         self.client = client
+        self.media_cache = media_cache
 
-    def upload_images(self, image_paths):
+    def upload_images(self, media, held):
         """
-        画像をMastodonにアップロードする。
+        画像をMastodonに並列でアップロードする。
+        まだ投稿に添付されていない同じ画像のmedia_idがキャッシュにあれば再利用する。
+        添付済みのメディアは別の投稿に使えないため、使うmedia_idはキャッシュから取り出して
+        heldに記録する（投稿に失敗した場合にrestore_mediaでキャッシュへ戻す）。
 
         Args:
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）のリスト
+            held: 使うmedia_idを記録するリスト（(digest, media_id, 有効期限)を追加する）
         Returns:
             (media_idリスト, エラー文字列)
         """
-        media_ids = []
-        for image_path in image_paths:
-            media = self.client.media_post(image_path)
-            media_ids.append(media["id"])
-        return media_ids, None
 
-    def post(self, content, image_paths=None):
+        def upload_one(item):
+            entry = self.media_cache and self.media_cache.take("mastodon", item.digest)
+            if entry:
+                held.append((item.digest, *entry))
+                return entry[0], None, False
+            media_id = with_retry(
+                "mastodon",
+                lambda: self.client.media_post(
+                    item.open(), mime_type=item.mime_type, file_name=item.filename
+                ),
+            )["id"]
+            held.append((item.digest, media_id, None))
+            return media_id, None, True
+
+        return upload_in_parallel(
+            upload_one, media, IMAGE_LIMITS["mastodon"]["upload_concurrency"]
+        )
+
+    def restore_media(self, held):
+        """
+        投稿に添付されなかったmedia_idをキャッシュに戻し、次回の投稿で再利用できるようにする
+        （未添付のメディアはサーバー側で自動削除される）。
+        """
+        if self.media_cache:
+            for digest, media_id, expires_at in held:
+                self.media_cache.put("mastodon", digest, media_id, expires_at)
+
+    def post(self, content, media=None):
         """
         Mastodonへ投稿を行う。
+        投稿ごとにIdempotency-Keyを付けるため、一時的な障害で再送しても二重投稿にならない。
 
         Args:
             content: 投稿本文
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）のリスト
         Returns:
             dict: 投稿結果（success, response/error）
         """
+        held = []
+        publishing = False
         try:
             media_ids = []
-            if image_paths:
+            if media:
                 max_images = IMAGE_LIMITS["mastodon"]["max_images"]
-                if len(image_paths) > max_images:
+                if len(media) > max_images:
                     return {"success": False, "error": f"画像は{max_images}枚までです"}
-                media_ids, err = self.upload_images(image_paths)
+                with time_phase("mastodon", "upload"):
+                    media_ids, err = self.upload_images(media, held)
                 if err:
+                    self.restore_media(held)
                     return {"success": False, "error": err}
-            if media_ids:
-                self.client.status_post(content, media_ids=media_ids)
-            else:
-                self.client.status_post(content)
+            idempotency_key = uuid.uuid4().hex
+            publishing = True
+            with time_phase("mastodon", "publish"):
+                with_retry(
+                    "mastodon",
+                    lambda: self.client.status_post(
+                        content,
+                        media_ids=media_ids or None,
+                        idempotency_key=idempotency_key,
+                    ),
+                )
             return {"success": True, "response": "投稿成功"}
         except Exception as e:
             logger.error(f"Mastodon投稿エラー: {str(e)}", exc_info=True)
-            return {"success": False, "error": str(e)}
+            # 投稿が作成された（メディアが添付された）可能性がある場合はキャッシュに戻さない
+            if not publishing or is_unsent(e) or not is_transient(e):
+                self.restore_media(held)
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+def create_poster(account, config, media_cache=None):
+    """
+    アカウントの設定からMastodonのクライアントとPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（access_token, instance_url）
+        media_cache: アップロード済みmedia_idのキャッシュ（任意）
+    Returns:
+        MastodonPoster
+    """
+    instance_url = config["instance_url"]
+    session = http_pool.session(instance_url, account=account)
+    session.hooks["response"] = [
+        rate_limiter.response_hook("mastodon", account, paths=["/api/v1/statuses"])
+    ]
+    # レート制限時はMastodon.py内で待たずに例外とし、待機はrate_limiterで行う
+    client = Mastodon(
+        access_token=config["access_token"],
+        api_base_url=instance_url,
+        session=session,
+        request_timeout=http_pool.timeout,
+        ratelimit_method="throw",
+    )
+    return MastodonPoster(client, media_cache=media_cache)
@@ -1,6 +1,11 @@
 import logging
 import misskey
 from constants import IMAGE_LIMITS
+from http_pool import http_pool
+from rate_limiter import rate_limiter
+from sns_posters.upload_pool import upload_in_parallel
+from metrics import time_phase
+from retry import is_transient, with_retry
 
 logger = logging.getLogger(__name__)
 
@@ -11,58 +16,124 @@ class MisskeyPoster:
     画像アップロードやノート投稿のラッパー。
     """
 
-    def __init__(self, client):
+    def __init__(self, client, media_cache=None):
         """
         MisskeyPosterの初期化。
         Args:
             client: Misskeyクライアントインスタンス
+            media_cache: アップロード済みfile_idのキャッシュ（任意）
         """
         self.client = client
+        self.media_cache = media_cache
 
-    def upload_images(self, image_paths):
+    def find_drive_file(self, media):
         """
-        画像ファイルをMisskeyにアップロードし、file_idリストを返す。
+        同じ内容のファイルがドライブにあればそのfile_idを返す。
         Args:
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）
+        Returns:
+            file_id or None
+        """
+        files = with_retry(
+            "misskey", lambda: self.client.drive_files_find_by_hash(media.md5)
+        )
+        return files[0]["id"] if files else None
+
+    def upload_images(self, media):
+        """
+        画像ファイルをMisskeyに並列でアップロードし、file_idリストを返す。
+        キャッシュまたはドライブに同じ画像があればアップロードを省略する。
+        どれかが失敗した場合は、今回新たに作成したドライブのファイルを削除する。
+        Args:
+            media: 画像（Media）のリスト
         Returns:
             (file_ids, None) or (None, error_message)
         """
-        file_ids = []
-        for image_path in image_paths:
-            with open(image_path, "rb") as f:
-                file_obj = self.client.drive_files_create(file=f)
-            file_ids.append(file_obj["id"])
-        return file_ids, None
+        digests = {}
+
+        def upload_one(item):
+            file_id = self.media_cache and self.media_cache.get("misskey", item.digest)
+            if not file_id:
+                file_id = self.find_drive_file(item)
+            created = False
+            if not file_id:
+                file_id = with_retry(
+                    "misskey", lambda: self.client.drive_files_create(file=item.open())
+                )["id"]
+                created = True
+            if self.media_cache:
+                self.media_cache.put("misskey", item.digest, file_id)
+                digests[file_id] = item.digest
+            return file_id, None, created
+
+        def cleanup(file_id):
+            self.client.drive_files_delete(file_id)
+            if file_id in digests:
+                self.media_cache.invalidate("misskey", digests[file_id])
 
-    def post(self, content, image_paths=None):
+        return upload_in_parallel(
+            upload_one,
+            media,
+            IMAGE_LIMITS["misskey"]["upload_concurrency"],
+            cleanup=cleanup,
+        )
+
+    def post(self, content, media=None):
         """
         Misskeyにノートを投稿する。
         Args:
             content: 投稿テキスト
-            image_paths: 画像ファイルパスのリスト（省略可）
+            media: 画像（Media）のリスト（省略可）
         Returns:
             投稿結果のdict
         """
         try:
             file_ids = []
-            if image_paths:
+            if media:
                 max_images = IMAGE_LIMITS["misskey"]["max_images"]
-                if len(image_paths) > max_images:
+                if len(media) > max_images:
                     return {"success": False, "error": f"画像は{max_images}枚までです"}
-                file_ids, err = self.upload_images(image_paths)
+                with time_phase("misskey", "upload"):
+                    file_ids, err = self.upload_images(media)
                 if err:
                     return {"success": False, "error": err}
-            if file_ids:
-                self.client.notes_create(
-                    text=content,
-                    file_ids=file_ids,
-                    visibility=misskey.enum.NoteVisibility.HOME,
-                )
-            else:
-                self.client.notes_create(
-                    text=content, visibility=misskey.enum.NoteVisibility.HOME
+            with time_phase("misskey", "publish"):
+                # ノートの作成は冪等ではないため、接続できなかった場合だけ再試行する
+                with_retry(
+                    "misskey",
+                    lambda: self.client.notes_create(
+                        text=content,
+                        file_ids=file_ids or None,
+                        visibility=misskey.enum.NoteVisibility.HOME,
+                    ),
+                    idempotent=False,
                 )
             return {"success": True, "response": "投稿成功"}
         except Exception as e:
             logger.error(f"Misskey投稿エラー: {str(e)}", exc_info=True)
-            return {"success": False, "error": str(e)}
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache=None):
+    """
+    アカウントの設定からMisskeyのクライアントとPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（api_token, instance_url）
+        media_cache: アップロード済みfile_idのキャッシュ（任意）
+    Returns:
+        MisskeyPoster
+    """
+    instance_url = config["instance_url"]
+    session = http_pool.session(instance_url, account=account)
+    session.hooks["response"] = [
+        rate_limiter.response_hook("misskey", account, paths=["/api/notes/create"])
+    ]
+    client = misskey.Misskey(instance_url, i=config["api_token"], session=session)
+    return MisskeyPoster(client, media_cache=media_cache)
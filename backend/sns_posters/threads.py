@@ -7,69 +7,230 @@ Attributes:
 """
 
 import logging
+import threading
+import time
+
+from constants import THREADS_SETTINGS
+from http_pool import api_base_url, http_pool
+from rate_limiter import rate_limiter
+from metrics import time_phase
+from retry import check_transient, is_transient, with_retry
+
+API_BASE_URL = f"{api_base_url('threads')}/v1.0"
+# アクセストークンが無効・期限切れの場合のエラーコード（OAuthException）
+AUTH_ERROR_CODE = 190
 
 logger = logging.getLogger(__name__)
 
+# アクセストークンごとのユーザーID（変わらないためプロセス内で使い回す）
+_user_ids = {}
+_user_ids_lock = threading.Lock()
+
+
+def _error_message(response):
+    """
+    Graph APIのエラーレスポンスからメッセージを取り出す。
+    """
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        error = {}
+    return error.get("message") or f"HTTP {response.status_code}"
+
+
+def _is_auth_error(response):
+    """
+    認証エラー（トークン無効・期限切れ）かどうかを判定する。
+    """
+    if response.status_code == 401:
+        return True
+    try:
+        return response.json().get("error", {}).get("code") == AUTH_ERROR_CODE
+    except ValueError:
+        return False
+
 
 class ThreadsPoster:
-    def __init__(self, access_token):
+    def __init__(self, access_token, session=None):
         """
         ThreadsPosterの初期化。
 
         Args:
             access_token: Threads API用アクセストークン
+            session: Graph APIに使うrequests.Session（省略時はホストの共有セッション）
         """
         self.access_token = access_token
+        self.session = session or http_pool.session(API_BASE_URL)
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+    def _request(self, method, url, idempotent=True, **kwargs):
+        """
+        Graph APIを呼び出す。一時的な障害（接続エラー・5xx）は再試行する。
+        コンテナの作成・状態確認は再送しても投稿が重複しない。
+        公開はサーバーに届いた後の失敗で再送すると二重に公開されるおそれがあるため、
+        idempotent=Falseを指定し、接続できなかった場合だけ再試行する。
+        """
+        return with_retry(
+            "threads",
+            lambda: check_transient(
+                self.session.request(method, url, headers=self._headers(), **kwargs)
+            ),
+            idempotent=idempotent,
+        )
 
-    def post(self, content, image_paths=None):
+    def get_user_id(self):
+        """
+        アクセストークンに対応するユーザーIDを返す。
+        初回のみ /me を呼び出し、以降はキャッシュを使う。
+
+        Returns:
+            (user_id, エラー文字列)
+        """
+        with _user_ids_lock:
+            user_id = _user_ids.get(self.access_token)
+        if user_id:
+            return user_id, None
+        response = self._request("GET", f"{API_BASE_URL}/me")
+        if not response.ok:
+            return None, f"Threadsユーザー取得エラー: {_error_message(response)}"
+        user_id = response.json().get("id")
+        with _user_ids_lock:
+            _user_ids[self.access_token] = user_id
+        return user_id, None
+
+    def invalidate_user_id(self):
+        """
+        キャッシュしたユーザーIDを破棄する（認証エラー時）。
+        """
+        with _user_ids_lock:
+            _user_ids.pop(self.access_token, None)
+
+    def wait_for_container(self, creation_id):
+        """
+        コンテナの準備が完了するまで、間隔を伸ばしながら状態を確認する。
+
+        Args:
+            creation_id: コンテナID
+        Returns:
+            エラー文字列（準備完了ならNone）
+        """
+        interval = THREADS_SETTINGS["poll_interval"]
+        deadline = time.monotonic() + THREADS_SETTINGS["poll_timeout"]
+        while True:
+            response = self._request(
+                "GET",
+                f"{API_BASE_URL}/{creation_id}",
+                params={"fields": "status,error_message"},
+            )
+            if not response.ok:
+                return f"Threadsコンテナ状態の取得エラー: {_error_message(response)}"
+            body = response.json()
+            status = body.get("status")
+            if status in ("FINISHED", None):
+                # statusが返らない場合は公開を試みる
+                return None
+            if status in ("ERROR", "EXPIRED"):
+                return f"Threadsコンテナエラー({status}): {body.get('error_message', '')}"
+            if time.monotonic() + interval > deadline:
+                return "Threadsコンテナの準備がタイムアウトしました"
+            time.sleep(interval)
+            interval = min(interval * 2, THREADS_SETTINGS["poll_max_interval"])
+
+    def is_published(self, creation_id):
+        """
+        コンテナが公開済みかどうかを確認する（公開APIの結果がわからない場合に使う）。
+        確認できなかった場合はFalseを返す。
+        """
+        try:
+            response = self._request(
+                "GET", f"{API_BASE_URL}/{creation_id}", params={"fields": "status"}
+            )
+        except Exception as e:
+            logger.warning(f"Threadsコンテナ状態の確認に失敗: {str(e)}")
+            return False
+        return response.ok and response.json().get("status") == "PUBLISHED"
+
+    def post(self, content, media=None):
         """
         Threadsへ投稿を行う。
+        コンテナを作成し、準備完了を確認してから公開する。
         画像投稿は未対応。
 
         Args:
             content: 投稿本文
-            image_paths: 画像ファイルパスのリスト（未使用）
+            media: 画像（Media）のリスト（未使用）
         Returns:
             dict: 投稿結果（success, response/error）
         """
-        import requests
-
-        if image_paths:
+        if media:
             return {"success": False, "error": "Threadsは画像投稿に未対応です"}
         try:
-            API_BASE_URL = "https://graph.threads.net/v1.0"
-            user_url = f"{API_BASE_URL}/me"
-            user_headers = {"Authorization": f"Bearer {self.access_token}"}
-            user_response = requests.get(user_url, headers=user_headers)
-            if user_response.ok:
-                user_id = user_response.json().get("id")
-                create_url = f"https://graph.threads.net/v1.0/{user_id}/threads"
-                create_data = {"text": content, "media_type": "TEXT"}
-                create_headers = {
-                    "Authorization": f"Bearer {self.access_token}",
-                    "Content-Type": "application/json",
-                }
-                response = requests.post(
-                    create_url, json=create_data, headers=create_headers
+            user_id, err = self.get_user_id()
+            if err:
+                return {"success": False, "error": err}
+            with time_phase("threads", "publish"):
+                response = self._request(
+                    "POST",
+                    f"{API_BASE_URL}/{user_id}/threads",
+                    json={"text": content, "media_type": "TEXT"},
                 )
-                if response.ok:
-                    creation_id = response.json().get("id")
-                    publish_url = (
-                        f"https://graph.threads.net/v1.0/{user_id}/threads_publish"
+                if not response.ok:
+                    if _is_auth_error(response):
+                        self.invalidate_user_id()
+                    return {
+                        "success": False,
+                        "error": f"Threads投稿APIエラー: {_error_message(response)}",
+                    }
+                creation_id = response.json().get("id")
+
+                err = self.wait_for_container(creation_id)
+                if err:
+                    return {"success": False, "error": err}
+
+                try:
+                    response = self._request(
+                        "POST",
+                        f"{API_BASE_URL}/{user_id}/threads_publish",
+                        json={"creation_id": creation_id},
+                        idempotent=False,
                     )
-                    data = {"creation_id": creation_id}
-                    headers = {
-                        "Authorization": f"Bearer {self.access_token}",
-                        "Content-Type": "application/json",
+                except Exception:
+                    # 公開されたかわからない失敗のため、コンテナの状態で確認する
+                    if self.is_published(creation_id):
+                        return {"success": True, "response": "投稿成功"}
+                    raise
+                if not response.ok or not response.json().get("id"):
+                    if _is_auth_error(response):
+                        self.invalidate_user_id()
+                    return {
+                        "success": False,
+                        "error": f"Threads公開APIエラー: {_error_message(response)}",
                     }
-                    requests.post(publish_url, json=data, headers=headers)
-                    return {"success": True, "response": "投稿成功"}
-                else:
-                    return {"success": False, "error": "Threads投稿APIエラー"}
+                return {"success": True, "response": "投稿成功"}
+        except Exception as e:
+            logger.error(f"Threads投稿エラー: {str(e)}", exc_info=True)
             return {
                 "success": False,
-                "error": "Threadsクライアントが設定されていません",
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
             }
-        except Exception as e:
-            logger.error(f"Threads投稿エラー: {str(e)}", exc_info=True)
-            return {"success": False, "error": str(e)}
+
+
+def create_poster(account, config, media_cache=None):
+    """
+    アカウントの設定からThreadsのPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（access_token）
+        media_cache: 未使用（画像投稿に未対応のため）
+    Returns:
+        ThreadsPoster
+    """
+    # Threadsは全APIの利用率ヘッダー（X-App-Usage）で制限状況が分かる
+    session = http_pool.session(API_BASE_URL, account=account)
+    session.hooks["response"] = [rate_limiter.response_hook("threads", account)]
+    return ThreadsPoster(config["access_token"], session=session)
@@ -0,0 +1,66 @@
+"""
+1つのSNSへの複数画像アップロードを並列に行う補助関数。
+結果の順序は入力（ユーザーが選んだ順）を保ち、どれか1つでも失敗した場合は
+未開始のアップロードを取り消し、新たにアップロードしたメディアを後始末する。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+
+def upload_in_parallel(upload_one, items, max_concurrency, cleanup=None):
+    """
+    itemsを最大max_concurrency並列でアップロードする。
+
+    Args:
+        upload_one: item -> (参照, エラー文字列, 新規作成かどうか) を返す関数
+        items: アップロード対象（画像など）のリスト
+        max_concurrency: 同時アップロード数の上限
+        cleanup: 失敗時に新規作成済みの参照を受け取って後始末する関数（任意）
+    Returns:
+        (参照リスト, None) or (None, エラー文字列)
+    Raises:
+        upload_oneが送出した例外（後始末を行った後に再送出する）
+    """
+    refs = [None] * len(items)
+    created = []
+    error = None
+    exception = None
+    workers = max(1, min(max_concurrency, len(items)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sns-upload") as ex:
+        upload = profiler.bind(upload_one)
+        futures = {ex.submit(upload, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                ref, err, is_new = future.result()
+            except Exception as e:
+                exception = exception or e
+            else:
+                if err:
+                    error = error or err
+                else:
+                    refs[futures[future]] = ref
+                    if is_new:
+                        created.append(ref)
+            if (exception or error) and not all(f.done() for f in futures):
+                # 未開始のアップロードは取り消す（実行中のものは完了を待つ）
+                for f in futures:
+                    f.cancel()
+
+    if exception or error:
+        if cleanup:
+            for ref in created:
+                try:
+                    cleanup(ref)
+                except Exception as e:
+                    logger.warning(f"アップロード済みメディアの後始末に失敗: {e}")
+        if exception:
+            raise exception
+        return None, error
+    return refs, None
@@ -6,77 +6,151 @@ Attributes:
     client: X APIクライアントインスタンス
 """
 
-import os
 import logging
-from constants import IMAGE_LIMITS
+from constants import API_BASE_URLS, IMAGE_LIMITS
+from sns_posters.upload_pool import upload_in_parallel
 
+import tweepy
 from requests_oauthlib import OAuth1
-import requests
+from http_pool import RebaseHTTPAdapter, api_base_url, http_pool
+from rate_limiter import rate_limiter
+from metrics import time_phase
+from retry import check_transient, is_transient, with_retry
+
+API_BASE_URL = api_base_url("x")
+UPLOAD_URL = f"{api_base_url('x_upload')}/1.1/media/upload.json"
 
 logger = logging.getLogger(__name__)
 
 
 class XPoster:
-    def __init__(self, client):
+    def __init__(self, client, credentials, media_cache=None, session=None):
         """
         XPosterの初期化。
 
         Args:
             client: X APIクライアント
+            credentials: (API Key, API Secret, Access Token, Access Token Secret)
+            media_cache: アップロード済みmedia_idのキャッシュ（任意）
+            session: media/uploadに使うrequests.Session（省略時はホストの共有セッション）
         """
         self.client = client
+        self.media_cache = media_cache
+        # OAuth1署名とセッションは投稿ごとに作り直さず使い回す
+        self.oauth = OAuth1(*credentials)
+        self.session = session or http_pool.session(UPLOAD_URL)
 
-    def upload_images(self, image_paths):
+    def upload_images(self, media):
         """
-        画像をXにアップロードする。
+        画像をXに並列でアップロードする。
+        失効前の同じ画像のmedia_idがキャッシュにあれば再利用する。
+        media_idは24時間で失効するため、失敗時の後始末は行わない。
 
         Args:
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）のリスト
         Returns:
             (media_idリスト, エラー文字列)
         """
-        media_ids = []
-        x_api_key = os.getenv("X_API_KEY")
-        x_api_secret = os.getenv("X_API_SECRET")
-        x_access_token = os.getenv("X_ACCESS_TOKEN")
-        x_access_token_secret = os.getenv("X_ACCESS_TOKEN_SECRET")
-        oauth = OAuth1(x_api_key, x_api_secret, x_access_token, x_access_token_secret)
-        upload_url = "https://upload.twitter.com/1.1/media/upload.json"
-        for image_path in image_paths:
-            with open(image_path, "rb") as f:
-                files = {"media": f}
-                resp = requests.post(upload_url, files=files, auth=oauth)
+
+        def upload_one(item):
+            media_id = self.media_cache and self.media_cache.get("x", item.digest)
+            if media_id:
+                return media_id, None, False
+            resp = with_retry(
+                "x",
+                lambda: check_transient(
+                    self.session.post(
+                        UPLOAD_URL,
+                        files={"media": (item.filename, item.open(), item.mime_type)},
+                        auth=self.oauth,
+                    )
+                ),
+            )
             if resp.status_code != 200:
-                return None, f"media/upload失敗: {resp.text}"
+                return None, f"media/upload失敗: {resp.text}", False
             media_id = resp.json().get("media_id_string")
-            media_ids.append(media_id)
-        return media_ids, None
+            if self.media_cache:
+                self.media_cache.put("x", item.digest, media_id)
+            return media_id, None, True
+
+        return upload_in_parallel(
+            upload_one, media, IMAGE_LIMITS["x"]["upload_concurrency"]
+        )
 
-    def post(self, content, image_paths):
+    def post(self, content, media):
         """
         Xへ投稿を行う。
 
         Args:
             content: 投稿本文
-            image_paths: 画像ファイルパスのリスト
+            media: 画像（Media）のリスト
         Returns:
             dict: 投稿結果（success, response/error）
         """
         try:
             media_ids = []
             err = None
-            if image_paths:
+            if media:
                 max_images = IMAGE_LIMITS["x"]["max_images"]
-                if len(image_paths) > max_images:
+                if len(media) > max_images:
                     return {"success": False, "error": f"画像は{max_images}枚までです"}
-                media_ids, err = self.upload_images(image_paths)
+                with time_phase("x", "upload"):
+                    media_ids, err = self.upload_images(media)
                 if err:
                     return {"success": False, "error": err}
-            if media_ids:
-                self.client.create_tweet(text=content, media_ids=media_ids)
-            else:
-                self.client.create_tweet(text=content)
+            with time_phase("x", "publish"):
+                # ポストの作成は冪等ではないため、接続できなかった場合だけ再試行する
+                with_retry(
+                    "x",
+                    lambda: self.client.create_tweet(
+                        text=content, media_ids=media_ids or None
+                    ),
+                    idempotent=False,
+                )
             return {"success": True, "response": "投稿成功"}
         except Exception as e:
             logger.error(f"X投稿エラー: {str(e)}", exc_info=True)
-            return {"success": False, "error": str(e)}
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "transient": is_transient(e),
+            }
+
+
+def create_poster(account, config, media_cache=None):
+    """
+    アカウントの設定からXのクライアントとPosterを生成する。
+
+    Args:
+        account: アカウント名
+        config: アカウントの設定（api_key, api_secret, access_token, access_token_secret）
+        media_cache: アップロード済みmedia_idのキャッシュ（任意）
+    Returns:
+        XPoster
+    """
+    credentials = (
+        config["api_key"],
+        config["api_secret"],
+        config["access_token"],
+        config["access_token_secret"],
+    )
+    client = tweepy.Client(
+        consumer_key=credentials[0],
+        consumer_secret=credentials[1],
+        access_token=credentials[2],
+        access_token_secret=credentials[3],
+    )
+    # tweepyの通信もアカウントごとのセッション（keep-alive・タイムアウト付き）で行う
+    client.session = http_pool.session(API_BASE_URL, account=account)
+    if API_BASE_URL != API_BASE_URLS["x"]:
+        # tweepyは接続先が固定のため、送信時に差し替える
+        client.session.mount(
+            API_BASE_URLS["x"],
+            RebaseHTTPAdapter(API_BASE_URLS["x"], API_BASE_URL, http_pool.timeout),
+        )
+    hook = rate_limiter.response_hook("x", account, paths=["/2/tweets"])
+    client.session.hooks["response"] = [hook]
+    upload_session = http_pool.session(UPLOAD_URL, account=account)
+    upload_session.hooks["response"] = [hook]
+    return XPoster(client, credentials, media_cache=media_cache, session=upload_session)
@@ -0,0 +1,66 @@
+import io
+
+from bulk_post import FORMAT_CSV, FORMAT_JSONL, iter_rows
+
+
+def rows(data, format=FORMAT_JSONL, max_row_bytes=None):
+    return list(iter_rows(io.BytesIO(data), format, max_row_bytes))
+
+
+def test_jsonl_rows_are_normalized_and_blank_lines_skipped():
+    data = (
+        b'{"id": "a", "posts": {"bluesky": "hello", "mastodon:brand-a": "hi"}, "media": ["d1"]}\n'
+        b"\n"
+        b'{"posts": {"x": "x only", "bluesky": ""}}\n'
+    )
+    assert rows(data) == [
+        (1, {"id": "a", "posts": {"bluesky": "hello", "mastodon:brand-a": "hi"}, "media": ["d1"]}, None),
+        (3, {"id": None, "posts": {"x": "x only"}, "media": []}, None),
+    ]
+
+
+def test_jsonl_reports_bad_rows_and_continues():
+    data = (
+        b"not json\n"
+        b'{"posts": {"unknown": "a"}}\n'
+        b'{"posts": {"x": null}}\n'
+        b'{"posts": {"x": 123}}\n'
+        b'{"posts": {"x": "ok"}}\n'
+    )
+    result = rows(data)
+    assert [number for number, _, _ in result] == [1, 2, 3, 4, 5]
+    assert all(row is None and error for _, row, error in result[:4])
+    assert "unknown" in result[1][2]
+    assert result[4] == (5, {"id": None, "posts": {"x": "ok"}, "media": []}, None)
+
+
+def test_line_over_limit_is_rejected_and_next_line_is_read():
+    data = b'{"posts": {"x": "' + b"a" * 100 + b'"}}\n{"posts": {"x": "ok"}}\n'
+    result = rows(data, max_row_bytes=50)
+    assert result[0][1] is None and "50" in result[0][2]
+    assert result[1] == (2, {"id": None, "posts": {"x": "ok"}, "media": []}, None)
+
+
+def test_invalid_utf8_is_reported_as_row_error():
+    result = rows(b'{"posts": {"x": "\xff"}}\n')
+    assert result == [(1, None, "UTF-8として読み込めません")]
+
+
+def test_csv_rows_use_header_and_skip_empty_cells():
+    data = "id,bluesky,x,media\nr1,こんにちは,,d1 d2\n".encode()
+    assert rows(data, FORMAT_CSV) == [
+        (2, {"id": "r1", "posts": {"bluesky": "こんにちは"}, "media": ["d1", "d2"]}, None),
+    ]
+
+
+def test_csv_with_bom_reads_first_header():
+    data = b"\xef\xbb\xbfbluesky,x\nhello,\n"
+    assert rows(data, FORMAT_CSV) == [
+        (2, {"id": None, "posts": {"bluesky": "hello"}, "media": []}, None),
+    ]
+
+
+def test_csv_row_with_extra_columns_is_rejected():
+    result = rows(b"bluesky\na,b\nc\n", FORMAT_CSV)
+    assert result[0] == (2, None, "列の数がヘッダーと一致しません")
+    assert result[1] == (3, {"id": None, "posts": {"bluesky": "c"}, "media": []}, None)
@@ -0,0 +1,67 @@
+from circuit_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitBreakers,
+    is_failure,
+)
+
+
+def test_is_failure_counts_outages_but_not_errors_from_a_responding_sns():
+    assert is_failure({"success": False, "timeout": True})
+    assert is_failure({"success": False, "transient": True})
+    assert not is_failure({"success": False, "error": "認証エラー"})
+    # 応答が遅すぎる投稿は成功でも障害として数える
+    assert is_failure({"success": True}, elapsed=60)
+    assert not is_failure({"success": True}, elapsed=1)
+
+
+def test_breaker_opens_after_consecutive_failures_and_rejects_until_open_seconds():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=30, half_open_probes=1)
+    for _ in range(2):
+        assert breaker.try_acquire(100.0) == 0
+        assert breaker.record(100.0, failed=True) is None
+    assert breaker.try_acquire(100.0) == 0
+    assert breaker.record(100.0, failed=True) == STATE_OPEN
+    assert breaker.try_acquire(110.0) == 20
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=30, half_open_probes=1)
+    breaker.record(100.0, failed=True)
+    breaker.record(100.0, failed=False)
+    assert breaker.record(100.0, failed=True) is None
+    assert breaker.state == STATE_CLOSED
+
+
+def test_half_open_lets_limited_probes_through_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=30, half_open_probes=1)
+    breaker.record(100.0, failed=True)
+    assert breaker.try_acquire(130.0) == 0
+    assert breaker.state == STATE_HALF_OPEN
+    # 試行中の投稿の結果が出るまで、次の投稿は通さない
+    assert breaker.try_acquire(130.0) == 30
+    assert breaker.record(131.0, failed=False) == STATE_CLOSED
+    assert breaker.try_acquire(131.0) == 0
+
+
+def test_half_open_reopens_on_failure_and_release_returns_probe():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=30, half_open_probes=1)
+    breaker.record(100.0, failed=True)
+    assert breaker.try_acquire(130.0) == 0
+    breaker.release()
+    assert breaker.try_acquire(130.0) == 0
+    assert breaker.record(131.0, failed=True) == STATE_OPEN
+    assert breaker.try_acquire(131.0) == 30
+
+
+def test_breakers_are_separated_by_key():
+    breakers = CircuitBreakers(
+        {"failure_threshold": 1, "slow_call_seconds": 30, "open_seconds": 30, "half_open_probes": 1}
+    )
+    assert breakers.allow("mastodon@a.example") == 0
+    breakers.record("mastodon@a.example", {"success": False, "transient": True})
+    assert breakers.allow("mastodon@a.example") > 0
+    assert breakers.snapshot("mastodon@a.example")["state"] == STATE_OPEN
+    assert breakers.allow("mastodon@b.example") == 0
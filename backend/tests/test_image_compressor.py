@@ -0,0 +1,37 @@
+import io
+import struct
+import zlib
+
+from PIL import Image
+
+from image_compressor import check_image
+
+
+def png_header(width, height):
+    """
+    IHDRの幅・高さだけを書き換えたPNG（画素データは1画素分）を返す。
+    """
+    buf = io.BytesIO()
+    Image.new("L", (1, 1)).save(buf, "PNG")
+    data = bytearray(buf.getvalue())
+    data[16:24] = struct.pack(">II", width, height)
+    data[29:33] = struct.pack(">I", zlib.crc32(bytes(data[12:29])))
+    return io.BytesIO(bytes(data))
+
+
+def test_check_image_rejects_image_over_limit():
+    message = check_image(png_header(8000, 6000))
+    assert message is not None and "8000x6000" in message
+
+
+def test_check_image_rejects_decompression_bomb():
+    # Pillowの既定の上限（約1.8億画素）を超える画像も、画素数の上限で拒否する
+    stream = png_header(20000, 20000)
+    message = check_image(stream)
+    assert message is not None and "20000x20000" in message
+    assert stream.tell() == 0
+
+
+def test_check_image_accepts_small_image_and_non_image():
+    assert check_image(png_header(100, 100)) is None
+    assert check_image(io.BytesIO(b"not an image")) is None
@@ -0,0 +1,79 @@
+import threading
+
+from rate_limiter import RateLimiter, TokenBucket
+
+
+def test_token_bucket_takes_tokens_and_refills_over_time():
+    bucket = TokenBucket(capacity=2, window=10)
+    bucket.updated = 1000.0
+    assert bucket.try_take(1000.0) == 0
+    assert bucket.try_take(1000.0) == 0
+    # 1トークンの回復には window / capacity = 5秒かかる
+    assert bucket.try_take(1000.0) == 5
+    assert bucket.try_take(1005.0) == 0
+
+
+def test_token_bucket_waits_until_reset_and_then_allows_one_post():
+    bucket = TokenBucket(capacity=10, window=60)
+    bucket.update(1000.0, remaining=0, reset_at=1030.0)
+    assert bucket.blocked_for(1000.0) == 30
+    assert bucket.try_take(1010.0) == 20
+    # リセット時刻を過ぎたら、回復の見込みにかかわらず少なくとも1回は送れる
+    assert bucket.try_take(1030.0) == 0
+    assert bucket.blocked_for(1030.0) == 0
+
+
+def test_token_bucket_adopts_stricter_limit_and_window():
+    bucket = TokenBucket(capacity=60, window=60)
+    bucket.update(bucket.updated, limit=10, window=3600)
+    assert bucket.capacity == 10
+    assert bucket.tokens == 10
+    assert bucket.rate == 10 / 3600
+
+
+def test_update_from_headers_converts_bluesky_points_to_posts():
+    limiter = RateLimiter({"bluesky": {"capacity": 100, "window": 60, "cost": 3}})
+    limiter.update_from_headers(
+        "bluesky",
+        {
+            "RateLimit-Limit": "5000",
+            "RateLimit-Remaining": "2999",
+            "RateLimit-Policy": "5000;w=3600",
+        },
+    )
+    bucket = limiter._bucket("bluesky", "default")
+    assert bucket.capacity == 1666
+    assert bucket.tokens == 999
+    assert bucket.window == 3600
+
+
+def test_update_from_headers_blocks_after_429_without_reset_header():
+    limiter = RateLimiter({"x": {"capacity": 10, "window": 60, "retry_after": 120}})
+    limiter.update_from_headers("x", {}, status_code=429)
+    bucket = limiter._bucket("x", "default")
+    assert 119 < bucket.blocked_for(bucket.updated) <= 120
+    assert limiter.throttled_since("x", "default", bucket.updated)
+
+
+def test_reserve_fails_fast_when_blocked_past_timeout():
+    limiter = RateLimiter({"x": {"capacity": 1, "window": 60}})
+    results = []
+    limiter.reserve("x", "a", results.append, timeout=1)
+    assert results == [True]
+
+    bucket = limiter._bucket("x", "a")
+    limiter.update("x", "a", remaining=0, reset_at=bucket.updated + 600)
+    done = threading.Event()
+    limiter.reserve("x", "a", lambda acquired: (results.append(acquired), done.set()), timeout=5)
+    # リセットまで600秒かかることが分かっているため、5秒待たずに失敗する
+    assert done.wait(1)
+    assert results == [True, False]
+    assert not bucket.waiters
+
+
+def test_refund_returns_unused_token():
+    limiter = RateLimiter({"x": {"capacity": 1, "window": 3600}})
+    assert limiter.acquire("x", "a", timeout=0)
+    assert not limiter.acquire("x", "a", timeout=0)
+    limiter.refund("x", "a")
+    assert limiter.acquire("x", "a", timeout=0)
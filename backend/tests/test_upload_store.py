@@ -0,0 +1,80 @@
+import io
+import os
+import time
+
+from werkzeug.datastructures import FileStorage
+
+from upload_store import TEMP_PREFIX, UploadStore
+
+
+def upload(data, filename="image.png"):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def test_same_content_is_stored_once_and_reference_counted(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=1024)
+    first = store.save(upload(b"a" * 100))
+    second = store.save(upload(b"a" * 100, filename="copy.png"))
+    assert first.digest == second.digest
+    assert os.listdir(tmp_path) == [f"{first.digest}.png"]
+    assert store.stats()["bytes"] == 100
+
+    store.release([first])
+    assert store.stats()["referenced"] == 1
+    store.release([second.path])
+    assert store.stats()["referenced"] == 0
+
+
+def test_evicts_least_recently_used_unreferenced_files(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=250)
+    a = store.save(upload(b"a" * 100))
+    b = store.save(upload(b"b" * 100))
+    store.release([a, b])
+    # aを使い直すと、bの方が古くなる
+    store.release([store.get(a.digest)])
+    c = store.save(upload(b"c" * 100))
+    assert store.get(b.digest) is None
+    assert store.get(a.digest) is not None
+    assert store.stats()["bytes"] == 200
+    store.release([c])
+
+
+def test_referenced_files_are_kept_over_the_limit(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=150)
+    a = store.save(upload(b"a" * 100))
+    b = store.save(upload(b"b" * 100))
+    assert store.stats() == {"files": 2, "bytes": 200, "max_bytes": 150, "referenced": 2}
+    # 参照がなくなった時点で上限まで削除する
+    store.release([a])
+    assert store.stats()["files"] == 1
+    assert store.get(a.digest) is None
+    store.release([b])
+
+
+def test_acquire_keeps_file_until_released(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=150)
+    a = store.save(upload(b"a" * 100))
+    store.acquire([a.path])
+    store.release([a])
+    store.release([store.save(upload(b"b" * 100))])
+    assert store.get(a.digest) is not None
+
+
+def test_unreferenced_files_are_removed_after_orphan_ttl(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=1024, orphan_ttl=0.01)
+    a = store.save(upload(b"a" * 10))
+    store.release([a])
+    time.sleep(0.02)
+    b = store.save(upload(b"b" * 10))
+    assert os.listdir(tmp_path) == [os.path.basename(b.path)]
+
+
+def test_restores_entries_and_removes_temp_files_on_start(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=1024)
+    a = store.save(upload(b"a" * 100))
+    (tmp_path / f"{TEMP_PREFIX}partial").write_bytes(b"x")
+
+    restored = UploadStore(str(tmp_path), max_bytes=1024)
+    assert restored.stats() == {"files": 1, "bytes": 100, "max_bytes": 1024, "referenced": 0}
+    assert restored.get(a.digest).digest == a.digest
+    assert not (tmp_path / f"{TEMP_PREFIX}partial").exists()
@@ -0,0 +1,229 @@
+"""
+アップロード画像の保存先。
+ファイル内容のハッシュ（SHA-256）をファイル名にして保存するため、
+同じ画像は1度だけ保存され、同時にアップロードされても衝突しない。
+合計サイズの上限を超えた場合は、投稿から参照されていないファイルを
+最後に使われた順が古いものから削除する（LRU）。
+保存時に読み込んだ内容はそのままMediaとして返し、投稿処理でファイルを読み直さない。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import secure_filename
+
+from constants import UPLOAD_STORE_SETTINGS
+from media import Media, memory_threshold
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TEMP_PREFIX = ".upload-"
+
+
+class UploadStore:
+    def __init__(self, root, max_bytes=None, orphan_ttl=None):
+        """
+        UploadStoreの初期化。既存のファイルを読み込み、LRUの順序を復元する。
+
+        Args:
+            root: 保存先ディレクトリ
+            max_bytes: 保存するファイルの合計サイズ上限（バイト）
+            orphan_ttl: 参照されていないファイルを残しておく秒数
+        """
+        self.root = root
+        self.max_bytes = max_bytes or UPLOAD_STORE_SETTINGS["max_bytes"]
+        self.orphan_ttl = orphan_ttl or UPLOAD_STORE_SETTINGS["orphan_ttl"]
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        # digest -> (ファイル名, サイズ, 最終利用時刻)。先頭ほど古い
+        self._entries = OrderedDict()
+        self._refs = {}
+        self._total = 0
+        self._load()
+
+    def _load(self):
+        """
+        保存先ディレクトリを走査して管理情報を復元する。
+        書き込み途中で残った一時ファイルは削除する。
+        """
+        files = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(TEMP_PREFIX):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(files):
+            digest = os.path.splitext(name)[0]
+            self._entries[digest] = (name, size, mtime)
+            self._total += size
+
+    def save(self, file):
+        """
+        アップロードされたファイルを保存し、参照カウントを1つ増やす。
+        使い終わったらrelease()で参照を解放すること。
+        上限以下のファイルは読み込んだ内容をメモリに残し、
+        それを超えるファイルは保存したファイルをmmapで参照するMediaを返す。
+
+        Args:
+            file: werkzeugのFileStorage
+        Returns:
+            Media（pathは保存先のファイルパス）
+        """
+        ext = os.path.splitext(secure_filename(file.filename or ""))[1].lower()
+        hasher = hashlib.sha256()
+        size = 0
+        threshold = memory_threshold()
+        chunks = []
+        fd, tmp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = file.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                    if size <= threshold:
+                        chunks.append(chunk)
+                    else:
+                        chunks = None
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        digest = hasher.hexdigest()
+        now = time.time()
+        with self._lock:
+            if digest in self._entries:
+                # 同じ内容のファイルが既にあるので一時ファイルは不要
+                os.remove(tmp_path)
+                name, size, _ = self._entries.pop(digest)
+                os.utime(os.path.join(self.root, name), (now, now))
+            else:
+                name = f"{digest}{ext}"
+                os.replace(tmp_path, os.path.join(self.root, name))
+                self._total += size
+            self._entries[digest] = (name, size, now)
+            self._refs[digest] = self._refs.get(digest, 0) + 1
+            self._evict()
+            self._cleanup_orphans(now)
+        path = os.path.join(self.root, name)
+        if chunks is None:
+            return Media.load(path, digest=digest)
+        return Media(b"".join(chunks), digest, path=path, filename=name)
+
+    def get(self, digest):
+        """
+        保存済みの画像をハッシュで取り出し、参照カウントを1つ増やす。
+        使い終わったらrelease()で参照を解放すること。
+
+        Args:
+            digest: save()で返したMediaのdigest（SHA-256）
+        Returns:
+            Media、保存されていない場合はNone
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if entry is None:
+                return None
+            name, size, _ = entry
+            self._entries[digest] = (name, size, now)
+            self._refs[digest] = self._refs.get(digest, 0) + 1
+        path = os.path.join(self.root, name)
+        try:
+            return Media.load(path, digest=digest)
+        except OSError:
+            self.release([path])
+            return None
+
+    def acquire(self, paths):
+        """
+        保存済みファイルへの参照を追加する（削除されないようにする）。
+
+        Args:
+            paths: ファイルパスまたはMediaのリスト
+        """
+        with self._lock:
+            for path in paths or []:
+                digest = self._digest(path)
+                if digest in self._entries:
+                    self._refs[digest] = self._refs.get(digest, 0) + 1
+
+    def release(self, paths):
+        """
+        ファイルへの参照を解放する。参照がなくなったファイルは削除対象になる。
+
+        Args:
+            paths: ファイルパスまたはMediaのリスト
+        """
+        with self._lock:
+            for path in paths or []:
+                digest = self._digest(path)
+                count = self._refs.get(digest, 0) - 1
+                if count > 0:
+                    self._refs[digest] = count
+                else:
+                    self._refs.pop(digest, None)
+            self._evict()
+
+    def _digest(self, path):
+        if isinstance(path, Media):
+            return path.digest
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _remove(self, digest):
+        """
+        ファイルを削除し管理情報から外す（ロック取得済みで呼ぶこと）。
+        """
+        name, size, _ = self._entries.pop(digest)
+        self._total -= size
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """
+        合計サイズが上限を超えている間、参照されていない古いファイルから削除する。
+        """
+        if self._total <= self.max_bytes:
+            return
+        for digest in list(self._entries):
+            if self._total <= self.max_bytes:
+                break
+            if digest not in self._refs:
+                logger.info(f"アップロード画像を削除しました（容量上限）: {digest}")
+                self._remove(digest)
+
+    def _cleanup_orphans(self, now):
+        """
+        参照されないまま保持期間を過ぎたファイルを削除する。
+        """
+        for digest, (_, _, last_used) in list(self._entries.items()):
+            if now - last_used < self.orphan_ttl:
+                break
+            if digest not in self._refs:
+                self._remove(digest)
+
+    def stats(self):
+        """
+        保存状況を返す。
+        """
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "referenced": len(self._refs),
+            }
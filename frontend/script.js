@@ -127,11 +127,32 @@ async function initApp() {
 
         // 初期状態は一括投稿モード
         switchMode('unified');
+
+        // 初期化中のクライアントがあれば状態を取得し直す
+        schedulePlatformRefresh();
     } catch (error) {
         showError('アプリの初期化中にエラーが発生しました: ' + error.message);
     }
 }
 
+// 初期化中（pending）または再試行待ち（failed）のプラットフォームがある間、定期的に状態を更新
+function schedulePlatformRefresh() {
+    const notReady = Object.values(platforms).some(
+        info => info.state === 'pending' || info.state === 'failed'
+    );
+    if (!notReady) return;
+    setTimeout(async () => {
+        try {
+            platforms = await fetchPlatforms();
+            renderPlatformSelectors();
+            updateUnifiedCharLimit();
+        } catch (error) {
+            console.error(error);
+        }
+        schedulePlatformRefresh();
+    }, 2000);
+}
+
 // プラットフォーム情報を取得
 async function fetchPlatforms() {
     const response = await fetch(API_URL.PLATFORMS);
@@ -153,6 +174,14 @@ async function fetchCharacterLimits() {
 // プラットフォーム選択UIの生成
 function renderPlatformSelectors() {
     const container = document.getElementById('platforms-container');
+    // 再描画時は選択状態を引き継ぐ（新たに有効になったものはデフォルトでON）
+    const previousCards = Array.from(container.querySelectorAll('.platform-card'));
+    const previousSelection = {};
+    previousCards.forEach(card => {
+        if (card.classList.contains('enabled')) {
+            previousSelection[card.dataset.platform] = card.classList.contains('selected');
+        }
+    });
     container.innerHTML = '';
 
     Object.keys(platforms).forEach(platform => {
@@ -164,7 +193,9 @@ function renderPlatformSelectors() {
         if (platformInfo.enabled) {
             card.addEventListener('click', () => togglePlatformSelection(card));
             // デフォルトでON（選択状態）にする
-            card.classList.add('selected');
+            if (previousSelection[platform] !== false) {
+                card.classList.add('selected');
+            }
         }
 
         // プラットフォーム名（先頭を大文字に）
@@ -172,7 +203,7 @@ function renderPlatformSelectors() {
 
         card.innerHTML = `
             <div class="platform-name">${displayName}</div>
-            <div class="platform-status">${platformInfo.enabled ? '連携済み' : '未連携'}</div>
+            <div class="platform-status">${platformStatusLabel(platformInfo)}</div>
             <div class="platform-limit">最大 ${platformInfo.limit} 文字</div>
         `;
 
@@ -185,6 +216,14 @@ function renderPlatformSelectors() {
     }
 }
 
+// プラットフォームの状態表示
+function platformStatusLabel(platformInfo) {
+    if (platformInfo.enabled) return '連携済み';
+    if (platformInfo.state === 'pending') return '接続中...';
+    if (platformInfo.state === 'failed') return '接続失敗（再試行中）';
+    return '未連携';
+}
+
 // プラットフォーム選択の切り替え
 function togglePlatformSelection(card) {
     // 無効化されたプラットフォームは選択不可
@@ -357,60 +396,73 @@ async function handlePost() {
             });
         }
 
-        // SNSごとにリクエストを作成
-        const fetchPromises = selectedPlatforms.map(platform => {
-            // 画像が選択されている場合はmultipart/form-dataで送信
-            if (selectedImageFiles.length > 0) {
-                const formData = new FormData();
-                selectedImageFiles.forEach((file, idx) => {
-                    formData.append('image' + (idx + 1), file);
-                });
-                // SNSごとにpostDataを分けて送信
-                const singlePostData = {};
-                singlePostData[platform] = {
-                    selected: true,
-                    content: postDataPerPlatform[platform]
-                };
-                formData.append('postData', JSON.stringify(singlePostData));
-                return fetch(API_URL.POST, {
-                    method: 'POST',
-                    body: formData
-                }).then(async response => {
-                    const result = await response.json();
-                    return { platform, success: response.ok, ...result };
-                }).catch(e => ({ platform, success: false, error: e.message }));
-            } else {
-                // 画像なしの場合はJSONで送信
-                const singlePostData = {};
-                singlePostData[platform] = {
-                    selected: true,
-                    content: postDataPerPlatform[platform ]
-                };
-                return fetch(API_URL.POST, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify(singlePostData)
-                }).then(async response => {
-                    const result = await response.json();
-                    return { platform, success: response.ok, ...result };
-                }).catch(e => ({ platform, success: false, error: e.message }));
-            }
+        // 全SNS分の投稿内容を1つのリクエストにまとめる
+        const postData = {};
+        selectedPlatforms.forEach(platform => {
+            postData[platform] = {
+                selected: true,
+                content: postDataPerPlatform[platform]
+            };
         });
 
-        // 並行リクエストを待つ
-        const results = await Promise.all(fetchPromises);
-        // 結果をまとめる
+        let requestInit;
+        if (selectedImageFiles.length > 0) {
+            // 画像が選択されている場合はmultipart/form-dataで1度だけ送信
+            const formData = new FormData();
+            selectedImageFiles.forEach((file, idx) => {
+                formData.append('image' + (idx + 1), file);
+            });
+            formData.append('postData', JSON.stringify(postData));
+            requestInit = {
+                method: 'POST',
+                headers: { 'Accept': 'application/x-ndjson' },
+                body: formData
+            };
+        } else {
+            // 画像なしの場合はJSONで送信
+            requestInit = {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson'
+                },
+                body: JSON.stringify(postData)
+            };
+        }
+
+        const response = await fetch(API_URL.POST, requestInit);
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !contentType.includes('application/x-ndjson')) {
+            const result = await response.json();
+            throw new Error(result.error || `投稿に失敗しました: ${response.status}`);
+        }
+
+        // 完了したSNSから順に結果を受け取る
         const resultSummary = {
-            success: results.every(r => r.success),
+            success: true,
             results: {}
         };
-        results.forEach(r => {
-            resultSummary.results[r.platform] = {
-                success: r.success,
-                error: r.error || r.message || null
+        await readNdjsonStream(response, line => {
+            if (line.done) {
+                resultSummary.success = line.success;
+                return;
+            }
+            const displayName = line.platform.charAt(0).toUpperCase() + line.platform.slice(1);
+            resultSummary.results[line.platform] = {
+                success: line.success,
+                error: line.error || line.message || null
             };
+            if (line.success) {
+                showToast(`${displayName}: 投稿完了`, 'success', 3000);
+            } else {
+                showToast(`${displayName}: 失敗 (${line.error || 'エラー'})`, 'error', 4000);
+            }
+        });
+        selectedPlatforms.forEach(platform => {
+            if (!resultSummary.results[platform]) {
+                resultSummary.success = false;
+                resultSummary.results[platform] = { success: false, error: '結果が返されませんでした' };
+            }
         });
         showPostResult(resultSummary);
     } catch (error) {
@@ -422,6 +474,30 @@ async function handlePost() {
     }
 }
 
+// NDJSONレスポンスを1行ずつ読み取り、行ごとにコールバックを呼ぶ
+async function readNdjsonStream(response, onLine) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (value) {
+            buffer += decoder.decode(value, { stream: true });
+        }
+        if (done) {
+            buffer += decoder.decode();
+        }
+        let newlineIndex;
+        while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newlineIndex).trim();
+            buffer = buffer.slice(newlineIndex + 1);
+            if (line) onLine(JSON.parse(line));
+        }
+        if (done) break;
+    }
+    if (buffer.trim()) onLine(JSON.parse(buffer));
+}
+
 // トースト通知表示
 function showToast(message, type = 'success', duration = 4000) {
     const toastContainer = document.getElementById('toast-container');